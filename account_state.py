@@ -0,0 +1,80 @@
+"""
+账户状态模型：把 info.user_state() 返回的 JSON 一次性解析成数值字段。
+
+Position / AccountSnapshot 使用 __slots__，每个仓位只解析一次字符串，
+之后按币种 O(1) 查找，各策略脚本不再重复线性扫描 assetPositions 和 float()/int() 转换。
+"""
+
+
+def _float_or_none(value):
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+class Position:
+    """单个永续仓位，szi 为带符号数量，size 为绝对值"""
+
+    __slots__ = (
+        "coin", "szi", "size", "is_long", "leverage", "leverage_type",
+        "entry_px", "liquidation_px", "position_value", "unrealized_pnl",
+        "return_on_equity", "margin_used", "funding_since_open", "raw",
+    )
+
+    def __init__(self, raw):
+        leverage = raw.get("leverage") or {}
+        cum_funding = raw.get("cumFunding") or {}
+        self.coin = raw.get("coin")
+        self.szi = float(raw.get("szi") or 0)
+        self.size = abs(self.szi)
+        self.is_long = self.szi > 0
+        self.leverage = int(leverage.get("value", 1))
+        self.leverage_type = leverage.get("type")
+        self.entry_px = float(raw.get("entryPx") or raw.get("avgEntryPrice") or raw.get("entryPrice") or 0)
+        self.liquidation_px = _float_or_none(raw.get("liquidationPx"))
+        self.position_value = _float_or_none(raw.get("positionValue"))
+        self.unrealized_pnl = _float_or_none(raw.get("unrealizedPnl"))
+        self.return_on_equity = _float_or_none(raw.get("returnOnEquity"))
+        self.margin_used = _float_or_none(raw.get("marginUsed"))
+        self.funding_since_open = _float_or_none(cum_funding.get("sinceOpen"))
+        self.raw = raw
+
+    def __repr__(self):
+        return f"Position({self.coin} szi={self.szi} lev={self.leverage}x entry={self.entry_px})"
+
+
+class AccountSnapshot:
+    """一次 user_state 的解析结果，按币种索引非零仓位"""
+
+    __slots__ = ("positions", "account_value", "total_margin_used", "withdrawable", "raw")
+
+    def __init__(self, user_state):
+        margin_summary = user_state.get("marginSummary") or {}
+        self.account_value = float(margin_summary.get("accountValue") or 0)
+        self.total_margin_used = float(margin_summary.get("totalMarginUsed") or 0)
+        self.withdrawable = float(user_state.get("withdrawable") or 0)
+        self.positions = {}
+        for item in user_state.get("assetPositions", []):
+            raw = item.get("position")
+            if not raw or not raw.get("coin"):
+                continue
+            position = Position(raw)
+            if position.szi != 0:
+                self.positions[position.coin] = position
+        self.raw = user_state
+
+    @classmethod
+    def fetch(cls, info, address):
+        return cls(info.user_state(address))
+
+    def get(self, coin):
+        return self.positions.get(coin)
+
+    def __contains__(self, coin):
+        return coin in self.positions
+
+    def __iter__(self):
+        return iter(self.positions.values())
+
+    def __len__(self):
+        return len(self.positions)
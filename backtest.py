@@ -0,0 +1,371 @@
+"""
+follow_bot_v5 策略的离线回测。
+
+读取本地K线文件（candles_snapshot 的 JSON 或 t,o,h,l,c,v 的 CSV），按 v5 的决策顺序模拟：
+EMA 顺势随机入场 -> 清算/风控平仓 -> EMA 反向平仓 -> 动态止盈 -> 动态止损。
+策略参数取自 follow_bot_v5 / ema，入场、风控、止盈止损的阈值直接调用 follow_bot_v5 中
+实盘使用的同一组函数（标量/数组通用），指标（EMA、波动率）和逐根K线的 ROE、安全边际、
+止盈止损阈值都用 NumPy 整段向量化计算，只在开平仓事件之间做分块扫描，
+一年的 1m K线、多个币种可在数秒内跑完。输出资金曲线和交易明细。
+
+用法:
+    python backtest.py download --coins ETH SOL --interval 1m --days 30
+    python backtest.py run --coins ETH SOL --interval 1m --signal-interval 15m
+"""
+import os
+import csv
+import json
+import time
+import argparse
+
+import numpy as np
+
+import ema
+import execution
+import follow_bot_v5 as v5
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "candles")
+OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "backtest_results")
+
+MAX_LEVERAGE = 20                    # 离线没有元数据时的默认杠杆上限
+SCAN_CHUNK = 256                     # 事件扫描的初始分块大小，每次翻倍
+
+REASONS = ("清算", "风控平仓", "EMA反向平仓", "盈利止盈", "止损")
+
+
+# =========================
+# === K线读取与下载 ===
+# =========================
+def candle_path(data_dir, coin, interval, ext):
+    return os.path.join(data_dir, f"{coin}_{interval}.{ext}")
+
+
+def load_candles(data_dir, coin, interval):
+    """返回按时间排序的 (t, o, h, l, c) 数组，t 为开盘时间毫秒"""
+    json_path = candle_path(data_dir, coin, interval, "json")
+    csv_path = candle_path(data_dir, coin, interval, "csv")
+    if os.path.exists(json_path):
+        with open(json_path) as f:
+            candles = json.load(f)
+        data = np.array([[c["t"], c["o"], c["h"], c["l"], c["c"]] for c in candles], dtype=np.float64)
+    elif os.path.exists(csv_path):
+        data = np.loadtxt(csv_path, delimiter=",", skiprows=1, usecols=(0, 1, 2, 3, 4), ndmin=2)
+    else:
+        raise FileNotFoundError(f"没有找到 {coin} {interval} 的K线文件: {json_path} / {csv_path}")
+    data = data[np.argsort(data[:, 0], kind="stable")]
+    keep = np.r_[True, np.diff(data[:, 0]) > 0]   # 去掉重复的开盘时间
+    data = data[keep]
+    return data[:, 0].astype(np.int64), data[:, 1], data[:, 2], data[:, 3], data[:, 4]
+
+
+def download_candles(info, coin, interval, start_ms, end_ms, page=5000):
+    """按页调用 candles_snapshot 拉取 [start_ms, end_ms) 的K线"""
+    step = ema.INTERVAL_SECONDS[interval] * 1000
+    candles = {}
+    cursor = start_ms
+    while cursor < end_ms:
+        page_end = min(cursor + page * step, end_ms)
+        batch = info.candles_snapshot(coin, interval, cursor, page_end)
+        for candle in batch or []:
+            candles[candle["t"]] = candle
+        cursor = page_end
+    return [candles[t] for t in sorted(candles)]
+
+
+# =========================
+# === 向量化指标 ===
+# =========================
+def ema_series(values, period):
+    """与 ema._ema_step 相同的递推：首个值作为初值"""
+    out = np.empty_like(values)
+    if len(values) == 0:
+        return out
+    k = 2 / (period + 1)
+    prev = values[0]
+    for i, value in enumerate(values):
+        prev = prev + k * (value - prev)
+        out[i] = prev
+    return out
+
+
+def signal_bars(t, close, signal_interval):
+    """把执行周期K线聚合成信号周期K线，返回每根执行K线所属的信号K线下标和各信号K线收盘价"""
+    bucket = t // (ema.INTERVAL_SECONDS[signal_interval] * 1000)
+    starts = np.flatnonzero(np.r_[True, np.diff(bucket) != 0])
+    ends = np.r_[starts[1:] - 1, len(t) - 1]
+    owner = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(t)]))
+    return owner, close[ends]
+
+
+def closed_bar_volatility(signal_close, window=ema.VOLATILITY_WINDOW):
+    """vol[j] = 前 j 根已收盘信号K线的波动率，与 CandleSeries.volatility 一致"""
+    m = len(signal_close)
+    prev = signal_close[:-1]
+    returns = np.zeros(max(m - 1, 0))
+    nonzero = prev != 0
+    returns[nonzero] = signal_close[1:][nonzero] / prev[nonzero] - 1
+    cs = np.r_[0.0, np.cumsum(returns)]
+    cs2 = np.r_[0.0, np.cumsum(returns * returns)]
+    j = np.arange(m + 1)
+    hi = np.clip(j - 1, 0, None)                 # 前 j 根收盘K线对应 j-1 个收益率
+    lo = np.clip(hi - window, 0, None)
+    n = hi - lo
+    safe_n = np.maximum(n, 1)
+    mean = (cs[hi] - cs[lo]) / safe_n
+    var = (cs2[hi] - cs2[lo]) / safe_n - mean * mean
+    return np.where(n >= 2, np.sqrt(np.clip(var, 0.0, None)), 0.0)
+
+
+def compute_signals(t, close, signal_interval):
+    """逐根执行K线的 EMA 趋势 (+1/-1/0) 和波动率，只使用当时已知的数据"""
+    owner, signal_close = signal_bars(t, close, signal_interval)
+    fast_closed = ema_series(signal_close, ema.EMA_FAST)
+    slow_closed = ema_series(signal_close, ema.EMA_SLOW)
+    prev = owner - 1                              # 当前信号K线未收盘，只用之前已收盘的
+    valid = owner >= ema.EMA_SLOW
+    prev_idx = np.clip(prev, 0, None)
+    # CandleSeries.trend(): 用当前价再推一步 EMA
+    fast = fast_closed[prev_idx] + 2 / (ema.EMA_FAST + 1) * (close - fast_closed[prev_idx])
+    slow = slow_closed[prev_idx] + 2 / (ema.EMA_SLOW + 1) * (close - slow_closed[prev_idx])
+    trend = np.zeros(len(t), dtype=np.int8)
+    trend[valid & (close > fast) & (fast > slow)] = 1
+    trend[valid & (close < fast) & (fast < slow)] = -1
+    volatility = closed_bar_volatility(signal_close)[owner]
+    return trend, volatility
+
+
+def rolling_mean(values, window):
+    cs = np.r_[0.0, np.cumsum(values)]
+    idx = np.arange(1, len(values) + 1)
+    lo = np.clip(idx - window, 0, None)
+    return (cs[idx] - cs[lo]) / (idx - lo)
+
+
+# =========================
+# === 回测引擎 ===
+# =========================
+class CoinBacktest:
+    """单个币种的逐事件模拟，开平仓之间的逐根判断整块向量化"""
+
+    def __init__(self, coin, t, o, h, l, c, signal_interval, rng, sz_decimals=None, max_leverage=MAX_LEVERAGE):
+        self.coin = coin
+        self.t, self.high, self.low, self.close = t, h, l, c
+        self.trend, volatility = compute_signals(t, c, signal_interval)
+        # should_stop_loss 用每个币种最近 VOL_HISTORY_SIZE 次采样的平均波动率，这里按逐根K线近似
+        self.smooth_vol = rolling_mean(volatility, v5.VOL_HISTORY_SIZE)
+        self.entry_roll = rng.random(len(t)) < v5.ENTRY_PROBABILITY
+        self.profit_multiple = v5.BASE_MULTIPLE + rng.random(len(t)) * v5.RANDOM_MULTIPLE
+        self.pause = v5.BASE_SLEEP_SECONDS + rng.random(len(t)) * v5.RANDOM_SLEEP_MAX
+        self.rng = rng
+        self.sz_decimals = sz_decimals
+        self.leverages = v5.allowed_leverages(max_leverage)
+        self.trades = []
+
+    def run(self):
+        n = len(self.t)
+        i = 0
+        allowed_ms = 0
+        while i < n:
+            entry = self._next_entry(i, allowed_ms)
+            if entry is None:
+                break
+            trade = self._open(entry)
+            if trade is None:
+                i = entry + 1
+                continue
+            exit_idx, reason = self._next_exit(trade)
+            self._close(trade, exit_idx, reason)
+            cooldown = v5.RISK_COOLDOWN_MINUTES * 60 if reason in ("清算", "风控平仓") else v5.PROFIT_CLOSE_COOLDOWN
+            allowed_ms = self.t[exit_idx] + int(max(cooldown, self.pause[exit_idx]) * 1000)
+            i = exit_idx + 1
+        return self.trades
+
+    def _scan(self, start, func):
+        """从 start 开始按块调用 func(lo, hi)，返回第一个命中的下标"""
+        n = len(self.t)
+        lo, chunk = start, SCAN_CHUNK
+        while lo < n:
+            hi = min(lo + chunk, n)
+            hit = func(lo, hi)
+            if hit is not None:
+                return hit
+            lo, chunk = hi, chunk * 2
+        return None
+
+    def _next_entry(self, start, allowed_ms):
+        def check(lo, hi):
+            ok = (self.t[lo:hi] >= allowed_ms) & (self.trend[lo:hi] != 0) & self.entry_roll[lo:hi]
+            idx = np.flatnonzero(ok)
+            return lo + idx[0] if len(idx) else None
+        return self._scan(start, check)
+
+    def _open(self, i):
+        price = self.close[i]
+        sz = v5.entry_size(price, self.sz_decimals)
+        if sz * price < v5.MIN_ORDER_USD:
+            return None
+        direction = int(self.trend[i])
+        lev = int(self.rng.choice(self.leverages))
+        liq = v5.estimated_liquidation_px(price, direction, lev)
+        return {"coin": self.coin, "entry_idx": i, "entry_time": int(self.t[i]), "direction": direction,
+                "size": sz, "leverage": lev, "entry_px": price, "liquidation_px": liq}
+
+    def _next_exit(self, trade):
+        entry_px, direction, lev, liq = trade["entry_px"], trade["direction"], trade["leverage"], trade["liquidation_px"]
+        carry = {"loss": False}
+
+        def check(lo, hi):
+            c = self.close[lo:hi]
+            # 清算：K线内触及估算清算价
+            liquidated = self.low[lo:hi] <= liq if direction > 0 else self.high[lo:hi] >= liq
+            # execute_risk_management: 安全边际过低时紧急平仓
+            risk = v5.is_auto_close(v5.liquidation_distance(c, liq, direction))
+            reverse = v5.is_trend_reversed(direction, self.trend[lo:hi])
+            # 盈利止盈：returnOnEquity(含杠杆) - 资金费 >= 随机倍数 * 总费用
+            price_return = v5.position_return(entry_px, c, direction)
+            hours = (self.t[lo:hi] - trade["entry_time"]) / 3_600_000
+            holding_fee = v5.estimated_holding_fee(hours, lev)
+            net_profit = price_return * lev - holding_fee
+            take_profit = net_profit >= v5.take_profit_threshold(self.profit_multiple[lo:hi], holding_fee)
+            # should_stop_loss：连续两次低于动态阈值且平滑波动率偏高
+            smooth = self.smooth_vol[lo:hi]
+            loss = price_return <= v5.dynamic_stop_loss(lev, smooth)
+            prev_loss = np.r_[carry["loss"], loss[:-1]]
+            stop = loss & prev_loss & v5.stop_loss_confirmed(smooth)
+            carry["loss"] = bool(loss[-1])
+
+            masks = (liquidated, risk, reverse, take_profit, stop)
+            hit = np.flatnonzero(np.logical_or.reduce(masks))
+            if not len(hit):
+                return None
+            k = hit[0]
+            reason = next(name for name, mask in zip(REASONS, masks) if mask[k])
+            return lo + k, reason
+
+        result = self._scan(trade["entry_idx"] + 1, check)
+        return result if result is not None else (len(self.t) - 1, "回测结束")
+
+    def _close(self, trade, i, reason):
+        exit_px = trade["liquidation_px"] if reason == "清算" else self.close[i]
+        gross = (exit_px - trade["entry_px"]) * trade["size"] * trade["direction"]
+        fees = (trade["entry_px"] + exit_px) * trade["size"] * execution.TAKER_FEE_RATE
+        hours = (self.t[i] - trade["entry_time"]) / 3_600_000
+        funding = v5.FUNDING_RATE_BASE * hours * trade["entry_px"] * trade["size"]
+        pnl = -trade["entry_px"] * trade["size"] / trade["leverage"] if reason == "清算" else gross - fees - funding
+        trade.update({"exit_idx": i, "exit_time": int(self.t[i]), "exit_px": exit_px, "reason": reason,
+                      "fees": fees, "funding": funding, "pnl": pnl})
+        self.trades.append(trade)
+
+    def mark_to_market(self):
+        """逐根K线的已实现 + 未实现盈亏"""
+        n = len(self.t)
+        realized = np.zeros(n)
+        unrealized = np.zeros(n)
+        for trade in self.trades:
+            s, e = trade["entry_idx"], trade["exit_idx"]
+            unrealized[s:e] = (self.close[s:e] - trade["entry_px"]) * trade["size"] * trade["direction"]
+            realized[e] += trade["pnl"]
+        return np.cumsum(realized) + unrealized
+
+
+def combine_equity(results, capital):
+    """把各币种的盈亏按时间对齐(前向填充)后相加"""
+    times = np.unique(np.concatenate([bt.t for bt in results]))
+    total = np.full(len(times), float(capital))
+    for bt in results:
+        pnl = bt.mark_to_market()
+        idx = np.searchsorted(bt.t, times, side="right") - 1
+        total += np.where(idx >= 0, pnl[np.clip(idx, 0, None)], 0.0)
+    return times, total
+
+
+def summarize(trades, times, equity, capital):
+    pnls = np.array([trade["pnl"] for trade in trades]) if trades else np.zeros(0)
+    peak = np.maximum.accumulate(equity)
+    reasons = {}
+    for trade in trades:
+        reasons[trade["reason"]] = reasons.get(trade["reason"], 0) + 1
+    return {
+        "trades": len(trades),
+        "win_rate": float((pnls > 0).mean()) if len(pnls) else 0.0,
+        "total_pnl": float(pnls.sum()),
+        "final_equity": float(equity[-1]) if len(equity) else capital,
+        "max_drawdown": float(((peak - equity) / peak).max()) if len(equity) else 0.0,
+        "exit_reasons": reasons,
+        "start": time.strftime("%Y-%m-%d %H:%M", time.localtime(times[0] / 1000)) if len(times) else None,
+        "end": time.strftime("%Y-%m-%d %H:%M", time.localtime(times[-1] / 1000)) if len(times) else None,
+    }
+
+
+def write_outputs(out_dir, trades, times, equity, summary):
+    os.makedirs(out_dir, exist_ok=True)
+    fields = ["coin", "entry_time", "exit_time", "direction", "size", "leverage", "entry_px", "exit_px",
+              "liquidation_px", "reason", "fees", "funding", "pnl"]
+    with open(os.path.join(out_dir, "trades.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(trades)
+    np.savetxt(os.path.join(out_dir, "equity.csv"), np.column_stack([times, equity]), delimiter=",",
+               header="t,equity", comments="", fmt=["%d", "%.6f"])
+    with open(os.path.join(out_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+def run_backtest(coins, data_dir, interval, signal_interval, capital, seed=None, sz_decimals=None):
+    rng = np.random.default_rng(seed)
+    results = []
+    for coin in coins:
+        t, o, h, l, c = load_candles(data_dir, coin, interval)
+        bt = CoinBacktest(coin, t, o, h, l, c, signal_interval, rng, sz_decimals=sz_decimals)
+        bt.run()
+        results.append(bt)
+    trades = sorted((trade for bt in results for trade in bt.trades), key=lambda trade: trade["entry_time"])
+    times, equity = combine_equity(results, capital)
+    return trades, times, equity
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline backtest of the follow_bot_v5 strategy.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    dl = sub.add_parser("download", help="Download candles into the data directory.")
+    dl.add_argument("--coins", nargs="+", default=v5.ALL_COINS)
+    dl.add_argument("--interval", default="1m")
+    dl.add_argument("--days", type=float, default=30)
+    dl.add_argument("--data-dir", default=DATA_DIR)
+
+    run = sub.add_parser("run", help="Run the backtest on local candle files.")
+    run.add_argument("--coins", nargs="+", default=v5.ALL_COINS)
+    run.add_argument("--interval", default="1m", help="Execution bar interval (one decision per bar).")
+    run.add_argument("--signal-interval", default="15m", help="EMA/volatility interval, as in follow_bot_v5.")
+    run.add_argument("--capital", type=float, default=v5.MY_INVESTMENT_USD)
+    run.add_argument("--seed", type=int, default=None)
+    run.add_argument("--data-dir", default=DATA_DIR)
+    run.add_argument("--out", default=OUTPUT_DIR)
+    args = parser.parse_args()
+
+    if args.command == "download":
+        from hyperliquid.info import Info
+        from hyperliquid.utils import constants
+        info = Info(constants.MAINNET_API_URL, skip_ws=True)
+        os.makedirs(args.data_dir, exist_ok=True)
+        end = int(time.time() * 1000)
+        start = end - int(args.days * 86400 * 1000)
+        for coin in args.coins:
+            candles = download_candles(info, coin, args.interval, start, end)
+            with open(candle_path(args.data_dir, coin, args.interval, "json"), "w") as f:
+                json.dump(candles, f)
+            print(f"📥 {coin} {args.interval}: {len(candles)} 根K线")
+        return
+
+    started = time.perf_counter()
+    trades, times, equity = run_backtest(args.coins, args.data_dir, args.interval, args.signal_interval, args.capital, seed=args.seed)
+    summary = summarize(trades, times, equity, args.capital)
+    summary["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    write_outputs(args.out, trades, times, equity, summary)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    print(f"📄 交易明细与资金曲线已写入 {args.out}")
+
+
+if __name__ == "__main__":
+    main()
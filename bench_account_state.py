@@ -0,0 +1,128 @@
+"""
+仓位解析基准：构造一个 200 个仓位的 clearinghouseState，
+对比旧写法（每次 get_position_info 线性扫描 + 重复 float()/int() 转换）
+与 AccountSnapshot 一次解析 + 按币种字典查找的单轮耗时，以及单个仓位的内存占用。
+
+用法: python bench_account_state.py --positions 200 --rounds 2000
+"""
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+from account_state import AccountSnapshot
+
+
+def make_user_state(count):
+    positions = []
+    for i in range(count):
+        szi = round(random.uniform(-1000, 1000), 3) or 1.0
+        entry_px = round(random.uniform(0.1, 50000), 4)
+        positions.append({
+            "type": "oneWay",
+            "position": {
+                "coin": f"COIN{i}",
+                "szi": str(szi),
+                "leverage": {"type": "cross", "value": random.randint(1, 20)},
+                "entryPx": str(entry_px),
+                "positionValue": str(abs(szi) * entry_px),
+                "unrealizedPnl": str(round(random.uniform(-100, 100), 4)),
+                "returnOnEquity": str(round(random.uniform(-0.5, 0.5), 6)),
+                "liquidationPx": str(round(entry_px * 0.8, 4)),
+                "marginUsed": str(round(abs(szi) * entry_px / 5, 4)),
+                "maxLeverage": 20,
+                "cumFunding": {"allTime": "1.2", "sinceOpen": "0.3", "sinceChange": "0.1"},
+            },
+        })
+    return {
+        "assetPositions": positions,
+        "marginSummary": {"accountValue": "100000", "totalMarginUsed": "20000"},
+        "withdrawable": "80000",
+    }
+
+
+def get_position_info(user_state, coin_name):
+    """旧写法：线性扫描 assetPositions"""
+    for p in user_state.get("assetPositions", []):
+        pos = p.get("position", {})
+        if pos.get("coin") == coin_name:
+            return pos
+    return None
+
+
+def legacy_cycle(user_state, coins):
+    """模拟旧脚本一轮：每个币种扫描一次，并在多处重复解析字段"""
+    total = 0.0
+    for coin in coins:
+        pos = get_position_info(user_state, coin)
+        if not pos:
+            continue
+        is_long = float(pos["szi"]) > 0
+        lev = int(pos["leverage"]["value"])
+        size = abs(float(pos["szi"]))
+        entry_px = float(pos.get("entryPx") or pos.get("avgEntryPrice") or pos.get("entryPrice") or 0)
+        roe = float(pos.get("returnOnEquity"))
+        liq_px = float(pos["liquidationPx"])
+        # 风控和日志中再次读取
+        total += size * entry_px * (1 if is_long else -1) / lev + roe + liq_px + float(pos["szi"])
+    return total
+
+
+def snapshot_cycle(user_state, coins):
+    """新写法：一次解析，按币种 O(1) 查找"""
+    total = 0.0
+    snapshot = AccountSnapshot(user_state)
+    for coin in coins:
+        pos = snapshot.get(coin)
+        if not pos:
+            continue
+        total += pos.size * pos.entry_px * (1 if pos.is_long else -1) / pos.leverage + pos.return_on_equity + pos.liquidation_px + pos.szi
+    return total
+
+
+def time_cycles(func, user_state, coins, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(user_state, coins)
+    return (time.perf_counter() - start) / rounds
+
+
+def measure_memory(build):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    obj = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return obj, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing a clearinghouseState into AccountSnapshot.")
+    parser.add_argument("--positions", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    user_state = make_user_state(args.positions)
+    coins = [f"COIN{i}" for i in range(args.positions)]
+
+    legacy = time_cycles(legacy_cycle, user_state, coins, args.rounds)
+    parsed = time_cycles(snapshot_cycle, user_state, coins, args.rounds)
+    parse_only = time_cycles(lambda state, _: AccountSnapshot(state), user_state, coins, args.rounds)
+    print(f"{args.positions} positions, {args.rounds} rounds")
+    print(f"  legacy scan + repeated float(): {legacy * 1e6:>10.1f} us/cycle")
+    print(f"  AccountSnapshot parse + lookup: {parsed * 1e6:>10.1f} us/cycle ({legacy / parsed:.1f}x)")
+    print(f"  AccountSnapshot parse only:     {parse_only * 1e6:>10.1f} us/cycle")
+
+    snapshot = AccountSnapshot(user_state)
+    position = next(iter(snapshot))
+    raw = position.raw
+    print(f"  sys.getsizeof Position: {sys.getsizeof(position)} B, raw position dict: {sys.getsizeof(raw)} B")
+    _, snapshot_bytes = measure_memory(lambda: AccountSnapshot(user_state))
+    print(f"  AccountSnapshot allocation: {snapshot_bytes / args.positions:.0f} B/position (raw JSON kept by reference)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+决策循环基准：用内存中的桩 Info/Exchange（无网络）测量币种数量增长时单轮决策的开销。
+
+follow_bot_v5 跑完整的 run_cycle（内部逐币种调用 handle_position），ds_copier_v2 跑 sync_coins（逐币种 process_coin），
+另外单独测量按币种查仓位（AccountSnapshot.fetch + get，即原 get_position_info 的替代）的耗时。
+每个组合统计：单轮耗时 p50/p95、各函数累计耗时、tracemalloc 单轮分配量与峰值、每轮 REST 调用次数和下单数。
+首轮（回填K线、加载元数据）单独记为 cold，之后的轮次为 steady。
+
+结果写入 bench_results/decision_loop_<时间>_<git 版本>.json，用 --compare 与旧结果对比：
+    python bench_decision_loop.py --coins 5 50 200 --cycles 50
+    python bench_decision_loop.py --compare bench_results/decision_loop_20260101-120000_abc1234.json --max-regression 1.3
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import contextlib
+import subprocess
+import tracemalloc
+from statistics import median
+
+import ema
+import meta_cache
+import ds_copier_v2
+import follow_bot_v5
+from account_state import AccountSnapshot
+from scheduler import CooldownScheduler, CheckGapMonitor
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results")
+MY_ADDRESS = "0x0000000000000000000000000000000000000001"
+TARGET_ADDRESS = ds_copier_v2.TARGET_USER_ADDRESS
+BAR_MS = ema.INTERVAL_SECONDS["15m"] * 1000
+
+
+class StubMarket:
+    """确定性的随机游走行情与仓位，每轮 step() 前进一根 15m K线"""
+
+    def __init__(self, coin_count, seed=0):
+        self.rng = random.Random(seed)
+        self.coins = [f"C{i:03d}" for i in range(coin_count)]
+        self.prices = {coin: self.rng.uniform(0.5, 50000) for coin in self.coins}
+        self.bar_time = int(time.time() * 1000) // BAR_MS * BAR_MS
+        self.callbacks = {}
+        # 我方持有约一半币种，目标持有约七成，方向与大小随机
+        self.positions = {MY_ADDRESS: self._random_positions(0.5, 300), TARGET_ADDRESS: self._random_positions(0.7, 300000)}
+
+    def _random_positions(self, share, notional):
+        positions = {}
+        for coin in self.coins:
+            if self.rng.random() < share:
+                szi = notional / self.prices[coin] * self.rng.choice([-1, 1]) * self.rng.uniform(0.5, 1.5)
+                positions[coin] = (szi, self.prices[coin] * self.rng.uniform(0.97, 1.03), self.rng.choice([3, 5, 10, 20]))
+        return positions
+
+    def step(self):
+        self.bar_time += BAR_MS
+        for coin in self.coins:
+            self.prices[coin] *= 1 + self.rng.gauss(0, 0.004)
+            callback = self.callbacks.get(coin)
+            if callback:
+                callback({"channel": "candle", "data": self.candle(coin, self.bar_time)})
+
+    def candle(self, coin, t):
+        px = self.prices[coin]
+        return {"t": t, "T": t + BAR_MS - 1, "s": coin, "i": "15m", "o": str(px), "h": str(px * 1.002), "l": str(px * 0.998), "c": str(px), "v": "1", "n": 1}
+
+    def user_state(self, address):
+        asset_positions = []
+        for coin, (szi, entry_px, leverage) in self.positions.get(address, {}).items():
+            px = self.prices[coin]
+            value = abs(szi) * px
+            asset_positions.append({"type": "oneWay", "position": {
+                "coin": coin, "szi": f"{szi:.6f}", "leverage": {"type": "cross", "value": leverage},
+                "entryPx": f"{entry_px:.6f}", "positionValue": f"{value:.4f}",
+                "unrealizedPnl": f"{(px - entry_px) * szi:.4f}", "returnOnEquity": f"{(px / entry_px - 1) * leverage * (1 if szi > 0 else -1):.6f}",
+                "liquidationPx": f"{entry_px * (1 - 0.9 / leverage if szi > 0 else 1 + 0.9 / leverage):.6f}",
+                "marginUsed": f"{value / leverage:.4f}", "maxLeverage": 50,
+                "cumFunding": {"allTime": "0.5", "sinceOpen": "0.1", "sinceChange": "0.05"},
+            }})
+        return {"assetPositions": asset_positions, "marginSummary": {"accountValue": "100000", "totalMarginUsed": "20000"}, "withdrawable": "80000"}
+
+
+class StubInfo:
+    def __init__(self, market):
+        self.market = market
+
+    def meta(self):
+        return {"universe": [{"name": coin, "szDecimals": 3 if self.market.prices[coin] < 100 else 5, "maxLeverage": 25} for coin in self.market.coins]}
+
+    def all_mids(self):
+        return {coin: str(px) for coin, px in self.market.prices.items()}
+
+    def user_state(self, address):
+        return self.market.user_state(address)
+
+    def candles_snapshot(self, coin, interval, start, end):
+        # 回填：以当前价为终点倒推一段随机游走
+        rng = random.Random(hash((coin, start)) & 0xffffffff)
+        start = max(start, self.market.bar_time - (ema.CANDLE_CAPACITY - 1) * BAR_MS)
+        times = range(start // BAR_MS * BAR_MS, self.market.bar_time + 1, BAR_MS)
+        px = self.market.prices[coin]
+        candles = []
+        for t in reversed(times):
+            candles.append(self.market.candle(coin, t) | {"c": str(px)})
+            px /= 1 + rng.gauss(0, 0.004)
+        return candles[::-1]
+
+    def subscribe(self, subscription, callback):
+        self.market.callbacks[subscription["coin"]] = callback
+        return len(self.market.callbacks)
+
+
+class StubExchange:
+    def __init__(self, market):
+        self.market = market
+
+    def _slippage_price(self, coin, is_buy, slippage, px=None):
+        px = px or self.market.prices[coin]
+        return round(px * (1 + slippage if is_buy else 1 - slippage), 6)
+
+    def bulk_orders(self, order_requests, builder=None, grouping="na"):
+        statuses = [{"filled": {"totalSz": str(o["sz"]), "avgPx": str(o["limit_px"]), "oid": i}} for i, o in enumerate(order_requests)]
+        return {"status": "ok", "response": {"type": "order", "data": {"statuses": statuses}}}
+
+    def update_leverage(self, leverage, name, is_cross=True):
+        return {"status": "ok", "response": {"type": "default"}}
+
+
+class FunctionTimer:
+    """临时替换模块函数，累计其耗时（模块内部调用经由全局名查找，因此替换后生效）"""
+
+    def __init__(self, targets):
+        self.targets = targets   # [(module, name)]
+        self.seconds = {name: 0.0 for _, name in targets}
+        self.originals = []
+
+    def __enter__(self):
+        for module, name in self.targets:
+            original = getattr(module, name)
+            self.originals.append((module, name, original))
+            setattr(module, name, self._wrap(name, original))
+        return self
+
+    def __exit__(self, *exc):
+        for module, name, original in self.originals:
+            setattr(module, name, original)
+
+    def _wrap(self, name, original):
+        seconds = self.seconds
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                seconds[name] += time.perf_counter() - started
+        return timed
+
+
+def setup_v5(market, info):
+    follow_bot_v5.ALL_COINS = market.coins
+    follow_bot_v5.OPEN_ALL_COINS = True
+    follow_bot_v5.coin_states.clear()
+    ema._series.clear()
+    ema.subscribe_candles(info, market.coins, "15m")
+
+
+def v5_cycle(market, info, exchange, metas):
+    # 每轮重置冷却，使各轮走相同的分支（否则首轮平仓后所有币种都停在冷却里）
+    follow_bot_v5.cooldowns = CooldownScheduler()
+    follow_bot_v5.risk_check_gaps = CheckGapMonitor()
+    with contextlib.redirect_stdout(io.StringIO()):
+        return follow_bot_v5.run_cycle(info, exchange, metas, MY_ADDRESS)
+
+
+def ds_copier_cycle(market, info, exchange, metas):
+    all_mids = info.all_mids()
+    target_account = AccountSnapshot.fetch(info, TARGET_ADDRESS)
+    my_account = AccountSnapshot.fetch(info, MY_ADDRESS)
+    return ds_copier_v2.sync_coins(exchange, info, all_mids, MY_ADDRESS, target_account, my_account, market.coins, metas)
+
+
+def positions_cycle(market, info, exchange, metas):
+    """每个币种查一次仓位并读取决策用到的字段，不下单"""
+    snapshot = AccountSnapshot.fetch(info, MY_ADDRESS)
+    for coin in market.coins:
+        pos = snapshot.get(coin)
+        if pos:
+            follow_bot_v5.get_position_liquidation_price(pos, market.prices[coin])
+    return []
+
+
+SCRIPTS = {
+    "follow_bot_v5": (v5_cycle, [(follow_bot_v5, "handle_position"), (follow_bot_v5, "open_position")]),
+    "ds_copier_v2": (ds_copier_cycle, [(ds_copier_v2, "process_coin")]),
+    "positions": (positions_cycle, []),
+}
+
+
+def run_case(script, coin_count, cycles, seed):
+    cycle, timed_functions = SCRIPTS[script]
+    random.seed(seed)
+    market = StubMarket(coin_count, seed)
+    info = follow_bot_v5.RestCallCounter(StubInfo(market))
+    exchange = StubExchange(market)
+    metas = meta_cache.MetaCache(info, path=None)
+    if script == "follow_bot_v5":
+        setup_v5(market, info)
+
+    def one_cycle():
+        info.reset()
+        return cycle(market, info, exchange, metas)
+
+    # 首轮单独计时：K线回填等一次性开销
+    started = time.perf_counter()
+    results = one_cycle()
+    cold = time.perf_counter() - started
+    cold_calls = dict(info.by_method)
+
+    durations, orders, calls = [], 0, {}
+    with FunctionTimer(timed_functions) as timer:
+        for _ in range(cycles):
+            market.step()
+            started = time.perf_counter()
+            results = one_cycle()
+            durations.append(time.perf_counter() - started)
+            orders += sum(1 for action, _ in results or [] if "sz" in action)
+            for method, count in info.by_method.items():
+                calls[method] = calls.get(method, 0) + count
+        function_seconds = dict(timer.seconds)
+
+    # 分配量另跑几轮，避免 tracemalloc 的开销混入耗时
+    alloc_cycles = max(1, min(cycles, 10))
+    tracemalloc.start()
+    allocated = peak = 0
+    for _ in range(alloc_cycles):
+        market.step()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        snapshot_before = tracemalloc.take_snapshot()
+        one_cycle()
+        snapshot_after = tracemalloc.take_snapshot()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+        allocated += sum(stat.size_diff for stat in snapshot_after.compare_to(snapshot_before, "filename") if stat.size_diff > 0)
+    tracemalloc.stop()
+
+    durations.sort()
+    return {
+        "script": script,
+        "coins": coin_count,
+        "cycles": cycles,
+        "cold_ms": cold * 1000,
+        "cold_rest_calls": cold_calls,
+        "p50_ms": median(durations) * 1000,
+        "p95_ms": durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000,
+        "mean_ms": sum(durations) / len(durations) * 1000,
+        "function_ms_per_cycle": {name: seconds / cycles * 1000 for name, seconds in function_seconds.items()},
+        "retained_kb_per_cycle": allocated / alloc_cycles / 1024,
+        "peak_kb": peak / 1024,
+        "rest_calls_per_cycle": {method: count / cycles for method, count in sorted(calls.items())},
+        "orders_per_cycle": orders / cycles,
+    }
+
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def save_results(results, args):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    revision = git_revision()
+    path = os.path.join(RESULTS_DIR, f"decision_loop_{time.strftime('%Y%m%d-%H%M%S')}_{revision}.json")
+    with open(path, "w") as f:
+        json.dump({
+            "revision": revision,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "args": vars(args),
+            "results": results,
+        }, f, indent=2)
+    return path
+
+
+def compare(results, path, max_regression):
+    """按 (脚本, 币种数) 对比 p50 耗时与单轮分配量，返回超过阈值的组合"""
+    with open(path) as f:
+        baseline = json.load(f)
+    old = {(r["script"], r["coins"]): r for r in baseline["results"]}
+    print(f"\nvs {os.path.basename(path)} (revision {baseline.get('revision')})")
+    print(f"{'script':<14} {'coins':>5} {'p50 old':>9} {'p50 new':>9} {'ratio':>6} {'kb old':>8} {'kb new':>8}")
+    regressions = []
+    for r in results:
+        o = old.get((r["script"], r["coins"]))
+        if not o:
+            continue
+        ratio = r["p50_ms"] / o["p50_ms"] if o["p50_ms"] else float("inf")
+        flag = " <-- regression" if max_regression and ratio > max_regression else ""
+        if flag:
+            regressions.append((r["script"], r["coins"], ratio))
+        print(f"{r['script']:<14} {r['coins']:>5} {o['p50_ms']:>9.2f} {r['p50_ms']:>9.2f} {ratio:>6.2f} "
+              f"{o['retained_kb_per_cycle']:>8.1f} {r['retained_kb_per_cycle']:>8.1f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark decision-loop cost versus coin count with stub Info/Exchange.")
+    parser.add_argument("--coins", type=int, nargs="+", default=[5, 50, 200])
+    parser.add_argument("--cycles", type=int, default=50)
+    parser.add_argument("--scripts", nargs="+", default=list(SCRIPTS), choices=list(SCRIPTS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-save", action="store_true", help="Do not write a results file.")
+    parser.add_argument("--compare", help="Previous results JSON to compare against.")
+    parser.add_argument("--max-regression", type=float, help="Exit with status 1 if any p50 grows by more than this ratio.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.disable(logging.WARNING)   # ds_copier 的日志格式化仍会发生，只是不写出
+    ds_copier_v2.DRY_RUN = False
+
+    print(f"{'script':<14} {'coins':>5} {'cold ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'us/coin':>8} {'kb/cyc':>8} {'peak kb':>8} {'REST/cyc':>8} {'orders':>7}  per-function ms")
+    results = []
+    for script in args.scripts:
+        for coin_count in args.coins:
+            r = run_case(script, coin_count, args.cycles, args.seed)
+            results.append(r)
+            functions = ", ".join(f"{name} {ms:.2f}" for name, ms in r["function_ms_per_cycle"].items())
+            print(f"{script:<14} {coin_count:>5} {r['cold_ms']:>8.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p50_ms'] * 1000 / coin_count:>8.1f} "
+                  f"{r['retained_kb_per_cycle']:>8.1f} {r['peak_kb']:>8.1f} {sum(r['rest_calls_per_cycle'].values()):>8.1f} {r['orders_per_cycle']:>7.1f}  {functions}")
+
+    if not args.no_save:
+        print(f"\nSaved to {save_results(results, args)}")
+    if args.compare:
+        regressions = compare(results, args.compare, args.max_regression)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.max_regression}x")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
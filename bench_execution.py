@@ -0,0 +1,113 @@
+"""
+执行成本对比：在本地 mock_server 上用同一组订单分别走市价单（OrderBatch 的 IOC）和被动执行（execution.PassiveExecutor），
+比较相对下单时中间价的成本、手续费、maker 占比、成交耗时和请求数。
+
+mock 的吃单按买一/卖一成交（中间价 ± HALF_SPREAD），挂单在中间价穿过限价时按限价成交，手续费与主网费率一致。
+每轮对每个币种开仓再平仓，两种方式使用相同的币种、方向和数量。
+
+用法: python bench_execution.py --coins 5 --rounds 3 --deadline 10 --reprice 0.5
+"""
+import io
+import random
+import argparse
+import contextlib
+
+import execution
+from order_batch import OrderBatch
+from mock_server import MockServer, HALF_SPREAD
+from bench_mock_server import connect
+
+ORDER_USD = 50
+
+
+def make_orders(coins, mids, metas, rng):
+    orders = []
+    for coin in coins:
+        sz = round(ORDER_USD / float(mids[coin]), metas.sz_decimals(coin, 2))
+        if sz > 0:
+            orders.append((coin, rng.random() < 0.5, sz))
+    return orders
+
+
+def run_market(server, orders, rounds):
+    with contextlib.redirect_stdout(io.StringIO()):
+        address, info, exchange, metas = connect(server)
+    reports = []
+    for _ in range(rounds):
+        for reduce_only in (False, True):
+            arrival = {coin: mid_of(info, coin) for coin, _, _ in orders}
+            batch = OrderBatch(exchange, log=lambda msg: None)
+            for coin, is_buy, sz in orders:
+                if reduce_only:
+                    batch.market_close(coin, sz if is_buy else -sz)
+                else:
+                    batch.market_open(coin, is_buy, sz)
+            for order, status in batch.submit(info.all_mids()):
+                if "filled" not in status:
+                    continue
+                px, sz = float(status["filled"]["avgPx"]), float(status["filled"]["totalSz"])
+                mid = arrival[order["coin"]]
+                cost = (px - mid) / mid * 1e4 * (1 if order["is_buy"] else -1)
+                reports.append(execution.ExecutionReport(order["coin"], order["is_buy"], order["sz"], sz, 0.0, sz, px, mid, cost,
+                                                         sz * px * execution.TAKER_FEE_RATE, 0.0, 0))
+    return reports
+
+
+def run_passive(server, orders, rounds, deadline, reprice):
+    with contextlib.redirect_stdout(io.StringIO()):
+        address, info, exchange, metas = connect(server)
+    executor = execution.PassiveExecutor(exchange, info, address, deadline=deadline, reprice=reprice, metas=metas, log=lambda msg: None)
+    for _ in range(rounds):
+        executor.execute([{"coin": coin, "is_buy": is_buy, "sz": sz, "reduce_only": False} for coin, is_buy, sz in orders])
+        executor.execute([{"coin": coin, "is_buy": not is_buy, "sz": sz, "reduce_only": True} for coin, is_buy, sz in orders])
+    return executor.reports
+
+
+def mid_of(info, coin):
+    levels = info.l2_snapshot(coin)["levels"]
+    return (float(levels[0][0]["px"]) + float(levels[1][0]["px"])) / 2
+
+
+def summarize(name, reports, requests):
+    filled = [r for r in reports if r.filled]
+    notional = sum(r.filled * r.avg_px for r in filled)
+    cost_usd = sum(r.cost_bps / 1e4 * r.filled * r.avg_px for r in filled)
+    fees = sum(r.fee for r in filled)
+    maker = sum(r.maker_sz * r.avg_px for r in filled) / notional if notional else 0.0
+    seconds = sorted(r.seconds for r in filled)
+    p50 = seconds[len(seconds) // 2] if seconds else 0.0
+    print(f"{name:<8} {len(filled):>6} {notional:>10.2f} {cost_usd / notional * 1e4:>+9.2f} {fees / notional * 1e4:>8.2f} "
+          f"{(cost_usd + fees) / notional * 1e4:>+9.2f} {maker * 100:>6.0f}% {p50:>7.1f} {requests:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare market (IOC) and passive execution costs on mock_server.")
+    parser.add_argument("--coins", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--deadline", type=float, default=10.0)
+    parser.add_argument("--reprice", type=float, default=0.5)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{args.coins} coin(s) x {args.rounds} round(s) of open + close, ${ORDER_USD} each, mock half spread {HALF_SPREAD * 1e4:.0f} bp")
+    print(f"{'mode':<8} {'orders':>6} {'notional':>10} {'slip bps':>9} {'fee bps':>8} {'total bps':>9} {'maker':>7} {'p50 s':>7} {'reqs':>6}")
+    for name in ("market", "passive"):
+        server = MockServer(("127.0.0.1", 0), coins=args.coins, latency_ms=args.latency_ms, seed=args.seed).start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                _, info, _, metas = connect(server)
+            orders = make_orders(server.state.market.coins, info.all_mids(), metas, random.Random(args.seed))
+            requests_before = server.state.stats["requests"]
+            if name == "market":
+                reports = run_market(server, orders, args.rounds)
+            else:
+                reports = run_passive(server, orders, args.rounds, args.deadline, args.reprice)
+            summarize(name, reports, server.state.stats["requests"] - requests_before)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+日志写出基准：用 bench_decision_loop 的桩行情跑 follow_bot_v5.run_cycle 和 ds_copier_v2.sync_coins，
+对比同步写日志（print 直接写 stdout、logging 直接写文件）与 log_pipeline 异步写出时的单轮耗时。
+
+日志目标是模拟磁盘：每次 write() 耗时 --write-us 微秒，每 --stall-every 次写入再卡顿 --stall-ms 毫秒（页缓存回写、云盘抖动）。
+异步模式同时写结构化事件，并对 "in sync" 等重复消息抽样，单独统计写出的行数。
+
+用法: python bench_logging.py --coins 50 200 --cycles 30 --stall-ms 50 --stall-every 200
+"""
+import io
+import sys
+import time
+import random
+import logging
+import argparse
+from statistics import median
+
+import log_pipeline
+import meta_cache
+import follow_bot_v5
+import bench_decision_loop as loop
+
+
+class SlowFile(io.TextIOBase):
+    """每次写入有固定耗时，周期性地卡顿一次"""
+
+    def __init__(self, write_us, stall_ms, stall_every):
+        self.write_seconds = write_us / 1e6
+        self.stall_seconds = stall_ms / 1000
+        self.stall_every = stall_every
+        self.writes = 0
+        self.lines = 0
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        self.writes += 1
+        self.lines += s.count("\n")
+        time.sleep(self.write_seconds + (self.stall_seconds if self.stall_every and self.writes % self.stall_every == 0 else 0))
+        return len(s)
+
+
+def configure(mode, sink, events_sink):
+    """按模式替换 stdout 和 root logger 的输出，返回恢复函数"""
+    real_stdout = sys.stdout
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    root.handlers.clear()
+    root.setLevel(logging.INFO)
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+    if mode == "sync":
+        sys.stdout = sink
+        root.addHandler(handler)
+    else:
+        sys.stdout = sink
+        log_pipeline.redirect_stdout()
+        log_pipeline.attach(root, [handler])
+        events_handler = logging.StreamHandler(events_sink)
+        events_handler.setFormatter(log_pipeline.JsonLinesFormatter())
+        log_pipeline.attach(log_pipeline.events_logger, [events_handler], sample=False)
+
+    def restore():
+        started = time.perf_counter()
+        log_pipeline.shutdown()
+        drain = time.perf_counter() - started
+        sys.stdout = real_stdout
+        root.handlers[:] = saved_handlers
+        root.setLevel(saved_level)
+        return drain
+    return restore
+
+
+def run_case(script, mode, coin_count, cycles, args):
+    random.seed(args.seed)
+    market = loop.StubMarket(coin_count, args.seed)
+    info = follow_bot_v5.RestCallCounter(loop.StubInfo(market))
+    exchange = loop.StubExchange(market)
+    metas = meta_cache.MetaCache(info, path=None)
+    if script == "follow_bot_v5":
+        loop.setup_v5(market, info)
+        cycle = lambda: follow_bot_v5.run_cycle(info, exchange, metas, loop.MY_ADDRESS)
+    else:
+        cycle = lambda: loop.ds_copier_cycle(market, info, exchange, metas)
+
+    sink = SlowFile(args.write_us, args.stall_ms, args.stall_every)
+    events_sink = SlowFile(args.write_us, args.stall_ms, args.stall_every)
+    restore = configure(mode, sink, events_sink)
+    durations = []
+    try:
+        cycle()   # 首轮回填K线等，不计入
+        for _ in range(cycles):
+            market.step()
+            follow_bot_v5.cooldowns = loop.CooldownScheduler()
+            log_pipeline.next_cycle()
+            started = time.perf_counter()
+            cycle()
+            seconds = time.perf_counter() - started
+            log_pipeline.event("cycle", bot=script, ms=round(seconds * 1000, 3))
+            durations.append(seconds)
+    finally:
+        drain = restore()
+    durations.sort()
+    return {
+        "p50_ms": median(durations) * 1000,
+        "p95_ms": durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000,
+        "max_ms": durations[-1] * 1000,
+        "lines": sink.lines / cycles,
+        "events": events_sink.lines / cycles,
+        "drain_ms": drain * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-cycle latency with synchronous vs queued (log_pipeline) logging on a slow disk.")
+    parser.add_argument("--coins", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--cycles", type=int, default=30)
+    parser.add_argument("--write-us", type=float, default=20.0, help="Cost of each write() on the simulated disk.")
+    parser.add_argument("--stall-ms", type=float, default=50.0, help="Extra stall every --stall-every writes.")
+    parser.add_argument("--stall-every", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"simulated disk: {args.write_us:.0f} us per write, {args.stall_ms:.0f} ms stall every {args.stall_every} writes")
+    print(f"{'script':<14} {'coins':>5} {'mode':<6} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'lines/cyc':>10} {'events/cyc':>10} {'drain ms':>9}")
+    for script in ("follow_bot_v5", "ds_copier_v2"):
+        for coin_count in args.coins:
+            for mode in ("sync", "async"):
+                r = run_case(script, mode, coin_count, args.cycles, args)
+                print(f"{script:<14} {coin_count:>5} {mode:<6} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['max_ms']:>8.2f} "
+                      f"{r['lines']:>10.1f} {r['events']:>10.1f} {r['drain_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+压测：在本地 mock_server 上运行 ds_copier_v2 与 follow_bot_v5 的单轮逻辑，
+观察单轮耗时与下单吞吐随币种数量、网络延迟和错误率的变化。
+
+每个组合启动一个新的 mock 服务，使用临时生成的私钥（不读取 config.json）。
+
+用法: python bench_mock_server.py --coins 5 20 50 --latency-ms 0 50 --error-rate 0 0.05 --cycles 5
+"""
+import io
+import time
+import random
+import logging
+import argparse
+import itertools
+import contextlib
+
+import eth_account
+from hyperliquid.exchange import Exchange
+from hyperliquid.info import Info
+
+import ema
+import meta_cache
+import ds_copier_v2
+import follow_bot_v5
+from account_state import AccountSnapshot
+from scheduler import CooldownScheduler, CheckGapMonitor
+from mock_server import MockServer
+
+TARGET_ADDRESS = "0x00000000000000000000000000000000000000aa"
+
+
+def connect(server):
+    wallet = eth_account.Account.create()
+    info = Info(server.base_url, skip_ws=True)
+    exchange = Exchange(wallet, server.base_url, account_address=wallet.address)
+    info.spot_user_state(wallet.address)   # 与 example_utils.setup 相同，登记为可交易账户
+    metas = meta_cache.MetaCache(info, path=None)
+    return wallet.address, info, exchange, metas
+
+
+def ds_copier_cycle(address, info, exchange, metas, coins):
+    all_mids = info.all_mids()
+    target_account = AccountSnapshot.fetch(info, TARGET_ADDRESS)
+    my_account = AccountSnapshot.fetch(info, address)
+    return ds_copier_v2.sync_coins(exchange, info, all_mids, address, target_account, my_account, coins, metas, copy_ratio=0.01)
+
+
+def follow_bot_v5_cycle(address, info, exchange, metas, coins):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return follow_bot_v5.run_cycle(info, exchange, metas, address)
+
+
+def reset_v5(coins):
+    follow_bot_v5.ALL_COINS = coins
+    follow_bot_v5.OPEN_ALL_COINS = True
+    follow_bot_v5.cooldowns = CooldownScheduler()
+    follow_bot_v5.risk_check_gaps = CheckGapMonitor()
+    ema._series.clear()
+
+
+def run_case(name, cycle, coin_count, latency_ms, error_rate, cycles):
+    server = MockServer(("127.0.0.1", 0), coins=coin_count, latency_ms=latency_ms, target_period=1).start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            address, info, exchange, metas = connect(server)
+        server.error_rate = error_rate   # 初始化完成后再注入错误
+        coins = server.state.market.coins
+        if name == "follow_bot_v5":
+            reset_v5(coins)
+        durations, orders, failed = [], 0, 0
+        for _ in range(cycles):
+            started = time.perf_counter()
+            try:
+                results = cycle(address, info, exchange, metas, coins)
+                orders += sum(1 for action, _ in results if "sz" in action)
+            except Exception:
+                failed += 1
+            durations.append(time.perf_counter() - started)
+            time.sleep(1.0)   # 让模拟目标的仓位进入下一个周期
+        durations.sort()
+        total = sum(durations)
+        return {
+            "p50": durations[len(durations) // 2] * 1000,
+            "max": durations[-1] * 1000,
+            "orders": orders,
+            "orders_per_s": orders / total if total else 0.0,
+            "failed": failed,
+            "requests": server.state.stats["requests"],
+        }
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test ds_copier_v2 / follow_bot_v5 cycles against mock_server.")
+    parser.add_argument("--coins", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--latency-ms", type=float, nargs="+", default=[0, 50])
+    parser.add_argument("--error-rate", type=float, nargs="+", default=[0, 0.05])
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--scripts", nargs="+", default=["ds_copier_v2", "follow_bot_v5"])
+    args = parser.parse_args()
+
+    random.seed(0)
+    logging.basicConfig(level=logging.ERROR)
+    ds_copier_v2.DRY_RUN = False
+    cycles = {"ds_copier_v2": ds_copier_cycle, "follow_bot_v5": follow_bot_v5_cycle}
+
+    print(f"{'script':<14} {'coins':>5} {'lat ms':>7} {'err':>5} {'p50 ms':>8} {'max ms':>8} {'orders':>7} {'orders/s':>9} {'failed':>6} {'reqs':>5}")
+    for name, coin_count, latency, error_rate in itertools.product(args.scripts, args.coins, args.latency_ms, args.error_rate):
+        r = run_case(name, cycles[name], coin_count, latency, error_rate, args.cycles)
+        print(f"{name:<14} {coin_count:>5} {latency:>7.0f} {error_rate:>5.2f} {r['p50']:>8.1f} {r['max']:>8.1f} "
+              f"{r['orders']:>7} {r['orders_per_s']:>9.1f} {r['failed']:>6} {r['requests']:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+多目标拉取基准：在本地启动一个带固定延迟的 /info 桩服务，
+对比逐个同步请求与 multi_copier.fetch_cycle 并发拉取时单轮耗时随目标数的变化。
+
+用法: python bench_multi_copier.py --latency-ms 50 --targets 1 10 25 50
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from hyperliquid.info import Info
+
+import multi_copier
+import request_scheduler
+import transport
+
+COINS = ["XRP", "DOGE", "BTC", "ETH", "SOL", "BNB"]
+
+
+class StubInfoHandler(BaseHTTPRequestHandler):
+    latency = 0.05
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.latency)
+        if body["type"] == "allMids":
+            payload = {coin: str(round(random.uniform(1, 1000), 2)) for coin in COINS}
+        else:
+            payload = {
+                "assetPositions": [
+                    {"position": {"coin": coin, "szi": str(round(random.uniform(-100, 100), 2)), "leverage": {"type": "isolated", "value": 5}}}
+                    for coin in COINS
+                ],
+                "marginSummary": {"accountValue": "100000"},
+            }
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def sequential_cycle(base_url, addresses):
+    session = requests.Session()
+    url = base_url + "/info"
+    session.post(url, json={"type": "allMids"}).json()
+    session.post(url, json={"type": "clearinghouseState", "user": "0xme"}).json()
+    for address in addresses:
+        session.post(url, json={"type": "clearinghouseState", "user": address}).json()
+    session.close()
+
+
+def make_info(base_url):
+    """与 multi_copier 相同：经过 transport 和权重调度的 info，连接池与并发数一致；桩服务没有元数据，直接传空"""
+    info = transport.install(Info(base_url, skip_ws=True, meta={"universe": []}, spot_meta={"universe": [], "tokens": []}),
+                             multi_copier.HTTP_POOL_SIZE)
+    return request_scheduler.get_scheduler().wrap_info(info)
+
+
+async def concurrent_cycles(base_url, targets, rounds):
+    client = multi_copier.AsyncInfoClient(make_info(base_url))
+    try:
+        await multi_copier.fetch_cycle(client, targets, "0xme")  # 预热连接池
+        start = time.perf_counter()
+        for _ in range(rounds):
+            await multi_copier.fetch_cycle(client, targets, "0xme")
+        return (time.perf_counter() - start) / rounds
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark multi-target state fetching against a local stub server.")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--targets", type=int, nargs="+", default=[1, 10, 25, 50])
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    StubInfoHandler.latency = args.latency_ms / 1000
+    server = StubServer(("127.0.0.1", 0), StubInfoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"stub latency {args.latency_ms:.0f} ms, pool size {multi_copier.HTTP_POOL_SIZE}")
+    print(f"{'targets':>8} {'sequential ms':>14} {'concurrent ms':>14} {'speedup':>8}")
+    try:
+        for count in args.targets:
+            targets = [{"address": f"0x{i:040x}", "ratio": 0.001} for i in range(count)]
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                sequential_cycle(base_url, [t["address"] for t in targets])
+            sequential = (time.perf_counter() - start) / args.rounds
+            concurrent = asyncio.run(concurrent_cycles(base_url, targets, args.rounds))
+            print(f"{count:>8} {sequential * 1000:>14.1f} {concurrent * 1000:>14.1f} {sequential / concurrent:>7.1f}x")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
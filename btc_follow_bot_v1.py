@@ -1,6 +1,13 @@
 import time
 import json
+import argparse
 import example_utils
+import execution
+import heartbeat
+import log_pipeline
+import meta_cache
+import metrics
+from account_state import AccountSnapshot
 from hyperliquid.utils import constants
 
 # --- 核心配置参数 ---
@@ -10,18 +17,21 @@ TAKE_PROFIT_USD = 21.0    # 止盈目标 (USD)
 COIN = "BTC"              # 只跟单这个币种
 LOOP_SLEEP_SECONDS = 30   # 每次循环之间的等待时间
 
-# --- 辅助函数：从用户状态中提取特定币种的持仓信息 ---
-def get_position_info(user_state, coin_name):
-    """从完整的用户状态中，查找并返回指定币种的持仓详情，如果不存在则返回None"""
-    asset_positions = user_state.get("assetPositions", [])
-    for position in asset_positions:
-        if position.get("position", {}).get("coin") == coin_name:
-            return position["position"]
-    return None
-
 def main():
     # --- 1. 初始化 ---
-    my_address, info, exchange = example_utils.setup(base_url=constants.MAINNET_API_URL)
+    parser = argparse.ArgumentParser(description="BTC 跟单机器人 V1")
+    parser.add_argument('--base-url', default=constants.MAINNET_API_URL, help='API 地址，可指向本地 mock_server.py 做压测')
+    parser.add_argument('--metrics-port', type=int, help='在该端口暴露 Prometheus 指标 (/metrics)')
+    parser.add_argument('--execution', choices=execution.EXECUTION_MODES, default='market', help='市价单的执行方式：market 为 1%% 滑点的 IOC，passive 为盘口挂单追价、超时后 IOC')
+    parser.add_argument('--events-file', default='btc_follow_bot_v1.events.jsonl', help="结构化事件 (JSON lines: 轮次、决策、下单耗时) 文件，传空字符串则不写")
+    args = parser.parse_args()
+    heartbeat.setup()
+    log_pipeline.setup(args.events_file)
+    my_address, info, exchange = example_utils.setup(base_url=args.base_url)
+    info, exchange = metrics.setup(args.metrics_port, info, exchange)
+    exchange = execution.setup(args.execution, info, exchange, my_address)
+    cycle = metrics.CycleTimer("btc_follow_bot_v1")
+    sz_decimals = meta_cache.get_meta_cache(info).sz_decimals(COIN, 5)
     print("--- BTC跟单机器人 V1 ---")
     print(f"我的账户地址: {my_address}")
     print(f"跟单目标地址: {TARGET_USER_ADDRESS}")
@@ -31,21 +41,22 @@ def main():
     try:
         # --- 2. 进入主循环 ---
         while True:
+            cycle.start()
             print(f"\n----- {time.strftime('%Y-%m-%d %H:%M:%S')} -----")
             # --- a. 数据采集 ---
             print("正在获取最新数据...")
             all_mids = info.all_mids()
-            target_user_state = info.user_state(TARGET_USER_ADDRESS)
-            my_user_state = info.user_state(my_address)
+            target_user_state = AccountSnapshot.fetch(info, TARGET_USER_ADDRESS)
+            my_user_state = AccountSnapshot.fetch(info, my_address)
             
             btc_price = float(all_mids.get(COIN, 0))
             if btc_price == 0:
                 print(f"❌ 警告: 无法获取 {COIN} 的价格，跳过本轮循环。")
-                time.sleep(LOOP_SLEEP_SECONDS)
+                cycle.sleep(LOOP_SLEEP_SECONDS)
                 continue
 
-            target_btc_position = get_position_info(target_user_state, COIN)
-            my_btc_position = get_position_info(my_user_state, COIN)
+            target_btc_position = target_user_state.get(COIN)
+            my_btc_position = my_user_state.get(COIN)
 
             # --- b. 目标有效性检查 ---
             if not target_btc_position:
@@ -54,19 +65,19 @@ def main():
                     print(f"❗️ 警告: 目标已平仓，但我仍持有 {COIN} 仓位。为安全起见，执行平仓！")
                     close_result = exchange.market_close(COIN)
                     print(f"平仓结果: {json.dumps(close_result)}")
-                time.sleep(LOOP_SLEEP_SECONDS)
+                cycle.sleep(LOOP_SLEEP_SECONDS)
                 continue
 
             # --- c. 我的状态评估 ---
-            target_direction_is_buy = float(target_btc_position["szi"]) > 0
-            target_leverage = int(target_btc_position["leverage"]["value"])
+            target_direction_is_buy = target_btc_position.is_long
+            target_leverage = target_btc_position.leverage
 
             if my_btc_position is None:
                 # --- 情况一：我没有BTC仓位 -> 跟单开仓 ---
                 print(f"✅ 发现目标持有 {COIN} {'多单' if target_direction_is_buy else '空单'} (杠杆: {target_leverage}x)。")
                 print(f"执行跟单，开立价值 ${MY_INVESTMENT_USD} 的仓位...")
 
-                sz = round(MY_INVESTMENT_USD / btc_price, 5)
+                sz = round(MY_INVESTMENT_USD / btc_price, sz_decimals)
                 
                 # 设置与目标一致的杠杆
                 exchange.update_leverage(target_leverage, COIN)
@@ -76,13 +87,13 @@ def main():
             
             else:
                 # --- 情况二：我有BTC仓位 -> 监控或调整 ---
-                my_direction_is_buy = float(my_btc_position["szi"]) > 0
-                my_leverage = int(my_btc_position["leverage"]["value"])
+                my_direction_is_buy = my_btc_position.is_long
+                my_leverage = my_btc_position.leverage
                 
                 # 一致性检查
                 if my_direction_is_buy == target_direction_is_buy and my_leverage == target_leverage:
                     # ✅ 一致 -> 监控盈利
-                    my_position_size = abs(float(my_btc_position["szi"]))
+                    my_position_size = my_btc_position.size
                     my_position_value = my_position_size * btc_price
                     print(f"🟢 持仓正常，与目标一致。当前仓位价值: ${my_position_value:.2f}")
 
@@ -103,13 +114,14 @@ def main():
             
             # --- d. 休眠 ---
             print(f"等待 {LOOP_SLEEP_SECONDS} 秒后进入下一轮...")
-            time.sleep(LOOP_SLEEP_SECONDS)
+            cycle.sleep(LOOP_SLEEP_SECONDS)
 
     except KeyboardInterrupt:
         print("\n检测到手动中断 (Ctrl+C)，机器人正在关闭...")
     except Exception as e:
         print(f"\n❌ 发生未知错误: {e}")
     finally:
+        execution.teardown(exchange, info)
         print("程序已退出。")
 
 
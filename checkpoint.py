@@ -0,0 +1,83 @@
+"""
+策略运行状态的持久化：进程崩溃或被 start.sh 重启后恢复冷却、止损计数、波动率历史和当日选币。
+
+使用 SQLite WAL 模式，每个值以 JSON 存一行，按 (scope, key) 索引；scope 区分账户和 API 地址，
+本地 mock_server 的运行不会覆盖主网状态。save() 只写入与上次相比有变化的键，并在一个事务内提交，
+进程在任意时刻被杀掉时库里要么是上一轮、要么是这一轮的完整状态。
+
+回放（HL_REPLAY）时不读写状态文件。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from replay import REPLAY_ENV
+
+
+class CheckpointStore:
+    def __init__(self, path, scope):
+        self.path = path
+        self.scope = scope
+        self.lock = threading.Lock()
+        self.saved = {}     # key -> 上次写入的 JSON 文本，用于增量写入
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 下 NORMAL 只在断电时可能丢失最后一次提交，进程崩溃不会丢失
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "scope TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated REAL NOT NULL, "
+            "PRIMARY KEY (scope, key))"
+        )
+
+    def load(self):
+        """返回 {key: 值}，并记住已存的内容"""
+        with self.lock:
+            rows = self.conn.execute("SELECT key, value FROM state WHERE scope = ?", (self.scope,)).fetchall()
+            self.saved = dict(rows)
+        return {key: json.loads(value) for key, value in rows}
+
+    def save(self, values):
+        """只写入变化的键，返回写入的键数"""
+        now = time.time()
+        with self.lock:
+            changed = []
+            for key, value in values.items():
+                text = json.dumps(value, separators=(",", ":"))
+                if self.saved.get(key) != text:
+                    changed.append((self.scope, key, text, now))
+            if not changed:
+                return 0
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany("INSERT OR REPLACE INTO state (scope, key, value, updated) VALUES (?, ?, ?, ?)", changed)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            for _, key, text, _ in changed:
+                self.saved[key] = text
+            return len(changed)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM state WHERE scope = ?", (self.scope,))
+            self.saved = {}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def scope_for(address, base_url):
+    return f"{address.lower()}@{urlparse(base_url).netloc or base_url}"
+
+
+def open_store(path, address, base_url):
+    """path 为空或正在回放时返回None（不持久化）"""
+    if not path or os.environ.get(REPLAY_ENV):
+        return None
+    return CheckpointStore(path, scope_for(address, base_url))
@@ -0,0 +1,128 @@
+"""
+按币种隔离的策略状态：平滑波动率与止损触发计数。
+
+RollingMean 用定长 deque 加累计和维护最近 N 个样本的均值，WindowCounter 只保留时间窗口内最近的 capacity 个
+时间戳；两者每次更新都是 O(1)、内存固定，币种再多也不会互相影响。
+"""
+import math
+import time
+from collections import deque
+
+
+class RollingMean:
+    """最近 size 个样本的均值"""
+
+    # 每累计这么多次更新重新求和一次，避免浮点加减误差不断累积
+    RESUM_EVERY = 1000
+
+    def __init__(self, size):
+        self.values = deque(maxlen=size)
+        self.total = 0.0
+        self.updates = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value):
+        """加入一个样本并返回当前均值"""
+        values = self.values
+        if len(values) == values.maxlen:
+            self.total -= values[0]
+        values.append(value)
+        self.total += value
+        self.updates += 1
+        if self.updates % self.RESUM_EVERY == 0:
+            self.total = math.fsum(values)
+        return self.mean()
+
+    def mean(self):
+        return self.total / len(self.values) if self.values else None
+
+    def snapshot(self):
+        return list(self.values)
+
+    def restore(self, values):
+        self.values.clear()
+        self.values.extend(values)
+        self.total = math.fsum(self.values)
+
+
+class WindowCounter:
+    """最近 window 秒内的事件次数，最多记到 capacity 次（达到确认次数即可，多余的旧事件丢弃）"""
+
+    def __init__(self, window, capacity, clock=time.time):
+        self.window = window
+        self.clock = clock
+        self.times = deque(maxlen=capacity)
+
+    def _expire(self, now):
+        times = self.times
+        while times and now - times[0] > self.window:
+            times.popleft()
+
+    def add(self):
+        """记录一次事件，返回窗口内的次数"""
+        now = self.clock()
+        self.times.append(now)
+        self._expire(now)
+        return len(self.times)
+
+    def count(self):
+        self._expire(self.clock())
+        return len(self.times)
+
+    def clear(self):
+        self.times.clear()
+
+    def snapshot(self):
+        return list(self.times)
+
+    def restore(self, times):
+        self.times.clear()
+        self.times.extend(times)
+        self._expire(self.clock())
+
+
+class CoinState:
+    """单个币种的止损状态"""
+
+    def __init__(self, vol_samples, loss_window, loss_confirm, clock=time.time):
+        self.vol = RollingMean(vol_samples)
+        self.losses = WindowCounter(loss_window, loss_confirm, clock)
+
+    def snapshot(self):
+        return {"vol": self.vol.snapshot(), "losses": self.losses.snapshot()}
+
+    def restore(self, state):
+        self.vol.restore(state.get("vol") or [])
+        self.losses.restore(state.get("losses") or [])
+
+
+class CoinStates:
+    """币种 -> CoinState，首次用到时创建"""
+
+    def __init__(self, vol_samples, loss_window, loss_confirm, clock=time.time):
+        self.vol_samples = vol_samples
+        self.loss_window = loss_window
+        self.loss_confirm = loss_confirm
+        self.clock = clock
+        self.states = {}
+
+    def __getitem__(self, coin):
+        state = self.states.get(coin)
+        if state is None:
+            state = self.states[coin] = CoinState(self.vol_samples, self.loss_window, self.loss_confirm, self.clock)
+        return state
+
+    def __len__(self):
+        return len(self.states)
+
+    def clear(self):
+        self.states.clear()
+
+    def snapshot(self):
+        return {coin: state.snapshot() for coin, state in self.states.items()}
+
+    def restore(self, states):
+        for coin, state in states.items():
+            self[coin].restore(state)
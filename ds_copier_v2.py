@@ -24,7 +24,21 @@ import json
 import math
 import logging
 import argparse
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 import example_utils
+import execution
+import fill_copier
+import heartbeat
+import log_pipeline
+import meta_cache
+import metrics
+import request_scheduler
+import transport
+import twap
+from account_state import AccountSnapshot
+from order_batch import OrderBatch, QUEUED_RESULT, is_complete
 from hyperliquid.utils import constants
 
 # --- 核心配置参数 ---
@@ -44,17 +58,34 @@ TARGET_COINS = ["XRP", "DOGE", "BTC", "ETH", "SOL", "BNB"]
 
 LOOP_SLEEP_SECONDS = 30
 
+# 交易所最小下单名义价值 (USD)
+MIN_NOTIONAL_VALUE = 10
+
+# 流模式 (--stream) 下的 REST 全量对账间隔，作为 websocket 事件丢失时的兜底
+STREAM_RECONCILE_SECONDS = 300
+
+# 成交驱动模式 (--fills) 下同一币种的成交合并窗口（秒），窗口内的小额成交合并后再下单以满足最小下单金额
+FILL_BATCH_SECONDS = 1.0
+
 # 全局变量，由命令行参数决定
 DRY_RUN = True
 
-def get_position_info(user_state, coin_name):
-    """从完整的用户状态中，查找并返回指定币种的持仓详情，如果不存在则返回None"""
-    asset_positions = user_state.get("assetPositions", [])
-    for position in asset_positions:
-        if position.get("position", {}).get("coin") == coin_name:
-            if float(position["position"]["szi"]) != 0:
-                return position["position"]
-    return None
+# 大单拆分 (--twap)：跟单地址 -> twap.SliceScheduler，未开启时为空
+slicers = {}
+
+# 调仓统计：新的差额调仓 vs 旧的平仓后重开
+rebalance_stats = {"orders": 0, "legacy_orders": 0, "fees": 0.0, "legacy_fees": 0.0}
+rebalance_lock = threading.Lock()   # 多账户模式下各账户在不同线程中累加
+
+# 多账户模式下当前线程正在同步的账户名，AccountLogFilter 据此给日志加上账户
+current_account = contextvars.ContextVar("current_account", default="main")
+
+def position_fingerprint(account, coin_name):
+    """返回用于判断仓位是否变化的指纹 (szi, 杠杆)，无仓位时返回None"""
+    position = account.get(coin_name)
+    if not position:
+        return None
+    return (position.szi, position.leverage)
 
 def execute_action(action_msg, function, *args, **kwargs):
     """根据 DRY_RUN 模式决定是打印模拟操作还是真实执行"""
@@ -65,54 +96,80 @@ def execute_action(action_msg, function, *args, **kwargs):
         logging.info(f"[LIVE] {action_msg}")
         return function(*args, **kwargs)
 
-def process_coin(exchange, info, all_mids, my_address, target_user_state, my_user_state, coin, meta_data):
-    """处理单个币种的跟单逻辑"""
-    logging.info(f"--- Processing {coin} ---")
+def place_market_open(exchange, batch, action_msg, coin, is_buy, sz):
+    """开仓/加仓：传入 batch 时只加入本轮批次，否则立即执行"""
+    if batch is not None:
+        return batch.market_open(coin, is_buy, sz, label=action_msg)
+    return execute_action(action_msg, exchange.market_open, coin, is_buy, sz, None, 0.01)
+
+def place_market_close(exchange, batch, action_msg, coin, position_szi, sz=None):
+    """只减仓平仓，position_szi 为当前带符号持仓，sz 为空时全部平掉"""
+    if batch is not None:
+        return batch.market_close(coin, position_szi, sz, label=action_msg)
+    if sz is None:
+        return execute_action(action_msg, exchange.market_close, coin)
+    return execute_action(action_msg, exchange.market_close, coin, sz)
+
+def place_leverage_update(exchange, batch, action_msg, coin, leverage):
+    if batch is not None:
+        return batch.update_leverage(leverage, coin, is_cross=False, label=action_msg)
+    return execute_action(action_msg, exchange.update_leverage, leverage, coin, is_cross=False)
+
+def process_coin(exchange, info, all_mids, my_address, target_account, my_account, coin, metas, copy_ratio=None, batch=None):
+    """处理单个币种的跟单逻辑，账户为 AccountSnapshot；copy_ratio 默认为 COPY_NOTIONAL_RATIO；传入 batch 时订单留到本轮末尾批量提交
+
+    返回本币种的决策（"in_sync"、"open"、"rebalance"、"flip"、"close"、"flat"、"skip"），用于结构化事件。
+    """
+    if copy_ratio is None:
+        copy_ratio = COPY_NOTIONAL_RATIO
+    # 每轮每个账户的每个币种都会输出，按账户和币种抽样
+    logging.info(f"--- Processing {coin} ---", extra={"sample": ("processing", my_address, coin)})
     
     mid_price = float(all_mids.get(coin, 0))
     if mid_price == 0:
         logging.warning(f"Could not get mid price for {coin}, skipping.")
-        return
+        return "skip"
 
-    asset_info = next((item for item in meta_data["universe"] if item["name"] == coin), None)
+    asset_info = metas.get(coin)
     if not asset_info:
         logging.warning(f"Could not find metadata for {coin}, skipping.")
-        return
-    sz_decimals = asset_info["szDecimals"]
+        return "skip"
+    sz_decimals = asset_info.sz_decimals
 
-    target_position = get_position_info(target_user_state, coin)
-    my_position = get_position_info(my_user_state, coin)
+    target_position = target_account.get(coin)
+    my_position = my_account.get(coin)
 
     if not target_position:
-        logging.info(f"Target does not have a position in {coin}.")
+        logging.info(f"Target does not have a position in {coin}.", extra={"sample": ("flat", my_address, coin)})
         if my_position:
             action_msg = f"Closing {coin} position to match target."
-            close_result = execute_action(action_msg, exchange.market_close, coin)
+            close_result = place_market_close(exchange, batch, action_msg, coin, my_position.szi)
             logging.info(f"Close result: {json.dumps(close_result)}")
-        return
+            return "close"
+        return "flat"
 
-    target_direction_is_buy = float(target_position["szi"]) > 0
-    target_leverage = int(target_position["leverage"]["value"])
-    target_szi_abs = abs(float(target_position["szi"]))
+    target_direction_is_buy = target_position.is_long
+    target_leverage = target_position.leverage
+    target_szi_abs = target_position.size
     target_notional_value = target_szi_abs * mid_price
     
-    my_target_szi_abs = target_szi_abs * COPY_NOTIONAL_RATIO
+    my_target_szi_abs = target_szi_abs * copy_ratio
     my_target_notional_value = my_target_szi_abs * mid_price
     
-    MIN_NOTIONAL_VALUE = 10 
     if my_target_notional_value < MIN_NOTIONAL_VALUE:
         logging.warning(f"Target {coin} position scaled value is ${my_target_notional_value:,.2f}, which is below the minimum of ${MIN_NOTIONAL_VALUE}. Skipping.")
         if my_position:
             action_msg = f"Closing {coin} because target's scaled position is too small to copy."
-            close_result = execute_action(action_msg, exchange.market_close, coin)
+            close_result = place_market_close(exchange, batch, action_msg, coin, my_position.szi)
             logging.info(f"Close result: {json.dumps(close_result)}")
-        return
+            return "close"
+        return "skip"
 
     rounded_my_target_szi_abs = round(my_target_szi_abs, sz_decimals)
     
     if rounded_my_target_szi_abs == 0:
         logging.warning(f"Calculated {coin} position size is 0 after rounding (from: {my_target_szi_abs}). Cannot open position, skipping.")
-        return
+        return "skip"
         
     if my_position is None:
         logging.info(f"Target has {'Long' if target_direction_is_buy else 'Short'} {coin} ({target_leverage}x). We have no position. Opening new position.")
@@ -121,49 +178,426 @@ def process_coin(exchange, info, all_mids, my_address, target_user_state, my_use
         
         try:
             leverage_msg = f"Updating {coin} leverage to {target_leverage}x (Isolated)"
-            execute_action(leverage_msg, exchange.update_leverage, target_leverage, coin, is_cross=False)
+            place_leverage_update(exchange, batch, leverage_msg, coin, target_leverage)
             
             order_msg = f"Market {'Buy' if target_direction_is_buy else 'Sell'} {rounded_my_target_szi_abs} {coin}"
-            order_result = execute_action(order_msg, exchange.market_open, coin, target_direction_is_buy, rounded_my_target_szi_abs, None, 0.01)
+            order_result = place_market_open(exchange, batch, order_msg, coin, target_direction_is_buy, rounded_my_target_szi_abs)
             logging.info(f"Open result: {json.dumps(order_result)}")
         except Exception as e:
             logging.error(f"Failed to open position for {coin}: {e}", exc_info=True)
-            
+        return "open"
+
     else:
-        my_direction_is_buy = float(my_position["szi"]) > 0
-        my_leverage = int(my_position["leverage"]["value"])
-        my_szi_abs = abs(float(my_position["szi"]))
+        my_direction_is_buy = my_position.is_long
+        my_leverage = my_position.leverage
+        my_szi_abs = my_position.size
 
-        if my_direction_is_buy == target_direction_is_buy and my_leverage == target_leverage:
-            szi_diff = abs(my_szi_abs - rounded_my_target_szi_abs)
-            szi_tolerance = rounded_my_target_szi_abs * SZI_TOLERANCE_RATIO
+        if my_direction_is_buy != target_direction_is_buy:
+            flip_position(exchange, batch, coin, my_direction_is_buy, my_szi_abs, target_direction_is_buy, target_leverage, rounded_my_target_szi_abs, mid_price)
+            return "flip"
 
-            if szi_diff <= szi_tolerance:
-                my_position_value = my_szi_abs * mid_price
-                logging.info(f"{coin} position is in sync with target. My notional value: ${my_position_value:,.2f}")
-            else:
-                logging.warning(f"{coin} position size mismatch! (My: {my_szi_abs:.5f}, Target should be: {rounded_my_target_szi_abs:.5f}). Re-syncing.")
-                action_msg = f"Closing {coin} to re-sync position size."
-                close_result = execute_action(action_msg, exchange.market_close, coin)
+        legacy_orders = 0
+        if my_leverage != target_leverage:
+            logging.warning(f"{coin} leverage mismatch (Me: {my_leverage}x, Target: {target_leverage}x). Updating leverage in place.")
+            leverage_msg = f"Updating {coin} leverage to {target_leverage}x (Isolated) on open position"
+            leverage_result = execute_action(leverage_msg, exchange.update_leverage, target_leverage, coin, is_cross=False)
+            if leverage_result.get("status") != "ok":
+                logging.warning(f"In-place leverage update for {coin} rejected: {json.dumps(leverage_result)}. Closing to re-sync position policy.")
+                action_msg = f"Closing {coin} to re-sync position policy."
+                close_result = place_market_close(exchange, batch, action_msg, coin, my_position.szi)
                 logging.info(f"Close result: {json.dumps(close_result)}")
+                return "close"
+            # 旧逻辑会平仓后下一轮再开仓，这里只需按差额调整
+            legacy_orders = 2
+
+        szi_diff = rounded_my_target_szi_abs - my_szi_abs
+        szi_tolerance = rounded_my_target_szi_abs * SZI_TOLERANCE_RATIO
+
+        if abs(szi_diff) <= szi_tolerance:
+            my_position_value = my_szi_abs * mid_price
+            # 仓位一致时每轮都会输出同样的消息，按账户和币种抽样（多账户时各账户分别抽样）
+            logging.info(f"{coin} position is in sync with target. My notional value: ${my_position_value:,.2f}",
+                         extra={"sample": ("in_sync", my_address, coin)})
+            if legacy_orders:
+                record_rebalance(coin, 0, 0, legacy_orders, my_szi_abs + rounded_my_target_szi_abs, mid_price)
+            return "in_sync"
+
+        logging.warning(f"{coin} position size mismatch! (My: {my_szi_abs:.5f}, Target should be: {rounded_my_target_szi_abs:.5f}). Rebalancing by delta.")
+        rebalance_position(exchange, batch, coin, target_direction_is_buy, my_szi_abs, rounded_my_target_szi_abs, sz_decimals, mid_price)
+        return "rebalance"
+
+def rebalance_position(exchange, batch, coin, is_buy, my_szi_abs, target_szi_abs, sz_decimals, mid_price):
+    """同方向仓位按差额下一笔加仓单或只减仓单，而不是平仓后重新开仓"""
+    szi_diff = target_szi_abs - my_szi_abs
+    delta_szi = round(abs(szi_diff), sz_decimals)
+    if delta_szi == 0:
+        logging.info(f"{coin} size delta rounds to 0 at {sz_decimals} decimals, nothing to do.")
+        return
+
+    if szi_diff > 0:
+        if delta_szi * mid_price < MIN_NOTIONAL_VALUE:
+            logging.warning(f"{coin} increase of {delta_szi} (${delta_szi * mid_price:,.2f}) is below the ${MIN_NOTIONAL_VALUE} minimum order value. Skipping.")
+            return
+        action_msg = f"Market {'Buy' if is_buy else 'Sell'} {delta_szi} {coin} to increase position to {target_szi_abs}"
+        result = place_market_open(exchange, batch, action_msg, coin, is_buy, delta_szi)
+    else:
+        action_msg = f"Reduce-only {'Sell' if is_buy else 'Buy'} {delta_szi} {coin} to reduce position to {target_szi_abs}"
+        result = place_market_close(exchange, batch, action_msg, coin, my_szi_abs if is_buy else -my_szi_abs, delta_szi)
+    logging.info(f"Rebalance result: {json.dumps(result)}")
+    record_rebalance(coin, 1, delta_szi, 2, my_szi_abs + target_szi_abs, mid_price)
+
+def flip_position(exchange, batch, coin, my_is_buy, my_szi_abs, target_is_buy, target_leverage, target_szi_abs, mid_price):
+    """方向相反时：只减仓平掉现有仓位，在空仓状态下设置杠杆，并在同一轮内反向开仓
+
+    批量模式下三步分别进入批次的减仓、杠杆、开仓阶段，提交顺序不变。
+    """
+    logging.warning(f"{coin} direction mismatch (Me: {'Long' if my_is_buy else 'Short'}, Target: {'Long' if target_is_buy else 'Short'}). Flipping position.")
+    try:
+        action_msg = f"Reduce-only close of {my_szi_abs} {coin} before flip."
+        close_result = place_market_close(exchange, batch, action_msg, coin, my_szi_abs if my_is_buy else -my_szi_abs)
+        logging.info(f"Close result: {json.dumps(close_result)}")
+        if not close_completed(close_result, my_szi_abs):
+            logging.error(f"Flip aborted for {coin}: close was rejected or only partly filled.")
+            return
+
+        leverage_msg = f"Updating {coin} leverage to {target_leverage}x (Isolated)"
+        place_leverage_update(exchange, batch, leverage_msg, coin, target_leverage)
+
+        order_msg = f"Market {'Buy' if target_is_buy else 'Sell'} {target_szi_abs} {coin}"
+        order_result = place_market_open(exchange, batch, order_msg, coin, target_is_buy, target_szi_abs)
+        logging.info(f"Open result: {json.dumps(order_result)}")
+        record_rebalance(coin, 2, my_szi_abs + target_szi_abs, 2, my_szi_abs + target_szi_abs, mid_price)
+    except Exception as e:
+        logging.error(f"Failed to flip position for {coin}: {e}", exc_info=True)
+
+def close_completed(close_result, sz):
+    """平仓是否已全部成交。批量模式下平仓只是入队，由 OrderBatch 在减仓未完全成交时跳过同币种的开仓；
+    立即执行时逐单检查 response.data.statuses，被拒或 IOC 部分成交都不算完成"""
+    if close_result is QUEUED_RESULT or (close_result or {}).get("response", {}).get("type") == "dry_run":
+        return True
+    if not close_result or close_result.get("status") != "ok":
+        return False
+    statuses = close_result["response"]["data"]["statuses"]
+    return bool(statuses) and all(is_complete({"sz": sz}, status) for status in statuses)
+
+def record_rebalance(coin, orders, traded_szi, legacy_orders, legacy_szi, mid_price):
+    """累计调仓的订单数和估算手续费（按吃单费率），与旧的“平仓后重开”做法对比"""
+    fee = traded_szi * mid_price * execution.TAKER_FEE_RATE
+    legacy_fee = legacy_szi * mid_price * execution.TAKER_FEE_RATE
+    with rebalance_lock:
+        rebalance_stats["orders"] += orders
+        rebalance_stats["legacy_orders"] += legacy_orders
+        rebalance_stats["fees"] += fee
+        rebalance_stats["legacy_fees"] += legacy_fee
+    if DRY_RUN:
+        logging.info(f"[DRY RUN] {coin} rebalance: {orders} order(s) vs {legacy_orders} with close-and-reopen, "
+                     f"est. fee ${fee:.4f} vs ${legacy_fee:.4f} (saved ${legacy_fee - fee:.4f})")
+
+def log_rebalance_summary():
+    if not rebalance_stats["legacy_orders"]:
+        return
+    saved = rebalance_stats["legacy_fees"] - rebalance_stats["fees"]
+    logging.info(f"Rebalance totals: {rebalance_stats['orders']} order(s) vs {rebalance_stats['legacy_orders']} with close-and-reopen, "
+                 f"est. fees ${rebalance_stats['fees']:.4f} vs ${rebalance_stats['legacy_fees']:.4f} (saved ${saved:.4f})")
+
+def sync_coins(exchange, info, all_mids, my_address, target_account, my_account, coins, metas, copy_ratio=None):
+    """对一组币种执行同步：先收集所有动作，再以批量订单一次提交，返回各订单结果"""
+    slicer = slicers.get(my_address)
+    batch = OrderBatch(exchange, dry_run=DRY_RUN, log=logging.info, slicer=slicer)
+    for coin in coins:
+        if slicer and slicer.active(coin):
+            # 拆单任务进行中，仓位尚未到位，本轮不再同步该币种
+            logging.info(f"{coin}: TWAP job in progress, skipping this cycle.")
+            continue
+        started = time.perf_counter()
+        decision = process_coin(exchange, info, all_mids, my_address, target_account, my_account, coin, metas, copy_ratio, batch)
+        log_pipeline.event("decision", account=my_address, coin=coin, decision=decision, ms=round((time.perf_counter() - started) * 1000, 3))
+    started = time.perf_counter()
+    results = batch.submit(all_mids)
+    if results:
+        logging.info(f"Submitted {len(results)} action(s) for {len({action['coin'] for action, _ in results})} coin(s) in {(time.perf_counter() - started) * 1000:.0f} ms.")
+    log_rebalance_summary()
+    return results
+
+class StreamState:
+    """websocket 回调线程与主循环之间共享的行情和脏币种集合"""
+
+    def __init__(self, coins):
+        self.coins = set(coins)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.all_mids = {}
+        self.dirty_coins = set()
+
+    def on_all_mids(self, msg):
+        mids = msg.get("data", {}).get("mids", {})
+        with self.lock:
+            self.all_mids.update(mids)
+
+    def on_user_fills(self, msg):
+        data = msg.get("data", {})
+        # 订阅后的第一条消息是历史成交快照，不代表新的仓位变化
+        if data.get("isSnapshot"):
+            return
+        coins = {fill.get("coin") for fill in data.get("fills", [])} & self.coins
+        if not coins:
+            return
+        with self.lock:
+            self.dirty_coins |= coins
+        self.wakeup.set()
+
+    def take_dirty_coins(self):
+        # 先清事件再取集合，避免丢掉两步之间到达的通知
+        self.wakeup.clear()
+        with self.lock:
+            coins, self.dirty_coins = self.dirty_coins, set()
+        return coins
+
+    def mids(self):
+        with self.lock:
+            return dict(self.all_mids)
+
+
+cycle = metrics.CycleTimer("ds_copier_v2")
+
+
+def run_stream(exchange, info, my_address, metas):
+    """事件驱动的同步循环：只处理发生成交的币种，并定期做一次 REST 全量对账"""
+    stream = StreamState(TARGET_COINS)
+    info.subscribe({"type": "allMids"}, stream.on_all_mids)
+    info.subscribe({"type": "userFills", "user": TARGET_USER_ADDRESS}, stream.on_user_fills)
+    info.subscribe({"type": "userFills", "user": my_address}, stream.on_user_fills)
+    logging.info(f"Streaming mode: subscribed to allMids and userFills (target + self). REST reconcile every {STREAM_RECONCILE_SECONDS}s.")
+
+    fingerprints = {}
+    next_reconcile = 0
+    while True:
+        now = time.time()
+        reconcile = now >= next_reconcile
+        if not reconcile:
+            heartbeat.beat(next_reconcile - now)
+            stream.wakeup.wait(timeout=next_reconcile - now)
+            coins = stream.take_dirty_coins()
+            if not coins:
+                continue
+        cycle.start()
+        try:
+            all_mids = stream.mids() if not reconcile else {}
+            if not all_mids:
+                all_mids = info.all_mids()
+            target_account = AccountSnapshot.fetch(info, TARGET_USER_ADDRESS)
+            my_account = AccountSnapshot.fetch(info, my_address)
+
+            if reconcile:
+                logging.info(f"----- {time.strftime('%Y-%m-%d %H:%M:%S')} - REST reconciliation pass -----")
+                changed_coins = TARGET_COINS
+                next_reconcile = time.time() + STREAM_RECONCILE_SECONDS
+            else:
+                changed_coins = []
+                for coin in TARGET_COINS:
+                    if coin not in coins:
+                        continue
+                    fingerprint = (position_fingerprint(target_account, coin), position_fingerprint(my_account, coin))
+                    if fingerprints.get(coin) != fingerprint:
+                        changed_coins.append(coin)
+                logging.info(f"Fill event for {sorted(coins)}, state changed for {changed_coins}.")
+
+            for coin in changed_coins:
+                fingerprints[coin] = (position_fingerprint(target_account, coin), position_fingerprint(my_account, coin))
+            if changed_coins:
+                sync_coins(exchange, info, all_mids, my_address, target_account, my_account, changed_coins, metas)
+        except Exception as e:
+            logging.error(f"An error occurred during the stream cycle: {e}", exc_info=True)
+            # 出错后尽快用一次全量对账恢复
+            next_reconcile = time.time() + LOOP_SLEEP_SECONDS
+        cycle.stop()
+
+def copy_fills(exchange, info, my_address, metas, ready, all_mids):
+    """按累计的目标成交下单；只有包含目标减仓/反向的成交才查询我方仓位，纯加仓直接下单"""
+    my_account = AccountSnapshot.fetch(info, my_address) if any(p.reduces for p in ready) else None
+    slicer = slicers.get(my_address)
+    batch = OrderBatch(exchange, dry_run=DRY_RUN, log=logging.info, slicer=slicer)
+    carried = []
+    for pending in ready:
+        coin = pending.coin
+        if slicer and slicer.active(coin):
+            # 拆单任务进行中：成交全部结转，任务结束后随下一批成交或全量对账一起处理
+            carried.append((pending, pending.szi))
+            continue
+        price = float(all_mids.get(coin) or pending.px)
+        sz_decimals = metas.sz_decimals(coin, 2)
+        my_szi = None
+        if my_account is not None:
+            position = my_account.get(coin)
+            my_szi = position.szi if position else 0.0
+        actions, carry = fill_copier.plan_fill(pending, my_szi, sz_decimals, price, MIN_NOTIONAL_VALUE)
+        logging.info(f"{coin}: {pending.fills} target fill(s) -> copy {pending.szi:+.6f} @ ~{pending.px:.6g}, "
+                     f"target now {pending.target_szi:+.6f} (scaled), my position {my_szi}")
+        for action in actions:
+            if action[0] == "close":
+                sz = action[1]
+                action_msg = f"Reduce-only {'full close' if sz is None else sz} of {coin} following target fill"
+                place_market_close(exchange, batch, action_msg, coin, my_szi, sz)
+            else:
+                _, is_buy, sz = action
+                action_msg = f"Market {'Buy' if is_buy else 'Sell'} {sz} {coin} following target fill"
+                place_market_open(exchange, batch, action_msg, coin, is_buy, sz)
+        if carry:
+            carried.append((pending, carry))
+    results = batch.submit(all_mids) if len(batch) else []
+    return results, carried
+
+def run_fills(exchange, info, my_address, metas):
+    """成交驱动的跟单：目标每笔成交按跟单比例跟随，FILL_BATCH_SECONDS 内的成交合并下单；定期 REST 全量对账兜底"""
+    stream = StreamState(TARGET_COINS)
+    fills = fill_copier.FillAggregator(TARGET_COINS, COPY_NOTIONAL_RATIO, FILL_BATCH_SECONDS)
+    info.subscribe({"type": "allMids"}, stream.on_all_mids)
+    info.subscribe({"type": "userFills", "user": TARGET_USER_ADDRESS}, fills.on_user_fills)
+    logging.info(f"Fill mode: mirroring target fills x{COPY_NOTIONAL_RATIO}, batched over {FILL_BATCH_SECONDS}s. "
+                 f"REST reconcile every {STREAM_RECONCILE_SECONDS}s.")
+
+    next_reconcile = 0
+    while True:
+        now = time.time()
+        if now < next_reconcile:
+            due = fills.due()
+            timeout = min(next_reconcile - now, due if due is not None else STREAM_RECONCILE_SECONDS)
+            heartbeat.beat(timeout)
+            fills.wakeup.wait(timeout=timeout)
+            # 先清事件再取成交，避免丢掉两步之间到达的通知
+            fills.wakeup.clear()
+            ready = fills.take_ready()
+            if not ready:
+                continue
         else:
-            policy_mismatches = []
-            if my_direction_is_buy != target_direction_is_buy:
-                policy_mismatches.append(f"direction (Me: {'Long' if my_direction_is_buy else 'Short'}, Target: {'Long' if target_direction_is_buy else 'Short'})")
-            if my_leverage != target_leverage:
-                policy_mismatches.append(f"leverage (Me: {my_leverage}x, Target: {target_leverage}x)")
-            
-            logging.warning(f"{coin} position policy mismatch! Mismatches: {', '.join(policy_mismatches)}. Re-syncing.")
-            action_msg = f"Closing {coin} to re-sync position policy."
-            close_result = execute_action(action_msg, exchange.market_close, coin)
-            logging.info(f"Close result: {json.dumps(close_result)}")
+            ready = None
+        cycle.start()
+        try:
+            if ready is None:
+                logging.info(f"----- {time.strftime('%Y-%m-%d %H:%M:%S')} - REST reconciliation pass -----")
+                # 对账按最新仓位整体同步，此前累计但未执行的成交已包含在内
+                dropped = fills.discard()
+                if dropped:
+                    logging.info(f"Dropping pending fills for {dropped}, covered by reconciliation.")
+                all_mids = info.all_mids()
+                target_account = AccountSnapshot.fetch(info, TARGET_USER_ADDRESS)
+                my_account = AccountSnapshot.fetch(info, my_address)
+                sync_coins(exchange, info, all_mids, my_address, target_account, my_account, TARGET_COINS, metas)
+                next_reconcile = time.time() + STREAM_RECONCILE_SECONDS
+            else:
+                all_mids = stream.mids() or info.all_mids()
+                results, carried = copy_fills(exchange, info, my_address, metas, ready, all_mids)
+                for pending, szi in carried:
+                    fills.carry(pending, szi)
+                if carried:
+                    logging.info(f"Carrying {', '.join(f'{p.coin} {szi:+.6f}' for p, szi in carried)} until more fills arrive.")
+                if results:
+                    logging.info(f"Submitted {len(results)} action(s) for {len(ready)} coin(s) from target fills.")
+        except Exception as e:
+            logging.error(f"An error occurred while copying fills: {e}", exc_info=True)
+            next_reconcile = time.time() + LOOP_SLEEP_SECONDS
+        cycle.stop()
+
+class AccountLogFilter(logging.Filter):
+    """给日志记录加上 account 字段：当前线程正在同步的账户名，不在账户同步中时为 main"""
+
+    def filter(self, record):
+        record.account = current_account.get()
+        return True
+
+def sync_account(account, info, all_mids, target_account, metas):
+    """多账户模式下同步一个账户：只拉取该账户自己的仓位，行情和目标仓位由调用方共享"""
+    # 只在本次同步期间标记账户，线程池的工作线程归还时恢复原值
+    token = current_account.set(account.name)
+    try:
+        my_account = AccountSnapshot.fetch(info, account.address)
+        return sync_coins(account.exchange, info, all_mids, account.address, target_account, my_account, TARGET_COINS, metas,
+                          account.config.get("copy_ratio"))
+    finally:
+        current_account.reset(token)
+
+def sync_accounts(executor, accounts, info, metas):
+    """行情和目标仓位每轮只拉取一次，与账户数量无关；各账户的仓位查询、计算和下单并发执行"""
+    all_mids = info.all_mids()
+    target_account = AccountSnapshot.fetch(info, TARGET_USER_ADDRESS)
+    futures = [(account, executor.submit(sync_account, account, info, all_mids, target_account, metas)) for account in accounts]
+    for account, future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            logging.error(f"[{account.name}] Sync failed: {e}", exc_info=True)
+
+def run_accounts(args):
+    """多账户模式：config.json 的 accounts 中每个账户按各自的 copy_ratio 跟随同一目标"""
+    try:
+        info, accounts = example_utils.setup_accounts(base_url=args.base_url)
+        metas = meta_cache.get_meta_cache(info)
+    except Exception as e:
+        logging.error(f"Failed to setup accounts: {e}", exc_info=True)
+        return
+    # 所有账户共用 info 的连接，连接池大小与并发数一致
+    transport.tune_session(info.session, max(len(accounts), transport.POOL_SIZE))
+    if args.metrics_port:
+        info, _ = metrics.setup(args.metrics_port, info, None)
+        accounts = [account._replace(exchange=metrics.InstrumentedProxy(account.exchange, "exchange")) for account in accounts]
+    accounts = [account._replace(exchange=execution.setup(args.execution, info, account.exchange, account.address, log=logging.info))
+                for account in accounts]
+    if args.twap != "off":
+        for account in accounts:
+            slicers[account.address] = twap.SliceScheduler(account.exchange, info, metas, args.twap, dry_run=DRY_RUN, log=logging.info)
+
+    logging.info(f"Target Account Address: {TARGET_USER_ADDRESS}")
+    for account in accounts:
+        logging.info(f"Follower {account.name}: {account.address}, copy ratio {account.config.get('copy_ratio', COPY_NOTIONAL_RATIO) * 100:.4f}%")
+    logging.info(f"Monitored Coins: {TARGET_COINS}")
+
+    with ThreadPoolExecutor(max_workers=len(accounts)) as executor:
+        try:
+            while True:
+                cycle.start()
+                logging.info(f"----- {time.strftime('%Y-%m-%d %H:%M:%S')} - Starting cycle for {len(accounts)} account(s) -----")
+                try:
+                    sync_accounts(executor, accounts, info, metas)
+                except Exception as e:
+                    logging.error(f"An error occurred during the sync cycle: {e}", exc_info=True)
+                logging.info(f"Request budget: {request_scheduler.get_scheduler().summary()}")
+                if DRY_RUN:
+                    logging.info("----- Simulation run finished. -----")
+                    break
+                cycle.sleep(LOOP_SLEEP_SECONDS)
+        except KeyboardInterrupt:
+            logging.info("KeyboardInterrupt detected. Shutting down bot.")
+        finally:
+            shutdown_slicers()
+            for account in accounts:
+                execution.shutdown(account.exchange)
+            logging.info("--- Bot has been terminated. ---")
+
+def shutdown_slicers():
+    """停止拆单任务的后续子单并输出成交均价相对到达中间价的统计"""
+    for slicer in slicers.values():
+        slicer.shutdown()
+        logging.info(f"TWAP: {slicer.summary()}")
 
 def main():
     global DRY_RUN
     
     parser = argparse.ArgumentParser(description="A simple copy trading bot for Hyperliquid.")
     parser.add_argument('--live', action='store_true', help='Run the bot in live trading mode. Default is dry run.')
+    parser.add_argument('--base-url', default=constants.MAINNET_API_URL, help='API URL, e.g. a local mock_server.py for load testing.')
+    parser.add_argument('--stream', action='store_true', help='Event-driven mode: react to websocket fills instead of polling every LOOP_SLEEP_SECONDS.')
+    parser.add_argument('--fills', action='store_true', help="Fill-driven mode: mirror each of the target's websocket fills scaled by COPY_NOTIONAL_RATIO.")
+    parser.add_argument('--metrics-port', type=int, help='Expose Prometheus metrics (/metrics) on this port.')
+    parser.add_argument('--execution', choices=execution.EXECUTION_MODES, default='market', help='How market orders are executed: market = IOC with 1%% slippage, passive = post-only at top of book with chase and IOC fallback.')
+    parser.add_argument('--twap', choices=twap.MODES, default='off', help='Slice orders that are large relative to top-of-book depth into child orders paced by time or by visible volume.')
+    parser.add_argument('--accounts', action='store_true', help='Follow with every account listed under "accounts" in config.json, sharing one market-data feed.')
+    parser.add_argument('--events-file', default='ds_copier.events.jsonl', help="Structured JSON-lines events (cycle, decision, order latencies); '' disables.")
     args = parser.parse_args()
+    heartbeat.setup()
+    if args.accounts and (args.stream or args.fills):
+        parser.error("--accounts does not support --stream or --fills")
+    if args.stream and args.fills:
+        parser.error("--stream and --fills are mutually exclusive")
 
     DRY_RUN = not args.live
 
@@ -174,18 +608,21 @@ def main():
     if logger.hasHandlers():
         logger.handlers.clear()
         
-    fh = logging.FileHandler('ds_copier.log', mode='a')
+    fh = log_pipeline.rotating_file_handler('ds_copier.log')
     fh.setLevel(logging.INFO)
     
     ch = logging.StreamHandler()
     ch.setLevel(logging.INFO)
     
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    # 多账户模式下日志带上正在同步的账户名（AccountLogFilter 在记录日志的线程中填入）
+    log_format = '%(asctime)s - %(levelname)s - [%(account)s] %(message)s' if args.accounts else '%(asctime)s - %(levelname)s - %(message)s'
+    formatter = logging.Formatter(log_format, datefmt='%Y-%m-%d %H:%M:%S')
     fh.setFormatter(formatter)
     ch.setFormatter(formatter)
     
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    # 文件和控制台的写出都交给后台线程，磁盘卡顿不阻塞同步循环；重复的 "in sync" 等消息按币种抽样
+    log_pipeline.attach(logger, [fh, ch], filters=[AccountLogFilter()] if args.accounts else ())
+    log_pipeline.setup(args.events_file)
 
     logging.info("--- DS Copier Bot V2 Initializing ---")
     if DRY_RUN:
@@ -193,9 +630,15 @@ def main():
         logging.warning("--- To run in live mode, use the --live flag: python ds_copier_v2.py --live ---")
     else:
         logging.critical("--- ‼️ BOT IS RUNNING IN [LIVE] MODE. REAL TRADES WILL BE EXECUTED. ‼️ ---")
-    
+
+    if args.accounts:
+        run_accounts(args)
+        return
+
     try:
-        my_address, info, exchange = example_utils.setup(base_url=constants.MAINNET_API_URL)
+        my_address, info, exchange = example_utils.setup(base_url=args.base_url, skip_ws=not (args.stream or args.fills))
+        info, exchange = metrics.setup(args.metrics_port, info, exchange)
+        exchange = execution.setup(args.execution, info, exchange, my_address, log=logging.info)
     except Exception as e:
         logging.error(f"Failed to setup connection: {e}", exc_info=True)
         return
@@ -207,48 +650,56 @@ def main():
     logging.info(f"Monitored Coins: {TARGET_COINS}")
     
     try:
-        logging.info("Fetching exchange metadata...")
-        meta_data = info.meta()
+        logging.info("Loading exchange metadata...")
+        metas = meta_cache.get_meta_cache(info)
         logging.info("Target coin size decimals (szDecimals) check:")
         for coin in TARGET_COINS:
-            asset_info = next((item for item in meta_data["universe"] if item["name"] == coin), None)
+            asset_info = metas.get(coin)
             if asset_info:
-                logging.info(f"  - {coin}: {asset_info['szDecimals']} decimals")
+                logging.info(f"  - {coin}: {asset_info.sz_decimals} decimals")
             else:
                 logging.warning(f"  - {coin}: Could not find metadata!")
     except Exception as e:
         logging.error(f"Failed to fetch metadata: {e}", exc_info=True)
         return
+    if args.twap != "off":
+        slicers[my_address] = twap.SliceScheduler(exchange, info, metas, args.twap, dry_run=DRY_RUN, log=logging.info)
 
     try:
-        if DRY_RUN:
+        if args.stream:
+            run_stream(exchange, info, my_address, metas)
+        elif args.fills:
+            run_fills(exchange, info, my_address, metas)
+        elif DRY_RUN:
             logging.info(f"----- {time.strftime('%Y-%m-%d %H:%M:%S')} - Starting single simulation run -----")
             all_mids = info.all_mids()
-            target_user_state = info.user_state(TARGET_USER_ADDRESS)
-            my_user_state = info.user_state(my_address)
-            for coin in TARGET_COINS:
-                process_coin(exchange, info, all_mids, my_address, target_user_state, my_user_state, coin, meta_data)
+            target_account = AccountSnapshot.fetch(info, TARGET_USER_ADDRESS)
+            my_account = AccountSnapshot.fetch(info, my_address)
+            sync_coins(exchange, info, all_mids, my_address, target_account, my_account, TARGET_COINS, metas)
             logging.info("----- Simulation run finished. -----")
         else:
             while True:
+                cycle.start()
                 logging.info(f"----- {time.strftime('%Y-%m-%d %H:%M:%S')} - Starting new synchronization cycle -----")
                 try:
                     all_mids = info.all_mids()
-                    target_user_state = info.user_state(TARGET_USER_ADDRESS)
-                    my_user_state = info.user_state(my_address)
-                    for coin in TARGET_COINS:
-                        process_coin(exchange, info, all_mids, my_address, target_user_state, my_user_state, coin, meta_data)
+                    target_account = AccountSnapshot.fetch(info, TARGET_USER_ADDRESS)
+                    my_account = AccountSnapshot.fetch(info, my_address)
+                    sync_coins(exchange, info, all_mids, my_address, target_account, my_account, TARGET_COINS, metas)
                 except Exception as e:
                     logging.error(f"An error occurred during the sync cycle: {e}", exc_info=True)
                 
+                logging.info(f"Request budget: {request_scheduler.get_scheduler().summary()}")
                 logging.info(f"Cycle finished. Waiting for {LOOP_SLEEP_SECONDS} seconds...")
-                time.sleep(LOOP_SLEEP_SECONDS)
+                cycle.sleep(LOOP_SLEEP_SECONDS)
 
     except KeyboardInterrupt:
         logging.info("KeyboardInterrupt detected. Shutting down bot.")
     except Exception as e:
         logging.error(f"An unexpected critical error occurred: {e}", exc_info=True)
     finally:
+        shutdown_slicers()
+        execution.teardown(exchange, info, log=logging.warning)
         logging.info("--- Bot has been terminated. ---")
 
 
@@ -0,0 +1,194 @@
+"""
+EMA 趋势与波动率指标。
+
+每个 (币种, K线周期) 维护一个K线环形缓冲区：首次使用时回填一次历史K线，
+之后只通过 websocket 推送或拉取最新一两根K线来增量更新，
+EMA 与滚动波动率在每根新K线收盘时 O(1) 更新，热路径上不再整段下载K线。
+"""
+import math
+import threading
+import time
+from collections import deque
+
+EMA_FAST = 9                 # 快线周期
+EMA_SLOW = 21                # 慢线周期
+VOLATILITY_WINDOW = 20       # 波动率使用的收益率个数
+CANDLE_CAPACITY = 200        # 每个 (币种, 周期) 保留的已收盘K线数量
+REFRESH_MIN_SECONDS = 10     # 非推送模式下两次增量拉取的最小间隔
+STREAM_STALE_SECONDS = 120   # 推送超过该时长没有更新时回退到 REST 拉取
+
+INTERVAL_SECONDS = {
+    "1m": 60, "3m": 180, "5m": 300, "15m": 900, "30m": 1800,
+    "1h": 3600, "2h": 7200, "4h": 14400, "8h": 28800, "12h": 43200, "1d": 86400,
+}
+
+
+class CandleSeries:
+    """单个 (币种, 周期) 的K线缓冲区及增量指标"""
+
+    def __init__(self, coin, interval, capacity=CANDLE_CAPACITY):
+        self.coin = coin
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.closes = deque(maxlen=capacity)   # 已收盘K线的收盘价
+        self.open_time = None                  # 当前(未收盘)K线的开盘时间, 毫秒
+        self.current_close = None              # 当前(未收盘)K线的最新价
+        self.ema_fast = None                   # 基于已收盘K线的 EMA
+        self.ema_slow = None
+        self.returns = deque()                 # 最近 VOLATILITY_WINDOW 个收益率
+        self.returns_sum = 0.0
+        self.returns_sq_sum = 0.0
+        self.backfilled = False
+        self.streaming = False
+        self.last_update = 0.0
+        self.last_fetch = 0.0
+
+    # --- 数据输入 ---
+    def on_candle(self, candle):
+        """处理一根K线(REST 或 websocket 格式相同)，开盘时间前进时把上一根视为收盘"""
+        open_time = int(candle["t"])
+        close = float(candle["c"])
+        with self.lock:
+            if self.open_time is None or open_time == self.open_time:
+                self.open_time = open_time
+                self.current_close = close
+            elif open_time > self.open_time:
+                self._close_bar(self.current_close)
+                self.open_time = open_time
+                self.current_close = close
+            else:
+                return
+            self.last_update = time.time()
+
+    def on_ws_message(self, msg):
+        # 回填前的推送直接丢弃，回填会拉到最新K线
+        if self.backfilled:
+            self.on_candle(msg["data"])
+
+    def _close_bar(self, close):
+        if self.closes:
+            ret = close / self.closes[-1] - 1 if self.closes[-1] else 0.0
+            self.returns.append(ret)
+            self.returns_sum += ret
+            self.returns_sq_sum += ret * ret
+            if len(self.returns) > VOLATILITY_WINDOW:
+                old = self.returns.popleft()
+                self.returns_sum -= old
+                self.returns_sq_sum -= old * old
+        self.closes.append(close)
+        self.ema_fast = _ema_step(self.ema_fast, close, EMA_FAST)
+        self.ema_slow = _ema_step(self.ema_slow, close, EMA_SLOW)
+
+    def refresh(self, info):
+        """首次调用回填历史；之后在未推送或推送失效时只拉取最新K线"""
+        now = time.time()
+        if not self.backfilled:
+            interval_ms = INTERVAL_SECONDS[self.interval] * 1000
+            end = int(now * 1000)
+            start = end - (self.closes.maxlen + 1) * interval_ms
+            self._apply(info.candles_snapshot(self.coin, self.interval, start, end))
+            self.backfilled = True
+            self.last_fetch = now
+            return
+        if self.streaming and now - self.last_update < STREAM_STALE_SECONDS:
+            return
+        if now - self.last_fetch < REFRESH_MIN_SECONDS:
+            return
+        self._apply(info.candles_snapshot(self.coin, self.interval, self.open_time, int(now * 1000)))
+        self.last_fetch = now
+
+    def _apply(self, candles):
+        for candle in sorted(candles or [], key=lambda c: c["t"]):
+            self.on_candle(candle)
+
+    # --- 指标读取 ---
+    def volatility(self):
+        """最近 VOLATILITY_WINDOW 根已收盘K线收益率的标准差"""
+        n = len(self.returns)
+        if n < 2:
+            return 0.0
+        mean = self.returns_sum / n
+        return math.sqrt(max(self.returns_sq_sum / n - mean * mean, 0.0))
+
+    def trend(self):
+        """收盘价 > 快线 > 慢线为多头，反之为空头，否则返回None"""
+        with self.lock:
+            if self.ema_slow is None or self.current_close is None or len(self.closes) < EMA_SLOW:
+                return None
+            price = self.current_close
+            fast = _ema_step(self.ema_fast, price, EMA_FAST)
+            slow = _ema_step(self.ema_slow, price, EMA_SLOW)
+        if price > fast > slow:
+            return "LONG"
+        if price < fast < slow:
+            return "SHORT"
+        return None
+
+    def close_prices(self):
+        with self.lock:
+            closes = list(self.closes)
+            if self.current_close is not None:
+                closes.append(self.current_close)
+        return closes
+
+
+def _ema_step(prev, value, period):
+    if prev is None:
+        return value
+    k = 2 / (period + 1)
+    return prev + k * (value - prev)
+
+
+_series = {}
+_series_lock = threading.Lock()
+
+
+def get_series(coin, interval="15m"):
+    key = (coin, interval)
+    with _series_lock:
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = CandleSeries(coin, interval)
+    return series
+
+
+def subscribe_candles(info, coins, interval="15m"):
+    """为每个币种订阅 websocket K线推送，订阅后不再需要轮询 REST"""
+    for coin in coins:
+        series = get_series(coin, interval)
+        info.subscribe({"type": "candle", "coin": coin, "interval": interval}, series.on_ws_message)
+        series.streaming = True
+
+
+def _refreshed(info, coin, interval):
+    series = get_series(coin, interval)
+    try:
+        series.refresh(info)
+    except Exception as e:
+        print(f"⚠️ 更新K线失败 {coin} {interval}: {e}")
+    return series
+
+
+def get_kline_data(info, coin, interval="15m"):
+    """返回缓存中的收盘价列表(最后一个为未收盘K线的最新价)"""
+    return _refreshed(info, coin, interval).close_prices()
+
+
+def calculate_volatility(closes, window=VOLATILITY_WINDOW):
+    """按收盘价列表计算收益率标准差；传入已收盘K线时与 CandleSeries.volatility 结果一致"""
+    closes = closes[-(window + 1):]
+    returns = [b / a - 1 for a, b in zip(closes, closes[1:]) if a]
+    if len(returns) < 2:
+        return 0.0
+    mean = sum(returns) / len(returns)
+    return math.sqrt(max(sum(r * r for r in returns) / len(returns) - mean * mean, 0.0))
+
+
+def get_volatility(info, coin, interval="15m"):
+    """O(1) 读取缓存中维护的滚动波动率"""
+    return _refreshed(info, coin, interval).volatility()
+
+
+def get_ema_trend(info, coin, interval="15m"):
+    """返回 "LONG" / "SHORT"，趋势不明确时返回None"""
+    return _refreshed(info, coin, interval).trend()
@@ -1,15 +1,29 @@
 import getpass
 import json
 import os
+from collections import namedtuple
 
 import eth_account
 from eth_account.signers.local import LocalAccount
 
+from hyperliquid.api import API
 from hyperliquid.exchange import Exchange
 from hyperliquid.info import Info
 
+import meta_cache
+import replay
+import request_scheduler
+import transport
+
+# 多账户模式下的一个跟单账户；config 为 config.json 中该账户的原始配置（可含 copy_ratio 等）
+FollowerAccount = namedtuple("FollowerAccount", ["name", "address", "exchange", "config"])
+
 
 def setup(base_url=None, skip_ws=False, perp_dexs=None):
+    replayed = replay.replay_setup()
+    if replayed is not None:
+        print("Replaying recorded session:", os.environ[replay.REPLAY_ENV])
+        return replayed
     config_path = os.path.join(os.path.dirname(__file__), "config.json")
     with open(config_path) as f:
         config = json.load(f)
@@ -20,7 +34,8 @@ def setup(base_url=None, skip_ws=False, perp_dexs=None):
     print("Running with account address:", address)
     if address != account.address:
         print("Running with agent address:", account.address)
-    info = Info(base_url, skip_ws, perp_dexs=perp_dexs)
+    meta, spot_meta = load_meta(base_url)
+    info = transport.install(Info(base_url, skip_ws, meta=meta, spot_meta=spot_meta, perp_dexs=perp_dexs))
     user_state = info.user_state(address)
     spot_user_state = info.spot_user_state(address)
     margin_summary = user_state["marginSummary"]
@@ -29,10 +44,63 @@ def setup(base_url=None, skip_ws=False, perp_dexs=None):
         url = info.base_url.split(".", 1)[1]
         error_string = f"No accountValue:\nIf you think this is a mistake, make sure that {address} has a balance on {url}.\nIf address shown is your API wallet address, update the config to specify the address of your account, not the address of the API wallet."
         raise Exception(error_string)
-    exchange = Exchange(account, base_url, account_address=address, perp_dexs=perp_dexs)
+    exchange = transport.install(Exchange(account, base_url, meta=meta, account_address=address, spot_meta=spot_meta, perp_dexs=perp_dexs))
+    meta_cache.register_clients(info, exchange.info)
+    request_scheduler.get_scheduler().wrap_inner_info(exchange)
+    info, exchange = replay.wrap_for_recording(address, base_url, info, exchange)
+    # 调度器在录制层之外：录下的是实际发出的请求
+    info, exchange = request_scheduler.get_scheduler().wrap(info, exchange)
     return address, info, exchange
 
 
+def setup_accounts(base_url=None, skip_ws=True, perp_dexs=None):
+    """读取 config.json 中的 accounts 列表，返回 (共享的 info, [FollowerAccount])
+
+    所有账户共用一个 Info 和一份元数据：meta/spotMeta 只请求一次，再传给每个账户的 Exchange。
+    每个账户的配置与单账户相同（secret_key 或 keystore_path，account_address 为空时使用私钥地址，填写时私钥视为代理钱包）。
+    """
+    config_path = os.path.join(os.path.dirname(__file__), "config.json")
+    with open(config_path) as f:
+        config = json.load(f)
+    account_configs = config.get("accounts")
+    if not account_configs:
+        raise ValueError("config.json has no \"accounts\" list")
+
+    meta, spot_meta = load_meta(base_url)
+    info = transport.install(Info(base_url, skip_ws, meta=meta, spot_meta=spot_meta, perp_dexs=perp_dexs))
+    meta_cache.register_clients(info)
+    scheduler = request_scheduler.get_scheduler()
+    accounts = []
+    for index, account_config in enumerate(account_configs):
+        account_config = {"secret_key": "", "keystore_path": "", "account_address": "", **account_config}
+        wallet: LocalAccount = eth_account.Account.from_key(get_secret_key(account_config))
+        address = account_config["account_address"] or wallet.address
+        name = account_config.get("name") or f"account{index}"
+        print(f"Account {name}: {address}" + (f" (agent {wallet.address})" if address != wallet.address else ""))
+        user_state = info.user_state(address)
+        spot_user_state = info.spot_user_state(address)
+        if float(user_state["marginSummary"]["accountValue"]) == 0 and len(spot_user_state["balances"]) == 0:
+            raise Exception(f"No accountValue for account {name} ({address}). If this is an API wallet address, set account_address to the address of your account.")
+        exchange = transport.install(Exchange(wallet, base_url, meta=meta, account_address=address, spot_meta=spot_meta, perp_dexs=perp_dexs))
+        meta_cache.register_clients(exchange.info)
+        scheduler.wrap_inner_info(exchange)
+        accounts.append(FollowerAccount(name, address, scheduler.wrap_exchange(exchange), account_config))
+    if len({account.address for account in accounts}) != len(accounts):
+        raise ValueError("config.json lists the same account address more than once")
+    return scheduler.wrap_info(info), accounts
+
+
+def load_meta(base_url):
+    """返回 (meta, spot_meta)：元数据缓存文件在 TTL 内时直接使用，否则请求一次并写回缓存文件"""
+    meta, spot_meta = meta_cache.load_client_meta(base_url)
+    if meta is None:
+        api = transport.install(API(base_url))
+        meta = api.post("/info", {"type": "meta"})
+        spot_meta = api.post("/info", {"type": "spotMeta"})
+        meta_cache.save_client_meta(base_url, meta, spot_meta)
+    return meta, spot_meta
+
+
 def get_secret_key(config):
     if config["secret_key"]:
         secret_key = config["secret_key"]
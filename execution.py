@@ -0,0 +1,467 @@
+"""
+被动执行：用盘口挂单（post-only）代替 1% 滑点的市价单，超时后再用 IOC 补足剩余数量。
+
+PassiveExecutor.execute() 对一组订单：
+1. 按当前买一（买单）/卖一（卖单）挂 ALO 单，价格取整时只往不成交的方向取，保证是 maker；
+2. 每 REPRICE_SECONDS 检查一次成交和盘口，挂单不在最优价时用 batchModify 追价，被拒（会立即成交）的下一轮重挂；
+3. 到 DEADLINE_SECONDS 仍未成交的部分撤单，按 FALLBACK_SLIPPAGE 发 IOC 单吃掉。
+盘口和订单状态在有 websocket 时来自 l2Book / orderUpdates 推送，否则用 l2Book / orderStatus 查询（各计权重 2）；
+orderStatus 查不到的订单（unknownOid）状态未知：继续跟踪、下一轮重查，成交数量以 userFills 中该订单的成交为准。
+
+ExecutionProxy 包装 Exchange：market_open / market_close 以及全部为 IOC 的 bulk_orders（OrderBatch 的提交方式）
+改走被动执行，其余方法原样转发。各脚本通过 --execution passive 启用，默认仍是市价单。
+风控、止损等紧急平仓通过 direct(exchange) 绕过被动执行，仍以 IOC 立即成交。
+执行中途被中断（SIGTERM 转成的 KeyboardInterrupt）或出错时撤掉已挂的单；进程退出前调用 shutdown(exchange)，
+停止其他线程中进行中的执行并撤掉仍在挂的单，不留下无人跟踪的挂单。各脚本的 finally 用 teardown() 一并断开 websocket。
+每笔订单的 maker/taker 数量、相对下单时中间价的成本和估算手续费记录在 reports 中，summary() 汇总。
+"""
+import math
+import threading
+import time
+from collections import namedtuple
+
+import meta_cache
+import order_batch
+
+MAKER_FEE_RATE = 0.00015
+TAKER_FEE_RATE = 0.00045
+REPRICE_SECONDS = 1.0
+DEADLINE_SECONDS = 15.0
+FALLBACK_SLIPPAGE = 0.01     # 超时后 IOC 单的最大滑点，与原来的市价单一致
+BOOK_MAX_AGE = 2.0           # websocket 盘口超过这么多秒没有更新时改用 REST 查询
+ORDER_EVENT_TTL = 300.0      # websocket 订单状态保留的时间，远长于一次执行；过期的订单改用 orderStatus 查询
+EXECUTION_MODES = ("market", "passive")
+
+ExecutionReport = namedtuple("ExecutionReport", [
+    "coin", "is_buy", "sz", "filled", "maker_sz", "taker_sz", "avg_px", "arrival_mid", "cost_bps", "fee", "seconds", "reprices",
+])
+
+
+def round_price(px, sz_decimals, is_buy):
+    """按交易所规则取整（5 位有效数字、永续最多 6 - szDecimals 位小数）；买单向下、卖单向上，不会越过原价"""
+    decimals = max(6 - sz_decimals, 0)
+    tick = max(10.0 ** (math.floor(math.log10(px)) - 4), 10.0 ** -decimals)
+    steps = px / tick
+    steps = math.floor(steps + 1e-9) if is_buy else math.ceil(steps - 1e-9)
+    return round(steps * tick, decimals)
+
+
+class _Work:
+    """一笔待执行的订单；每次挂单/追价产生一个子订单 (oid, px, child_sz)，child_settled 为子订单已计入的成交"""
+
+    def __init__(self, order, sz_decimals, started):
+        self.coin = order["coin"]
+        self.is_buy = order["is_buy"]
+        self.sz = float(order["sz"])
+        self.reduce_only = order.get("reduce_only", False)
+        self.sz_decimals = sz_decimals
+        self.started = started
+        self.oid = None
+        self.px = None
+        self.child_sz = 0.0
+        self.child_settled = 0.0
+        self.previous = None        # 追价前的 (px, child_sz, child_settled)，改单被拒且原单仍在时恢复
+        self.maker_sz = 0.0
+        self.maker_notional = 0.0
+        self.taker_sz = 0.0
+        self.taker_notional = 0.0
+        self.arrival_mid = None
+        self.done_at = None
+        self.reprices = 0
+        self.error = None
+
+    @property
+    def filled(self):
+        return self.maker_sz + self.taker_sz
+
+    def remaining(self):
+        return max(round(self.sz - self.filled, self.sz_decimals), 0.0)
+
+    def new_child(self, px):
+        self.previous = (self.px, self.child_sz, self.child_settled)
+        self.px = px
+        self.child_sz = self.remaining()
+        self.child_settled = 0.0
+
+    def credit(self, child_filled):
+        """child_filled 为当前子订单的累计成交，只计入新增部分（挂单成交价即限价）"""
+        filled = child_filled - self.child_settled
+        if filled > 0:
+            self.maker_sz += filled
+            self.maker_notional += filled * self.px
+            self.child_settled = child_filled
+
+    def end_child(self, child_filled):
+        """子订单结束（成交、撤销或被拒）"""
+        self.credit(child_filled)
+        self.oid = None
+
+    def status(self):
+        if self.filled <= 0:
+            return {"error": self.error or "Passive order did not fill before the deadline."}
+        notional = self.maker_notional + self.taker_notional
+        return {"filled": {"totalSz": str(round(self.filled, self.sz_decimals)), "avgPx": str(notional / self.filled), "oid": self.oid}}
+
+    def report(self, now):
+        notional = self.maker_notional + self.taker_notional
+        avg_px = notional / self.filled if self.filled else None
+        cost_bps = None
+        if avg_px and self.arrival_mid:
+            cost_bps = (avg_px - self.arrival_mid) / self.arrival_mid * 1e4 * (1 if self.is_buy else -1)
+        fee = self.maker_notional * MAKER_FEE_RATE + self.taker_notional * TAKER_FEE_RATE
+        return ExecutionReport(self.coin, self.is_buy, self.sz, self.filled, self.maker_sz, self.taker_sz, avg_px,
+                               self.arrival_mid, cost_bps, fee, (self.done_at or now) - self.started, self.reprices)
+
+
+class PassiveExecutor:
+    def __init__(self, exchange, info, address, deadline=DEADLINE_SECONDS, reprice=REPRICE_SECONDS,
+                 slippage=FALLBACK_SLIPPAGE, metas=None, clock=time.monotonic, log=print):
+        self.exchange = exchange
+        self.info = info
+        self.metas = metas
+        self.address = address
+        self.deadline = deadline
+        self.reprice = reprice
+        self.slippage = slippage
+        self.clock = clock
+        self.log = log
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.books = {}             # coin -> (买一, 卖一, 更新时间)，来自 websocket
+        self.order_events = {}      # oid -> (状态, 剩余数量, 原始数量, 收到时间)，来自 websocket
+        self.book_subscriptions = set()
+        self.websocket = self._subscribe({"type": "orderUpdates", "user": address}, self.on_order_updates)
+        self.reports = []
+        self.active = []            # 进行中的 execute() 的 works，shutdown() 时撤单
+        self.stopped = False
+
+    # --- websocket ---
+    def _subscribe(self, subscription, callback):
+        if getattr(self.info, "ws_manager", None) is None:
+            return False
+        try:
+            self.info.subscribe(subscription, callback)
+            return True
+        except Exception as e:
+            self.log(f"Execution websocket subscription {subscription['type']} failed, polling instead: {e}")
+            return False
+
+    def on_l2_book(self, msg):
+        data = msg.get("data", {})
+        levels = data.get("levels")
+        if not levels or not levels[0] or not levels[1]:
+            return
+        with self.lock:
+            self.books[data["coin"]] = (float(levels[0][0]["px"]), float(levels[1][0]["px"]), self.clock())
+        self.wakeup.set()
+
+    def on_order_updates(self, msg):
+        now = self.clock()
+        with self.lock:
+            for update in msg.get("data", []):
+                order = update.get("order", {})
+                if "oid" in order:
+                    self.order_events[order["oid"]] = (update.get("status"), float(order.get("sz", 0)),
+                                                       float(order.get("origSz", order.get("sz", 0))), now)
+            # 推送包含该账户的所有订单，过期的状态及时清掉，长期运行时不会无限增长
+            expired = [oid for oid, event in self.order_events.items() if now - event[3] > ORDER_EVENT_TTL]
+            for oid in expired:
+                del self.order_events[oid]
+        self.wakeup.set()
+
+    # --- 盘口与订单状态 ---
+    def top_of_book(self, coin):
+        """返回 (买一, 卖一)"""
+        if self.websocket and coin not in self.book_subscriptions:
+            self.book_subscriptions.add(coin)
+            self._subscribe({"type": "l2Book", "coin": coin}, self.on_l2_book)
+        with self.lock:
+            book = self.books.get(coin)
+        if book and self.clock() - book[2] <= BOOK_MAX_AGE:
+            return book[0], book[1]
+        levels = self.info.l2_snapshot(coin)["levels"]
+        return float(levels[0][0]["px"]), float(levels[1][0]["px"])
+
+    def child_state(self, oid, child_sz):
+        """返回 (是否仍在挂单, 已成交数量)；查不到订单时是否挂单为 None（未知），成交数量取自 userFills"""
+        with self.lock:
+            event = self.order_events.get(oid)
+        if event is None:
+            response = self.info.query_order_by_oid(self.address, oid)
+            if response.get("status") != "order":
+                # 刚下的单可能暂时查不到，结束已久的单可能已不在 orderStatus 中：只按实际成交记账，
+                # 不能当作全部成交，否则未成交部分既不补单、又会被算进 maker 成交和均价
+                return None, self.filled_from_fills(oid)
+            order = response["order"]
+            event = (order["status"], float(order["order"]["sz"]), float(order["order"].get("origSz", child_sz)), None)
+        status, remaining, orig, _ = event
+        if status == "filled":
+            return False, orig
+        return status == "open", max(orig - remaining, 0.0)
+
+    def filled_from_fills(self, oid):
+        """userFills 中该订单的累计成交数量"""
+        return sum(float(fill["sz"]) for fill in self.info.user_fills(self.address) if fill.get("oid") == oid)
+
+    # --- 执行 ---
+    def execute(self, orders):
+        """orders 为 [{"coin", "is_buy", "sz", "reduce_only"}]，返回与 bulk_orders 相同格式的状态列表"""
+        if self.stopped:
+            return [{"error": "Passive executor is shut down."}] * len(orders)
+        started = self.clock()
+        metas = self.metas or meta_cache.get_meta_cache(self.info)
+        works = [_Work(order, metas.sz_decimals(order["coin"], 2), started) for order in orders]
+        with self.lock:
+            self.active.append(works)
+        try:
+            self._run(works, started)
+        except BaseException:
+            # 中断或请求出错：撤掉已挂的单再抛出
+            try:
+                self._cancel_resting(works)
+            except Exception as e:
+                self.log(f"Failed to cancel resting passive orders: {e}")
+            raise
+        finally:
+            with self.lock:
+                self.active.remove(works)
+        now = self.clock()
+        for work in works:
+            report = work.report(now)
+            self.reports.append(report)
+            self.log(f"Executed {'Buy' if work.is_buy else 'Sell'} {work.filled}/{work.sz} {work.coin}: maker {work.maker_sz}, "
+                     f"taker {work.taker_sz}, cost {report.cost_bps if report.cost_bps is not None else float('nan'):+.2f} bps "
+                     f"vs arrival mid, fee ${report.fee:.4f}, {report.seconds:.1f}s, {work.reprices} reprice(s)")
+        return [work.status() for work in works]
+
+    def _run(self, works, started):
+        books = {}
+        for work in works:
+            if work.coin not in books:
+                books[work.coin] = self.top_of_book(work.coin)
+            bid, ask = books[work.coin]
+            work.arrival_mid = (bid + ask) / 2
+        self._place(works, books)
+
+        deadline = started + self.deadline
+        while self.clock() < deadline and not self.stopped:
+            if all(work.remaining() == 0 for work in works):
+                break
+            self.wakeup.wait(min(self.reprice, max(deadline - self.clock(), 0)))
+            self.wakeup.clear()
+            self._poll(works)
+            now = self.clock()
+            for work in works:
+                if work.done_at is None and work.remaining() == 0:
+                    work.done_at = now
+            pending = [work for work in works if work.remaining() > 0]
+            if not pending:
+                break
+            books = {coin: self.top_of_book(coin) for coin in {work.coin for work in pending}}
+            self._chase([work for work in pending if work.oid is not None], books)
+            self._place([work for work in pending if work.oid is None], books)
+
+        # 已 shutdown：只撤单结算，不再 IOC 补单
+        self._finish(works, fallback=not self.stopped)
+
+    def _passive_price(self, work, books):
+        bid, ask = books[work.coin]
+        return round_price(bid if work.is_buy else ask, work.sz_decimals, work.is_buy)
+
+    def _order_request(self, work, px, sz, tif):
+        return {"coin": work.coin, "is_buy": work.is_buy, "sz": sz, "limit_px": px,
+                "order_type": {"limit": {"tif": tif}}, "reduce_only": work.reduce_only}
+
+    def _place(self, works, books):
+        works = [work for work in works if work.remaining() > 0]
+        if not works:
+            return
+        requests = []
+        for work in works:
+            work.new_child(self._passive_price(work, books))
+            requests.append(self._order_request(work, work.px, work.child_sz, "Alo"))
+        self._apply(works, self._statuses(self.exchange.bulk_orders(requests), len(works)))
+
+    def _chase(self, works, books):
+        """挂单已不在最优价（盘口朝不利方向移动）时追价；追价前的部分成交先结算"""
+        moves = []
+        for work in works:
+            px = self._passive_price(work, books)
+            if (px > work.px) if work.is_buy else (px < work.px):
+                moves.append((work, px))
+        if not moves:
+            return
+        requests = []
+        for work, px in moves:
+            # 原单的成交已在 _poll 中计入，改单后的数量为剩余数量
+            work.new_child(px)
+            work.reprices += 1
+            requests.append({"oid": work.oid, "order": self._order_request(work, px, work.child_sz, "Alo")})
+        response = self.exchange.bulk_modify_orders_new(requests)
+        self._apply([work for work, _ in moves], self._statuses(response, len(moves)), replaced=True)
+
+    def _poll(self, works):
+        for work in works:
+            if work.oid is None:
+                continue
+            live, filled = self.child_state(work.oid, work.child_sz)
+            if live is False:
+                work.end_child(filled)
+            else:
+                # 仍在挂单，或状态未知（下一轮重查，超时后撤单并按 userFills 结算）
+                work.credit(filled)
+
+    def _apply(self, works, statuses, replaced=False):
+        for work, status in zip(works, statuses):
+            if "resting" in status:
+                work.oid = status["resting"]["oid"]
+            elif "filled" in status:
+                work.end_child(float(status["filled"]["totalSz"]))
+            else:
+                # ALO 会立即成交、追价时原单已成交/已撤等：下一轮按最新状态重挂
+                work.error = status.get("error", str(status))
+                if replaced and work.oid is not None:
+                    live, filled = self.child_state(work.oid, work.child_sz)
+                    if live is not False:
+                        # 改单被拒但原单仍在（或状态未知）：保留原单，按原单的价格和数量继续跟踪
+                        work.px, work.child_sz, work.child_settled = work.previous
+                        work.credit(filled)
+                        continue
+                    work.end_child(filled)
+                work.oid = None
+
+    def _finish(self, works, fallback=True):
+        """撤掉仍在挂的单，fallback 时未成交部分用 IOC 补足"""
+        live = [work for work in works if work.oid is not None]
+        if live:
+            self.exchange.bulk_cancel([{"coin": work.coin, "oid": work.oid} for work in live])
+            for work in live:
+                # 撤单后状态仍未知时，child_state 已按 userFills 给出实际成交
+                _, filled = self.child_state(work.oid, work.child_sz)
+                work.end_child(filled)
+        rest = [work for work in works if work.remaining() > 0]
+        if not fallback:
+            for work in rest:
+                work.error = "Passive executor shut down before the order filled."
+            return
+        if not rest:
+            return
+        books = {coin: self.top_of_book(coin) for coin in {work.coin for work in rest}}
+        requests = []
+        for work in rest:
+            bid, ask = books[work.coin]
+            px = order_batch.slippage_price(self.exchange, work.coin, work.is_buy, self.slippage, (bid + ask) / 2)
+            requests.append(self._order_request(work, px, work.remaining(), "Ioc"))
+        for work, status in zip(rest, self._statuses(self.exchange.bulk_orders(requests), len(rest))):
+            if "filled" in status:
+                sz = float(status["filled"]["totalSz"])
+                work.taker_sz += sz
+                work.taker_notional += sz * float(status["filled"]["avgPx"])
+                work.oid = status["filled"].get("oid")
+            else:
+                work.error = status.get("error", str(status))
+
+    def _cancel_resting(self, works):
+        """撤掉仍在挂的子订单（不结算成交），返回撤单数"""
+        resting = [{"coin": work.coin, "oid": work.oid} for work in works if work.oid is not None]
+        if resting:
+            self.exchange.bulk_cancel(resting)
+        return len(resting)
+
+    def shutdown(self):
+        """停止所有进行中的执行：不再追价和 IOC 补单，撤掉仍在挂的单"""
+        self.stopped = True
+        self.wakeup.set()
+        with self.lock:
+            works = [work for batch in self.active for work in batch]
+        try:
+            cancelled = self._cancel_resting(works)
+        except Exception as e:
+            self.log(f"Failed to cancel resting passive orders on shutdown: {e}")
+            return
+        if cancelled:
+            self.log(f"Cancelled {cancelled} resting passive order(s) on shutdown")
+
+    @staticmethod
+    def _statuses(response, count):
+        if not isinstance(response, dict) or response.get("status") != "ok":
+            return [{"error": str(response)}] * count
+        return response["response"]["data"]["statuses"]
+
+    def summary(self):
+        reports = [r for r in self.reports if r.filled]
+        if not reports:
+            return "no executions"
+        maker = sum(r.maker_sz / r.filled for r in reports) / len(reports)
+        costs = [r.cost_bps for r in reports if r.cost_bps is not None]
+        return (f"{len(reports)} order(s), maker share {maker * 100:.0f}%, avg cost {sum(costs) / len(costs):+.2f} bps, "
+                f"fees ${sum(r.fee for r in reports):.4f}, avg {sum(r.seconds for r in reports) / len(reports):.1f}s")
+
+
+class ExecutionProxy:
+    """包装 Exchange，市价单改为被动执行；其余调用原样转发"""
+
+    def __init__(self, exchange, executor):
+        self._exchange = exchange
+        self.executor = executor
+
+    def __getattr__(self, name):
+        return getattr(self._exchange, name)
+
+    @property
+    def direct(self):
+        """不经被动执行的原始 exchange"""
+        return self._exchange
+
+    def _respond(self, orders):
+        return {"status": "ok", "response": {"type": "order", "data": {"statuses": self.executor.execute(orders)}}}
+
+    def bulk_orders(self, order_requests, builder=None):
+        if not order_requests or any(request["order_type"].get("limit", {}).get("tif") != "Ioc" for request in order_requests):
+            return self._exchange.bulk_orders(order_requests, builder)
+        return self._respond([{"coin": r["coin"], "is_buy": r["is_buy"], "sz": r["sz"], "reduce_only": r["reduce_only"]}
+                              for r in order_requests])
+
+    def market_open(self, name, is_buy, sz, px=None, slippage=FALLBACK_SLIPPAGE, cloid=None, builder=None):
+        return self._respond([{"coin": name, "is_buy": is_buy, "sz": sz, "reduce_only": False}])
+
+    def market_close(self, coin, sz=None, px=None, slippage=FALLBACK_SLIPPAGE, cloid=None, builder=None):
+        for position in self.executor.info.user_state(self.executor.address)["assetPositions"]:
+            item = position["position"]
+            if item["coin"] != coin:
+                continue
+            szi = float(item["szi"])
+            return self._respond([{"coin": coin, "is_buy": szi < 0, "sz": sz or abs(szi), "reduce_only": True}])
+        return None
+
+
+def direct(exchange):
+    """返回绕过被动执行的 exchange：风控、止损等紧急平仓不能挂单等待，必须立即以 IOC 成交"""
+    return exchange.direct if isinstance(exchange, ExecutionProxy) else exchange
+
+
+def shutdown(exchange):
+    """进程退出前调用：exchange 为 ExecutionProxy 时停止被动执行并撤掉仍在挂的单，否则什么也不做"""
+    if isinstance(exchange, ExecutionProxy):
+        exchange.executor.shutdown()
+
+
+def teardown(exchange, info=None, log=print):
+    """脚本退出时的清理：先 shutdown(exchange)，再断开 info 的 websocket（未启用 websocket 时跳过）；不抛出异常"""
+    shutdown(exchange)
+    if info is None or getattr(info, "ws_manager", None) is None:
+        return
+    try:
+        # websocket 线程不是守护线程，不断开时 SIGTERM/Ctrl+C 后进程不会退出
+        info.disconnect_websocket()
+    except Exception as e:
+        log(f"Failed to disconnect websocket: {e}")
+
+
+def setup(mode, info, exchange, address, log=print):
+    """mode 为 "passive" 时返回包装后的 exchange，否则原样返回"""
+    if mode != "passive" or exchange is None:
+        return exchange
+    executor = PassiveExecutor(exchange, info, address, log=log)
+    log(f"Passive execution: post-only at top of book, reprice every {REPRICE_SECONDS}s, IOC fallback after {DEADLINE_SECONDS}s")
+    return ExecutionProxy(exchange, executor)
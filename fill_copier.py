@@ -0,0 +1,159 @@
+"""
+成交驱动的跟单：直接按目标地址 userFills 推送的每笔成交下单，而不是比较前后两次仓位快照。
+
+FillAggregator 把目标的成交按跟单比例缩放后按币种累加，同一币种在 window 秒内的成交合并为一笔，
+凑够交易所最小下单金额再下单；plan_fill() 根据累计的数量和我方当前仓位决定加仓、减仓、全平或反向开仓，
+不足最小金额或精度的部分留到下一批。
+
+成交在 websocket 回调线程中加入，主循环在另一个线程中取出，二者之间用锁保护。
+"""
+import threading
+import time
+from collections import deque
+
+SEEN_FILLS = 5000      # 记住最近这么多笔成交的 tid，断线重连后重复推送的成交不会重复下单
+
+
+class PendingFill:
+    """一个币种尚未执行的累计成交（已按跟单比例缩放）"""
+
+    __slots__ = ("coin", "szi", "notional", "target_szi", "reduces", "fills", "started")
+
+    def __init__(self, coin):
+        self.coin = coin
+        self.szi = 0.0            # 我方需要跟随的带符号数量
+        self.notional = 0.0       # 缩放后的成交金额，用于计算均价
+        self.target_szi = None    # 目标在最后一笔成交后的仓位（已按跟单比例缩放）
+        self.reduces = False      # 是否包含目标的减仓/平仓/反向成交（需要查询我方仓位）
+        self.fills = 0
+        self.started = None       # 第一笔未执行成交的到达时间，为None 时表示只有结转、等待新成交
+
+    @property
+    def px(self):
+        return self.notional / abs(self.szi) if self.szi else 0.0
+
+
+class FillAggregator:
+    def __init__(self, coins, ratio, window, clock=time.monotonic):
+        self.coins = set(coins)
+        self.ratio = ratio
+        self.window = window
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = {}
+        self.seen = set()
+        self.seen_order = deque()
+        self.duplicates = 0
+
+    def on_user_fills(self, msg):
+        """userFills 订阅回调；订阅后的第一条是历史成交快照，跳过"""
+        data = msg.get("data", {})
+        if data.get("isSnapshot"):
+            return
+        added = sum(self.add(fill) for fill in data.get("fills", []))
+        if added:
+            self.wakeup.set()
+
+    def add(self, fill):
+        """加入一笔目标成交，返回是否被采纳（非跟单币种或重复推送的成交返回 False）"""
+        coin = fill.get("coin")
+        if coin not in self.coins:
+            return False
+        sz = float(fill["sz"])
+        signed = sz if fill.get("side") == "B" else -sz
+        start = float(fill.get("startPosition", 0))
+        end = start + signed
+        with self.lock:
+            tid = fill.get("tid")
+            if tid is not None:
+                if tid in self.seen:
+                    self.duplicates += 1
+                    return False
+                self.seen.add(tid)
+                self.seen_order.append(tid)
+                if len(self.seen_order) > SEEN_FILLS:
+                    self.seen.discard(self.seen_order.popleft())
+            pending = self.pending.get(coin)
+            if pending is None:
+                pending = self.pending[coin] = PendingFill(coin)
+            if pending.started is None:
+                pending.started = self.clock()
+            pending.szi += signed * self.ratio
+            pending.notional += sz * float(fill["px"]) * self.ratio
+            pending.target_szi = end * self.ratio
+            pending.reduces = pending.reduces or abs(end) < abs(start) or start * end < 0
+            pending.fills += 1
+        return True
+
+    def due(self):
+        """距最早一批可执行的秒数，没有待执行成交时返回None"""
+        with self.lock:
+            started = [p.started for p in self.pending.values() if p.started is not None]
+        if not started:
+            return None
+        return max(0.0, min(started) + self.window - self.clock())
+
+    def take_ready(self):
+        """取出已满 window 秒的各币种累计成交"""
+        now = self.clock()
+        with self.lock:
+            ready = [p for p in self.pending.values() if p.started is not None and now - p.started >= self.window]
+            for p in ready:
+                del self.pending[p.coin]
+        return ready
+
+    def carry(self, pending, szi):
+        """把未执行的数量 szi 结转回去，与之后的成交合并；只有新成交到达才会再次触发"""
+        if not szi:
+            return
+        with self.lock:
+            current = self.pending.get(pending.coin)
+            if current is None:
+                current = self.pending[pending.coin] = PendingFill(pending.coin)
+                current.target_szi = pending.target_szi
+            current.szi += szi
+            current.notional += abs(szi) * pending.px
+            current.reduces = current.reduces or pending.reduces
+
+    def discard(self):
+        """全量对账前丢弃所有未执行的成交（对账按最新仓位同步），返回丢弃的币种"""
+        with self.lock:
+            coins = list(self.pending)
+            self.pending.clear()
+        return coins
+
+
+def plan_fill(pending, my_szi, sz_decimals, price, min_notional):
+    """根据累计成交和我方仓位 my_szi（为None 时视为纯加仓）给出动作列表和结转数量
+
+    动作为 ("close", 数量或None 表示全平) 或 ("open", 是否买入, 数量)。
+    """
+    szi = pending.szi
+    if pending.target_szi == 0:
+        # 目标已平仓：无论比例换算的剩余多少，直接全平
+        return ([("close", None)] if my_szi else []), 0.0
+    if my_szi == 0 and pending.reduces:
+        # 我方无仓位时不跟随目标的减仓；目标反向后只按新方向的仓位开仓
+        if pending.target_szi * szi <= 0:
+            return [], 0.0
+        szi = szi if abs(szi) <= abs(pending.target_szi) else pending.target_szi
+    if my_szi is None or my_szi == 0 or (my_szi > 0) == (szi > 0):
+        return _plan_open(szi, sz_decimals, price, min_notional)
+
+    new_szi = my_szi + szi
+    if new_szi * my_szi <= 0 or abs(new_szi) * price < min_notional:
+        # 反向或减到不足最小金额：先全平，剩余部分按新方向开仓
+        actions, carry = _plan_open(new_szi, sz_decimals, price, min_notional) if new_szi * my_szi < 0 else ([], 0.0)
+        return [("close", None)] + actions, carry
+    sz = round(abs(szi), sz_decimals)
+    if sz == 0 or sz * price < min_notional:
+        return [], szi
+    return [("close", sz)], szi - (sz if szi > 0 else -sz)
+
+
+def _plan_open(szi, sz_decimals, price, min_notional):
+    sz = round(abs(szi), sz_decimals)
+    if sz == 0 or sz * price < min_notional:
+        return [], szi
+    return [("open", szi > 0, sz)], szi - (sz if szi > 0 else -sz)
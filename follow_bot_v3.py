@@ -1,7 +1,13 @@
-import math
 import time
 import json
+import argparse
 import example_utils
+import execution
+import heartbeat
+import log_pipeline
+import meta_cache
+import metrics
+from account_state import AccountSnapshot
 from hyperliquid.utils import constants
 
 # --- 核心配置参数 ---
@@ -20,34 +26,17 @@ RISK_COOLDOWN_MINUTES = 5
 last_risk_close_time = None
 
 
-def get_position_info(user_state, coin_name):
-    """从用户状态中提取特定币种的持仓信息"""
-    for p in user_state.get("assetPositions", []):
-        pos = p.get("position", {})
-        if pos.get("coin") == coin_name:
-            return pos
-    return None
-
-
-def get_accurate_liquidation_price(user_state, coin_name, current_price):
-    """从用户状态中获取准确的清算价格"""
-    try:
-        for p in user_state.get("assetPositions", []):
-            pos = p.get("position", {})
-            if pos.get("coin") == coin_name:
-                if "liquidationPx" in pos:
-                    return float(pos["liquidationPx"])
-
-                lev = float(pos.get("leverage", {}).get("value", 1))
-                szi = float(pos.get("szi", 0))
-                if szi > 0:
-                    return current_price * (1 - 0.95 / lev)
-                elif szi < 0:
-                    return current_price * (1 + 0.95 / lev)
-        return None
-    except Exception as e:
-        print(f"⚠️ 获取清算价格失败: {e}")
+def get_position_liquidation_price(pos, current_price):
+    """从 Position 中获取清算价格，无清算价时按杠杆估算"""
+    if not pos:
         return None
+    if pos.liquidation_px is not None:
+        return pos.liquidation_px
+    if pos.szi > 0:
+        return current_price * (1 - 0.95 / pos.leverage)
+    elif pos.szi < 0:
+        return current_price * (1 + 0.95 / pos.leverage)
+    return None
 
 
 def calculate_safety_margin(current_price, liquidation_price, is_long):
@@ -89,7 +78,7 @@ def execute_risk_management(exchange, coin, safety_margin, risk_level, current_p
 
     if safety_margin <= AUTO_CLOSE_PERCENT:
         print(f"💥 安全边际过低({safety_margin:.1f}%) -> 紧急平仓")
-        close_result = exchange.market_close(coin)
+        close_result = execution.direct(exchange).market_close(coin)
         print(f"✅ 平仓结果: {json.dumps(close_result)}")
         last_risk_close_time = time.time()
         return "closed"
@@ -114,7 +103,20 @@ def should_reopen_after_risk_close():
 
 def main():
     global last_risk_close_time
-    my_address, info, exchange = example_utils.setup(base_url=constants.MAINNET_API_URL)
+    parser = argparse.ArgumentParser(description="跟单机器人 V3")
+    parser.add_argument('--base-url', default=constants.MAINNET_API_URL, help='API 地址，可指向本地 mock_server.py 做压测')
+    parser.add_argument('--metrics-port', type=int, help='在该端口暴露 Prometheus 指标 (/metrics)')
+    parser.add_argument('--execution', choices=execution.EXECUTION_MODES, default='market', help='市价单的执行方式：market 为 1%% 滑点的 IOC，passive 为盘口挂单追价、超时后 IOC')
+    parser.add_argument('--events-file', default='follow_bot_v3.events.jsonl', help="结构化事件 (JSON lines: 轮次、决策、下单耗时) 文件，传空字符串则不写")
+    args = parser.parse_args()
+    heartbeat.setup()
+    log_pipeline.setup(args.events_file)
+    my_address, info, exchange = example_utils.setup(base_url=args.base_url)
+    info, exchange = metrics.setup(args.metrics_port, info, exchange)
+    exchange = execution.setup(args.execution, info, exchange, my_address)
+    cycle = metrics.CycleTimer("follow_bot_v3")
+    metas = meta_cache.get_meta_cache(info)
+    sz_decimals = metas.sz_decimals(COIN, 2)
 
     print("--- 跟单机器人 V3 (持仓同步 + 实时风险提示) ---")
     print(f"跟随地址: {TARGET_USER_ADDRESS}\n我的地址: {my_address}\n目标币种: {COIN}")
@@ -122,27 +124,28 @@ def main():
 
     try:
         while True:
+            cycle.start()
             print(f"\n🕒 {time.strftime('%Y-%m-%d %H:%M:%S')} 获取最新行情...")
 
             all_mids = info.all_mids()
-            target_state = info.user_state(TARGET_USER_ADDRESS)
-            my_state = info.user_state(my_address)
+            target_state = AccountSnapshot.fetch(info, TARGET_USER_ADDRESS)
+            my_state = AccountSnapshot.fetch(info, my_address)
 
             current_price = float(all_mids.get(COIN, 0))
             if current_price == 0:
                 print("❌ 获取价格失败")
-                time.sleep(LOOP_SLEEP_SECONDS)
+                cycle.sleep(LOOP_SLEEP_SECONDS)
                 continue
 
-            target_pos = get_position_info(target_state, COIN)
-            my_pos = get_position_info(my_state, COIN)
+            target_pos = target_state.get(COIN)
+            my_pos = my_state.get(COIN)
 
             # 🆕 每轮循环打印当前价格
             print(f"💰 {COIN} 当前价格: ${current_price:.2f}")
 
             # --- 冷却状态检查 ---
             if last_risk_close_time and not should_reopen_after_risk_close():
-                time.sleep(LOOP_SLEEP_SECONDS)
+                cycle.sleep(LOOP_SLEEP_SECONDS)
                 continue
 
             # --- 目标无持仓 ---
@@ -152,31 +155,31 @@ def main():
                     print("🔻 自身仍有仓位，执行平仓")
                     result = exchange.market_close(COIN)
                     print(f"平仓结果: {json.dumps(result)}")
-                time.sleep(LOOP_SLEEP_SECONDS)
+                cycle.sleep(LOOP_SLEEP_SECONDS)
                 continue
 
             # --- 提取目标方向 ---
-            target_is_long = float(target_pos["szi"]) > 0
-            target_lev = int(target_pos["leverage"]["value"])
-            target_size = abs(float(target_pos["szi"]))
+            target_is_long = target_pos.is_long
+            target_lev = target_pos.leverage
+            target_size = target_pos.size
             print(f"🎯 目标方向: {'多单' if target_is_long else '空单'} "
                   f"{target_size:.4f} {COIN} ({target_lev}x)")
 
             # --- 自身无持仓 => 跟随开仓 ---
             if my_pos is None:
-                sz = math.floor((MY_INVESTMENT_USD / current_price) / 0.01) * 0.01
+                sz = meta_cache.floor_size(MY_INVESTMENT_USD / current_price, sz_decimals)
                 print(f"🧮 计算出的开仓数量: {sz:.8f}, 当前价格: {current_price}, 投入USD: {MY_INVESTMENT_USD}")
                 exchange.update_leverage(target_lev, COIN)
                 order = exchange.market_open(COIN, target_is_long, sz, None, 0.01)
                 print(f"✅ 跟随开仓完成: {json.dumps(order)}")
 
             else:
-                my_is_long = float(my_pos["szi"]) > 0
-                my_lev = int(my_pos["leverage"]["value"])
-                my_sz = abs(float(my_pos["szi"]))
+                my_is_long = my_pos.is_long
+                my_lev = my_pos.leverage
+                my_sz = my_pos.size
                 my_value = my_sz * current_price
 
-                liq_px = get_accurate_liquidation_price(my_state, COIN, current_price)
+                liq_px = get_position_liquidation_price(my_pos, current_price)
                 margin = calculate_safety_margin(current_price, liq_px, my_is_long)
                 level, emoji = get_risk_level(margin)
 
@@ -190,7 +193,7 @@ def main():
                 else:
                     act = execute_risk_management(exchange, COIN, margin, level, current_price, liq_px)
                     if act == "closed":
-                        time.sleep(LOOP_SLEEP_SECONDS)
+                        cycle.sleep(LOOP_SLEEP_SECONDS)
                         continue
 
                 # --- 🆕 持仓方向不一致时自动调整 ---
@@ -198,14 +201,14 @@ def main():
                     print(f"⚠️ 持仓方向不一致 -> 平掉当前仓位并调整方向")
                     exchange.market_close(COIN)
                     exchange.update_leverage(target_lev, COIN)
-                    new_sz = math.floor((MY_INVESTMENT_USD / current_price) / 0.01) * 0.01
+                    new_sz = meta_cache.floor_size(MY_INVESTMENT_USD / current_price, sz_decimals)
                     print(f"🧮 计算出的开仓数量: {new_sz:.8f}, 当前价格: {current_price}, 投入USD: {MY_INVESTMENT_USD}")
                     order = exchange.market_open(COIN, target_is_long, new_sz, None, 0.01)
                     print(f"🔁 仓位调整完成: {json.dumps(order)}")
 
 
             print(f"⏳ 等待 {LOOP_SLEEP_SECONDS}s 后继续监控...")
-            time.sleep(LOOP_SLEEP_SECONDS)
+            cycle.sleep(LOOP_SLEEP_SECONDS)
 
     except KeyboardInterrupt:
         print("\n🛑 检测到手动中断，安全退出")
@@ -214,6 +217,7 @@ def main():
         print(f"\n❌ 未知错误: {e}")
         traceback.print_exc()
     finally:
+        execution.teardown(exchange, info)
         print("程序已退出。")
 
 
@@ -1,8 +1,14 @@
 import random
-import math
 import time
 import json
+import argparse
 import example_utils
+import execution
+import heartbeat
+import log_pipeline
+import meta_cache
+import metrics
+from account_state import AccountSnapshot
 from hyperliquid.utils import constants
 
 # --- 核心配置参数 ---
@@ -44,30 +50,17 @@ def get_random_sleep():
 def get_random_profit():
     return BASE_MULTIPLE + random.uniform(0, RANDOM_MULTIPLE)
 
-def get_position_info(user_state, coin_name):
-    for p in user_state.get("assetPositions", []):
-        pos = p.get("position", {})
-        if pos.get("coin") == coin_name:
-            return pos
-    return None
-
-def get_accurate_liquidation_price(user_state, coin_name, current_price):
-    try:
-        for p in user_state.get("assetPositions", []):
-            pos = p.get("position", {})
-            if pos.get("coin") == coin_name:
-                if "liquidationPx" in pos:
-                    return float(pos["liquidationPx"])
-                lev = float(pos.get("leverage", {}).get("value", 1))
-                szi = float(pos.get("szi", 0))
-                if szi > 0:
-                    return current_price * (1 - 0.95 / lev)
-                elif szi < 0:
-                    return current_price * (1 + 0.95 / lev)
-        return None
-    except Exception as e:
-        print(f"⚠️ 获取清算价格失败: {e}")
+def get_position_liquidation_price(pos, current_price):
+    """从 Position 中获取清算价格，无清算价时按杠杆估算"""
+    if not pos:
         return None
+    if pos.liquidation_px is not None:
+        return pos.liquidation_px
+    if pos.szi > 0:
+        return current_price * (1 - 0.95 / pos.leverage)
+    elif pos.szi < 0:
+        return current_price * (1 + 0.95 / pos.leverage)
+    return None
 
 def calculate_safety_margin(current_price, liquidation_price, is_long):
     if not liquidation_price or liquidation_price <= 0:
@@ -100,12 +93,12 @@ def execute_risk_management(exchange, coin, safety_margin, risk_level, current_p
     print(f"🚨 风控触发！安全边际: {safety_margin:.1f}% ({risk_level})")
     if safety_margin <= AUTO_CLOSE_PERCENT:
         print(f"💥 安全边际过低({safety_margin:.1f}%) -> 紧急平仓")
-        close_result = exchange.market_close(coin)
+        close_result = execution.direct(exchange).market_close(coin)
         print(f"✅ 平仓结果: {json.dumps(close_result)}")
         last_risk_close_time = time.time()
         sleep_time = get_random_sleep()
         print(f"⏳ 风控平仓后等待 {sleep_time:.1f}s")
-        time.sleep(sleep_time)
+        heartbeat.sleep(sleep_time)
         return "closed"
     return "warning"
 
@@ -125,38 +118,24 @@ def should_reopen_after_risk_close():
 def calculate_gross_roe(my_pos, current_price):
     if not my_pos:
         return 0.0
-    try:
-        roe = my_pos.get("returnOnEquity")
-        if roe is not None:
-            return float(roe)
-    except:
-        pass
+    if my_pos.return_on_equity is not None:
+        return my_pos.return_on_equity
     # fallback
-    try:
-        entry_px = float(my_pos.get("entryPx") or my_pos.get("avgEntryPrice") or my_pos.get("entryPrice") or 0)
-        if entry_px <= 0:
-            return 0.0
-        is_long = float(my_pos.get("szi", 0)) > 0
-        return (current_price - entry_px) / entry_px if is_long else (entry_px - current_price) / entry_px
-    except:
+    entry_px = my_pos.entry_px
+    if entry_px <= 0:
         return 0.0
+    return (current_price - entry_px) / entry_px if my_pos.is_long else (entry_px - current_price) / entry_px
 
 def calculate_holding_fee(my_pos):
     if not my_pos:
         return 0.0
-    try:
-        cum = my_pos.get("cumFunding", {})
-        since_open = cum.get("sinceOpen")
-        if since_open is not None:
-            return float(since_open)
-    except:
-        pass
+    if my_pos.funding_since_open is not None:
+        return my_pos.funding_since_open
     # fallback估算
     try:
-        open_time = float(my_pos.get("openTime", time.time()))
+        open_time = float(my_pos.raw.get("openTime", time.time()))
         hours_held = (time.time() - open_time) / 3600
-        leverage = int(my_pos.get("leverage", {}).get("value", 1))
-        return FUNDING_RATE_BASE * hours_held * leverage
+        return FUNDING_RATE_BASE * hours_held * my_pos.leverage
     except:
         return 0.0
 
@@ -177,32 +156,46 @@ def should_reopen_after_profit_close():
 # ----------------------
 def main():
     global last_risk_close_time, last_profit_close_time
-    my_address, info, exchange = example_utils.setup(base_url=constants.MAINNET_API_URL)
+    parser = argparse.ArgumentParser(description="跟单机器人 V4")
+    parser.add_argument('--base-url', default=constants.MAINNET_API_URL, help='API 地址，可指向本地 mock_server.py 做压测')
+    parser.add_argument('--metrics-port', type=int, help='在该端口暴露 Prometheus 指标 (/metrics)')
+    parser.add_argument('--execution', choices=execution.EXECUTION_MODES, default='market', help='市价单的执行方式：market 为 1%% 滑点的 IOC，passive 为盘口挂单追价、超时后 IOC')
+    parser.add_argument('--events-file', default='follow_bot_v4.events.jsonl', help="结构化事件 (JSON lines: 轮次、决策、下单耗时) 文件，传空字符串则不写")
+    args = parser.parse_args()
+    heartbeat.setup()
+    log_pipeline.setup(args.events_file)
+    my_address, info, exchange = example_utils.setup(base_url=args.base_url)
+    info, exchange = metrics.setup(args.metrics_port, info, exchange)
+    exchange = execution.setup(args.execution, info, exchange, my_address)
+    cycle = metrics.CycleTimer("follow_bot_v4")
+    metas = meta_cache.get_meta_cache(info)
+    sz_decimals = metas.sz_decimals(COIN, 2)
     print(f"--- 单币随机开平仓机器人 ---\n我的地址: {my_address}\n交易币种: {COIN}")
 
     try:
         while True:
+            cycle.start()
             print(f"\n🕒 {time.strftime('%Y-%m-%d %H:%M:%S')} 获取行情...")
             all_mids = info.all_mids()
-            my_state = info.user_state(my_address)
+            my_state = AccountSnapshot.fetch(info, my_address)
             current_price = float(all_mids.get(COIN, 0))
             if current_price == 0:
                 print("❌ 获取价格失败")
-                time.sleep(get_random_sleep())
+                cycle.sleep(get_random_sleep())
                 continue
 
-            my_pos = get_position_info(my_state, COIN)
+            my_pos = my_state.get(COIN)
             if last_risk_close_time and not should_reopen_after_risk_close():
-                time.sleep(get_random_sleep())
+                cycle.sleep(get_random_sleep())
                 continue
 
             # --- 如果有仓位，先处理风控、止盈、止损 ---
             if my_pos:
-                my_is_long = float(my_pos["szi"]) > 0
-                my_lev = int(my_pos.get("leverage", {}).get("value", 1))
-                my_sz = abs(float(my_pos["szi"]))
-                entry_price = float(my_pos.get("entryPx") or my_pos.get("avgEntryPrice") or my_pos.get("entryPrice") or 0.0)
-                liq_px = get_accurate_liquidation_price(my_state, COIN, current_price)
+                my_is_long = my_pos.is_long
+                my_lev = my_pos.leverage
+                my_sz = my_pos.size
+                entry_price = my_pos.entry_px
+                liq_px = get_position_liquidation_price(my_pos, current_price)
                 margin = calculate_safety_margin(current_price, liq_px, my_is_long)
                 level, emoji = get_risk_level(margin)
                 print(f"📊 我的仓位:${entry_price} {'多单' if my_is_long else '空单'} {my_sz:.4f} {COIN} ({my_lev}x)")
@@ -230,7 +223,7 @@ def main():
                     last_profit_close_time = time.time()
                     sleep_time = get_random_sleep()
                     print(f"⏳ 平仓后等待 {sleep_time:.1f}s 再继续")
-                    time.sleep(sleep_time)
+                    cycle.sleep(sleep_time)
                     continue
 
                 # 亏损止损
@@ -247,20 +240,20 @@ def main():
                         print("💥 1小时内连续3次亏损，执行止损！")
                         loss_times = []  # 重置计数
                         print(f"⚠️ 亏损止损触发 net_profit={net_profit:.6f}")
-                        exchange.market_close(COIN)
+                        execution.direct(exchange).market_close(COIN)
                         last_profit_close_time = time.time()
                         loss_counter = 0
                         sleep_time = get_random_sleep()
                         print(f"⏳ 平仓后等待 {sleep_time:.1f}s 再继续")
-                        time.sleep(sleep_time)
+                        cycle.sleep(sleep_time)
                         continue
 
             # --- 开仓逻辑 ---
             if my_pos is None and should_reopen_after_profit_close():
-                sz = math.floor((MY_INVESTMENT_USD / current_price) / 0.01) * 0.01
+                sz = meta_cache.floor_size(MY_INVESTMENT_USD / current_price, sz_decimals)
                 if sz * current_price < 10:
                     print(f"⚠️ 开仓规模过小: {sz*current_price:.2f} USD，跳过")
-                    time.sleep(get_random_sleep())
+                    cycle.sleep(get_random_sleep())
                     continue
                 # 随机多空
                 is_long = random.choice([True, False])
@@ -268,9 +261,9 @@ def main():
                 exchange.update_leverage(lev, COIN)
                 order = exchange.market_open(COIN, is_long, sz, None, 0.01)
                 print(f"✅ 新开仓: {'多单' if is_long else '空单'}, 数量={sz:.8f}, 杠杆={lev}x, 价格={current_price}")
-                time.sleep(BASE_SLEEP_SECONDS)
+                cycle.sleep(BASE_SLEEP_SECONDS)
                 continue        
-            time.sleep(BASE_SLEEP_SECONDS)
+            cycle.sleep(BASE_SLEEP_SECONDS)
 
     except KeyboardInterrupt:
         print("\n🛑 手动中断，安全退出")
@@ -279,6 +272,7 @@ def main():
         print(f"\n❌ 未知错误: {e}")
         traceback.print_exc()
     finally:
+        execution.teardown(exchange, info)
         print("程序已退出。")
 
 if __name__ == "__main__":
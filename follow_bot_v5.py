@@ -1,12 +1,25 @@
+import os
 import random
-import math
 import time
 import json
+import argparse
 import numpy as np
+import checkpoint
+import coin_state
+import metrics
+import request_scheduler
+import transport
 import example_utils
+import execution
+import heartbeat
+import log_pipeline
 import ema
+import meta_cache
+from scheduler import CooldownScheduler, CheckGapMonitor
+from account_state import AccountSnapshot
+from order_batch import OrderBatch
 from hyperliquid.utils import constants
-from datetime import datetime
+from datetime import date, datetime
 
 # =========================
 # === 核心策略参数 ===
@@ -19,11 +32,17 @@ RANDOM_SLEEP_MAX = 120
 ALL_COINS = ["ETH", "SOL", "ZEC", "ASTER"]  # 支持的币种
 OPEN_ALL_COINS = False  # True = 所有币种开仓，False = 随机选一个币种开仓
 
+# 入场参数
+ENTRY_PROBABILITY = 0.3                  # 趋势明确时每轮随机入场的概率
+LEVERAGE_CHOICES = [5, 10, 15, 20, 25]   # 开仓杠杆随机取值（不超过币种的杠杆上限）
+MIN_ORDER_USD = 10                       # 低于该名义价值不开仓
+
 # 风控参数
 LIQUIDATION_WARNING_PERCENT = 10.0
 LIQUIDATION_DANGER_PERCENT = 3.5
 AUTO_CLOSE_PERCENT = 1.3
 RISK_COOLDOWN_MINUTES = 5
+LIQUIDATION_BUFFER = 0.95          # 无清算价时按 当前价 * (1 ∓ 0.95 / 杠杆) 估算
 
 # 盈利止盈参数
 FEE_RATIO = 0.011
@@ -36,60 +55,148 @@ FUNDING_RATE_BASE = 0.0001
 MAX_LOSS_PERCENT = -0.02
 LOSS_CONFIRM_COUNT = 2
 WINDOW_SECONDS = 3600
+STOP_VOL_THRESHOLD = 0.006         # 止损的波动率基准：平滑波动率高于它时止损阈值按比例放宽，且才确认止损
 VOL_WINDOW = 10                    # 波动平滑窗口大小（最近10次采样）
+VOL_HISTORY_SIZE = 50              # 止损用的平滑波动率：每个币种最近50次采样的均值
+
+# 运行状态持久化文件（冷却、止损计数、波动率历史、当日选币），重启后恢复
+STATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".follow_bot_v5.state.sqlite")
 
 # 全局状态
-last_risk_close_time = None
-last_profit_close_time = None
-loss_times = []
-vol_history = []
+cooldowns = CooldownScheduler()   # 风控/止盈冷却与平仓后的延迟开仓，不阻塞主循环
+risk_check_gaps = CheckGapMonitor()
+coin_states = coin_state.CoinStates(VOL_HISTORY_SIZE, WINDOW_SECONDS, LOSS_CONFIRM_COUNT)   # 每个币种独立的波动率与止损计数
 daily_selected_coin = None
 daily_date = None
 
+# =========================
+# === 状态持久化 ===
+# =========================
+def export_state():
+    """需要跨重启保留的运行状态"""
+    return {
+        "cooldowns": cooldowns.snapshot(),
+        "coin_states": coin_states.snapshot(),
+        "daily_selected_coin": daily_selected_coin,
+        "daily_date": daily_date.isoformat() if daily_date else None,
+    }
+
+def restore_state(state):
+    """恢复 export_state() 保存的状态；当日选币只在仍属于币种列表时恢复"""
+    global daily_selected_coin, daily_date
+    cooldowns.restore(state.get("cooldowns") or {})
+    coin_states.restore(state.get("coin_states") or {})
+    if state.get("daily_date") and state.get("daily_selected_coin") in ALL_COINS:
+        daily_selected_coin = state["daily_selected_coin"]
+        daily_date = date.fromisoformat(state["daily_date"])
+
 # =========================
 # === 工具函数 ===
 # =========================
 def get_random_sleep():
     return BASE_SLEEP_SECONDS + random.uniform(0, RANDOM_SLEEP_MAX)
 
+def schedule_close_sleep():
+    """平仓后的随机等待只推迟重新开仓，主循环继续监控所有币种，返回等待时长"""
+    sleep_time = get_random_sleep()
+    cooldowns.defer("close_pause", sleep_time)
+    return sleep_time
+
 def get_random_profit():
     return BASE_MULTIPLE + random.uniform(0, RANDOM_MULTIPLE)
 
-def get_position_info(user_state, coin_name):
-    for p in user_state.get("assetPositions", []):
-        pos = p.get("position", {})
-        if pos.get("coin") == coin_name:
-            return pos
-    return None
-
-def get_accurate_liquidation_price(user_state, coin_name, current_price):
-    try:
-        for p in user_state.get("assetPositions", []):
-            pos = p.get("position", {})
-            if pos.get("coin") == coin_name:
-                if "liquidationPx" in pos:
-                    return float(pos["liquidationPx"])
-                lev = float(pos.get("leverage", {}).get("value", 1))
-                szi = float(pos.get("szi", 0))
-                if szi > 0:
-                    return current_price * (1 - 0.95 / lev)
-                elif szi < 0:
-                    return current_price * (1 + 0.95 / lev)
-        return None
-    except Exception as e:
-        print(f"⚠️ 获取清算价格失败: {e}")
+def get_position_liquidation_price(pos, current_price):
+    """从单个 Position 中获取清算价格，无清算价时按杠杆估算"""
+    if not pos or pos.szi == 0:
         return None
+    if pos.liquidation_px is not None:
+        return pos.liquidation_px
+    return estimated_liquidation_px(current_price, 1 if pos.is_long else -1, pos.leverage)
+
+# =========================
+# === 决策阈值 ===
+# =========================
+# 只做阈值计算，不读写状态；参数可以是标量，也可以是 NumPy 数组。backtest.py 用同一组函数整段向量化回测，
+# 修改决策规则时回测自动跟随
+TREND_SIGN = {"LONG": 1, "SHORT": -1}
+
+def allowed_leverages(max_lev):
+    return [l for l in LEVERAGE_CHOICES if not max_lev or l <= max_lev] or [max_lev]
+
+def entry_size(current_price, sz_decimals):
+    """按 MY_INVESTMENT_USD 计算开仓数量，sz_decimals 为空时不取整"""
+    sz = MY_INVESTMENT_USD / current_price
+    return sz if sz_decimals is None else meta_cache.floor_size(sz, sz_decimals)
+
+def estimated_liquidation_px(price, direction, leverage):
+    """交易所未给出清算价时按杠杆估算"""
+    return price * (1 - direction * LIQUIDATION_BUFFER / leverage)
+
+def liquidation_distance(price, liquidation_px, direction):
+    """距清算价的百分比（安全边际），不小于 0"""
+    return np.maximum(direction * (price - liquidation_px) / price * 100, 0)
+
+def estimated_holding_fee(hours, leverage):
+    """交易所未给出累计资金费时按持仓时长和杠杆估算"""
+    return FUNDING_RATE_BASE * hours * leverage
+
+def is_auto_close(safety_margin):
+    """安全边际低到需要立即平仓"""
+    return safety_margin <= AUTO_CLOSE_PERCENT
+
+def is_trend_reversed(direction, trend_sign):
+    """持仓方向（1 多 / -1 空）与 EMA 趋势（1 / -1，0 为不明确）相反"""
+    return trend_sign == -direction
+
+def position_return(entry_px, current_price, direction):
+    """不含杠杆的价格收益率"""
+    return (current_price / entry_px - 1) * direction
+
+def take_profit_threshold(profit_multiple, holding_fee):
+    """净收益（ROE - 资金费）达到 随机倍数 * (手续费 + 资金费) 时止盈"""
+    return profit_multiple * (FEE_RATIO + holding_fee)
+
+def dynamic_stop_loss(leverage, smooth_vol):
+    """动态止损阈值：杠杆越高越宽（最多 2 倍），平滑波动率超过基准时按比例放宽"""
+    return MAX_LOSS_PERCENT * np.minimum(leverage / 10, 2.0) / np.maximum(1.0, smooth_vol / STOP_VOL_THRESHOLD)
+
+def stop_loss_confirmed(smooth_vol):
+    """连续触发后，波动率偏高才执行止损"""
+    return smooth_vol > STOP_VOL_THRESHOLD
+
+# =========================
+# === 每轮调用统计 ===
+# =========================
+class RestCallCounter:
+    """包装 Info，统计每轮循环实际发出的 REST 请求次数"""
+
+    # 这些方法只读本地数据或走 websocket，不计入 REST
+    LOCAL_METHODS = {"subscribe", "unsubscribe", "name_to_asset", "disconnect_websocket"}
+
+    def __init__(self, info):
+        self._info = info
+        self.calls = 0
+        self.by_method = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self._info, name)
+        if not callable(attr) or name in self.LOCAL_METHODS:
+            return attr
+
+        def counted(*args, **kwargs):
+            self.calls += 1
+            self.by_method[name] = self.by_method.get(name, 0) + 1
+            return attr(*args, **kwargs)
+        return counted
+
+    def reset(self):
+        self.calls = 0
+        self.by_method = {}
 
 def calculate_safety_margin(current_price, liquidation_price, is_long):
-    if not liquidation_price or liquidation_price <= 0:
-        return None
-    try:
-        if is_long:
-            return max(((current_price - liquidation_price) / current_price) * 100, 0)
-        else:
-            return max(((liquidation_price - current_price) / current_price) * 100, 0)
-    except:
+    if not liquidation_price or liquidation_price <= 0 or not current_price:
         return None
+    return float(liquidation_distance(current_price, liquidation_price, 1 if is_long else -1))
 
 def get_risk_level(safety_margin):
     if safety_margin is None:
@@ -106,146 +213,117 @@ def get_risk_level(safety_margin):
 def should_trigger_risk_management(safety_margin):
     return safety_margin is not None and safety_margin < LIQUIDATION_WARNING_PERCENT
 
-def execute_risk_management(exchange, coin, safety_margin, risk_level, current_price, liquidation_price):
-    global last_risk_close_time
+def execute_risk_management(batch, coin, my_pos, safety_margin, risk_level, current_price, liquidation_price):
     print(f"🚨 风控触发！安全边际: {safety_margin:.1f}% ({risk_level})")
-    if safety_margin <= AUTO_CLOSE_PERCENT:
+    if is_auto_close(safety_margin):
         print(f"💥 安全边际过低({safety_margin:.1f}%) -> 紧急平仓")
-        close_result = exchange.market_close(coin)
+        # 临近清算，不等本轮其余币种处理完，立即单独提交
+        close_result = batch.close_now(coin, my_pos.szi, label="风控平仓", mid=current_price)
         print(f"✅ 平仓结果: {json.dumps(close_result)}")
-        last_risk_close_time = time.time()
-        sleep_time = get_random_sleep()
-        print(f"⏳ 风控平仓后等待 {sleep_time:.1f}s")
-        time.sleep(sleep_time)
+        cooldowns.defer("risk", RISK_COOLDOWN_MINUTES * 60)
+        sleep_time = schedule_close_sleep()
+        print(f"⏳ 风控平仓后 {sleep_time:.1f}s 内不开新仓")
         return "closed"
     return "warning"
 
 def should_reopen_after_risk_close():
-    global last_risk_close_time
-    if last_risk_close_time is None:
-        return True
-    cooldown = RISK_COOLDOWN_MINUTES * 60
-    elapsed = time.time() - last_risk_close_time
-    if elapsed < cooldown:
-        remain = cooldown - elapsed
+    remain = cooldowns.remaining("risk")
+    if remain > 0:
         print(f"⏳ 风控冷却中: {int(remain // 60)}分{int(remain % 60)}秒")
         return False
-    last_risk_close_time = None
     return True
 
 def calculate_gross_roe(my_pos, current_price):
     if not my_pos:
         return 0.0
-    try:
-        roe = my_pos.get("returnOnEquity")
-        if roe is not None:
-            return float(roe)
-    except:
-        pass
-    try:
-        entry_px = float(my_pos.get("entryPx") or my_pos.get("avgEntryPrice") or my_pos.get("entryPrice") or 0)
-        if entry_px <= 0:
-            return 0.0
-        is_long = float(my_pos.get("szi", 0)) > 0
-        return (current_price - entry_px) / entry_px if is_long else (entry_px - current_price) / entry_px
-    except:
+    if my_pos.return_on_equity is not None:
+        return my_pos.return_on_equity
+    if my_pos.entry_px <= 0:
         return 0.0
+    return position_return(my_pos.entry_px, current_price, 1 if my_pos.is_long else -1)
 
 def calculate_holding_fee(my_pos):
     if not my_pos:
         return 0.0
+    if my_pos.funding_since_open is not None:
+        return my_pos.funding_since_open
     try:
-        cum = my_pos.get("cumFunding", {})
-        since_open = cum.get("sinceOpen")
-        if since_open is not None:
-            return float(since_open)
-    except:
-        pass
-    try:
-        open_time = float(my_pos.get("openTime", time.time()))
-        hours_held = (time.time() - open_time) / 3600
-        leverage = int(my_pos.get("leverage", {}).get("value", 1))
-        return FUNDING_RATE_BASE * hours_held * leverage
-    except:
+        open_time = float(my_pos.raw.get("openTime", time.time()))
+    except (TypeError, ValueError):
         return 0.0
+    return estimated_holding_fee((time.time() - open_time) / 3600, my_pos.leverage)
 
 def should_reopen_after_profit_close():
-    global last_profit_close_time
-    if last_profit_close_time is None:
-        return True
-    elapsed = time.time() - last_profit_close_time
-    if elapsed >= PROFIT_CLOSE_COOLDOWN:
-        last_profit_close_time = None
-        return True
-    remain = PROFIT_CLOSE_COOLDOWN - elapsed
-    print(f"⏳ 盈利平仓冷却中: {int(remain)}秒后才能重新开仓")
-    return False
+    remain = cooldowns.remaining("profit")
+    if remain > 0:
+        print(f"⏳ 盈利平仓冷却中: {int(remain)}秒后才能重新开仓")
+        return False
+    return True
+
+def should_reopen_after_close_pause():
+    remain = cooldowns.remaining("close_pause")
+    if remain > 0:
+        print(f"⏳ 平仓后等待中: {remain:.1f}秒后才能重新开仓")
+        return False
+    return True
 
 
-def should_stop_loss(my_pos, current_price, my_lev, volatility):
+def should_stop_loss(coin, my_pos, current_price, my_lev, volatility):
     """
-    更稳健的动态止损判断函数（带平滑波动检测）
+    更稳健的动态止损判断函数（带平滑波动检测），波动率与触发计数按币种分开统计
     """
+    state = coin_states[coin]
 
     # === Step 1: 计算净浮动盈亏 ===
-    entry_price = float(my_pos.get("entryPx") or my_pos.get("avgEntryPrice") or 0)
+    entry_price = my_pos.entry_px
     if entry_price == 0:
         return False
 
-    my_is_long = float(my_pos.get("szi", 0)) > 0
-    net_profit = (current_price / entry_price - 1) * (1 if my_is_long else -1)
+    net_profit = position_return(entry_price, current_price, 1 if my_pos.is_long else -1)
 
     # === Step 2: 平滑波动率 ===
-    vol_history.append(volatility)
-    if len(vol_history) > 50: 
-       vol_history.pop(0)
-    smooth_vol = np.mean(vol_history) if vol_history else volatility
+    smooth_vol = state.vol.add(volatility)
 
     # === Step 3: 动态止损阈值 ===
-    dyn_stop_loss = MAX_LOSS_PERCENT * min(my_lev / 10, 2.0) / max(1.0, smooth_vol / 0.006)
+    dyn_stop_loss = dynamic_stop_loss(my_lev, smooth_vol)
 
     print(f"动态止损 net_profit={net_profit:.6f},stop_loss_profit={dyn_stop_loss:.6f}")
     # === Step 4: 检测是否触发止损 ===
     if net_profit <= dyn_stop_loss:
-        loss_times.append(time.time())
         # 在时间窗口内统计触发次数
-        now = time.time()
-        loss_in_window = [t for t in loss_times if now - t <= WINDOW_SECONDS]
-        print(f"⚠️ 止损检测: net={net_profit:.4f}, dyn={dyn_stop_loss:.4f}, 次数={len(loss_in_window)}")
+        loss_count = state.losses.add()
+        print(f"⚠️ 止损检测: net={net_profit:.4f}, dyn={dyn_stop_loss:.4f}, 次数={loss_count}")
 
-        if len(loss_in_window) >= LOSS_CONFIRM_COUNT:
+        if loss_count >= LOSS_CONFIRM_COUNT:
             # 二次确认：连续亏损 + 波动上升
-            if smooth_vol > 0.006:
+            if stop_loss_confirmed(smooth_vol):
                 print(f"💥 连续 {LOSS_CONFIRM_COUNT} 次止损触发 + 高波动({smooth_vol:.4f}) → 执行止损！")
-                loss_times.clear()
+                state.losses.clear()
                 return True
             else:
                 print(f"📊 波动率较低({smooth_vol:.4f})，暂缓止损确认。")
     else:
         # 盈利或回撤修复，自动清零触发计数
-        loss_times.clear()
+        state.losses.clear()
 
     return False
 
 # =========================
 # === 仓位处理函数 ===
 # =========================
-def handle_position(exchange, coin, my_pos, current_price, info):
-    """处理已有仓位：风控/止盈/EMA反向平仓"""
-    global loss_times, last_profit_close_time
-
-    my_is_long = float(my_pos.get("szi", 0)) > 0
-    my_lev = int(my_pos.get("leverage", {}).get("value", 1))
-    my_sz = abs(float(my_pos.get("szi", 0)))
-    entry_price = float(my_pos.get("entryPx") or my_pos.get("avgEntryPrice") or my_pos.get("entryPrice") or 0.0)
-
-    liq_px = get_accurate_liquidation_price(info.user_state(my_address), coin, current_price)
+def handle_position(batch, coin, my_pos, current_price, info):
+    """处理已有仓位：风控/止盈/EMA反向平仓，my_pos 为本轮快照中的 Position，平仓单加入本轮 batch"""
+    my_is_long = my_pos.is_long
+    my_lev = my_pos.leverage
+    my_sz = my_pos.size
+    entry_price = my_pos.entry_px
+
+    liq_px = get_position_liquidation_price(my_pos, current_price)
     margin = calculate_safety_margin(current_price, liq_px, my_is_long)
     level, emoji = get_risk_level(margin)
 
-       # 计算短期波动率
-    closes = ema.get_kline_data(info, coin, "15m")
-    volatility = ema.calculate_volatility(closes)
+    # 计算短期波动率（ema 模块增量维护，不再每轮下载整段K线）
+    volatility = ema.get_volatility(info, coin, "15m")
 
     print(f"📊 我的仓位:${entry_price} {'多单' if my_is_long else '空单'} {my_sz:.4f} {coin} ({my_lev}x)")
     if liq_px:
@@ -253,48 +331,41 @@ def handle_position(exchange, coin, my_pos, current_price, info):
 
     # 风控平仓
     if should_trigger_risk_management(margin):
-        act = execute_risk_management(exchange, coin, margin, level, current_price, liq_px)
+        act = execute_risk_management(batch, coin, my_pos, margin, level, current_price, liq_px)
         if act == "closed":
             return True
 
     gross_roe = calculate_gross_roe(my_pos, current_price)
     holding_fee = calculate_holding_fee(my_pos)
-    total_fee = FEE_RATIO + holding_fee
     net_profit = gross_roe - holding_fee
 
 
     # EMA趋势反向平仓
     trend = ema.get_ema_trend(info, coin,"15m")
-    if trend:
-        if my_is_long and trend == "SHORT":
-            print(f"🔄 EMA反向平仓触发，多单 -> 空单趋势")
-            exchange.market_close(coin)
-            last_profit_close_time = time.time()
-            time.sleep(get_random_sleep())
-            return True
-        elif not my_is_long and trend == "LONG":
-            print(f"🔄 EMA反向平仓触发，空单 -> 多单趋势")
-            exchange.market_close(coin)
-            last_profit_close_time = time.time()
-            time.sleep(get_random_sleep())
-            return True
+    if is_trend_reversed(1 if my_is_long else -1, TREND_SIGN.get(trend, 0)):
+        print(f"🔄 EMA反向平仓触发，{'多单 -> 空单趋势' if my_is_long else '空单 -> 多单趋势'}")
+        batch.market_close(coin, my_pos.szi, label="EMA反向平仓")
+        cooldowns.defer("profit", PROFIT_CLOSE_COOLDOWN)
+        schedule_close_sleep()
+        return True
 
     # 盈利止盈
     PROFIT_MULTIPLE = get_random_profit()
-    close_profit = PROFIT_MULTIPLE * total_fee
+    close_profit = take_profit_threshold(PROFIT_MULTIPLE, holding_fee)
     print(f"动态止盈 net_profit={net_profit:.6f},close_profit={close_profit:.6f}")
     if net_profit >= close_profit:
         print(f"💹 盈利止盈触发 net_profit={net_profit:.6f}")
-        exchange.market_close(coin)
-        last_profit_close_time = time.time()
-        time.sleep(get_random_sleep())
+        batch.market_close(coin, my_pos.szi, label="盈利止盈")
+        cooldowns.defer("profit", PROFIT_CLOSE_COOLDOWN)
+        schedule_close_sleep()
         return True
 
     # === 调用止损逻辑 ===
-    if should_stop_loss(my_pos, current_price, my_lev, volatility):
-        exchange.market_close(coin)
-        last_profit_close_time = time.time()
-        time.sleep(get_random_sleep())
+    if should_stop_loss(coin, my_pos, current_price, my_lev, volatility):
+        # 止损与风控平仓一样立即以 IOC 提交
+        batch.close_now(coin, my_pos.szi, label="止损", mid=current_price)
+        cooldowns.defer("profit", PROFIT_CLOSE_COOLDOWN)
+        schedule_close_sleep()
         return True
 
     return False
@@ -302,20 +373,22 @@ def handle_position(exchange, coin, my_pos, current_price, info):
 # =========================
 # === 开仓函数 ===
 # =========================
-def open_position(exchange, coin, current_price, trend):
-    """趋势内随机入场"""
-    if random.random() > 0.3:
+def open_position(batch, metas, coin, current_price, trend):
+    """趋势内随机入场，数量精度和杠杆上限取自元数据缓存；下单时返回 True"""
+    if random.random() > ENTRY_PROBABILITY:
         print("🎲 随机未触发入场，等待下一轮")
         return
-    sz = math.floor((MY_INVESTMENT_USD / current_price) / 0.01) * 0.01
-    if sz * current_price < 10:
+    sz = entry_size(current_price, metas.sz_decimals(coin, 2))
+    if sz * current_price < MIN_ORDER_USD:
         print(f"⚠️ 开仓规模过小: {sz*current_price:.2f} USD，跳过")
         return
     is_long = (trend == "LONG")
-    lev = random.choice([5, 10, 15, 20, 25])
-    exchange.update_leverage(lev, coin)
-    exchange.market_open(coin, is_long, sz, None, 0.01)
+    max_lev = metas.max_leverage(coin)
+    lev = random.choice(allowed_leverages(max_lev))
+    batch.update_leverage(lev, coin)
+    batch.market_open(coin, is_long, sz, label="趋势入场")
     print(f"✅ 新开仓: {'多单' if is_long else '空单'}, 数量={sz:.8f}, 杠杆={lev}x, 价格={current_price}")
+    return True
 
 # =========================
 # === 主循环 ===
@@ -334,52 +407,127 @@ def select_coins():
     return [daily_selected_coin]
 
 
+def handle_coin(batch, info, metas, snapshot, coins_to_open, coin, all_mids):
+    """单个币种的一轮决策：不在开仓列表的仓位平掉，已有仓位做风控/止盈止损，空仓时按趋势开仓
+
+    返回本币种的决策（"close"、"hold"、"open"、"wait"、"flat"、"skip"），用于结构化事件。
+    """
+    current_price = float(all_mids.get(coin, 0))
+    if current_price == 0:
+        print(f"❌ 获取价格失败: {coin}")
+        return "skip"
+
+    my_pos = snapshot.get(coin)
+    risk_check_gaps.mark(coin)
+
+    # 如果该币种不在本轮开仓列表，且有仓位，先平仓
+    if coin not in coins_to_open and my_pos:
+        print(f"⚠️  {coin} 不在本轮开仓列表，先平仓")
+        batch.market_close(coin, my_pos.szi, label="不在开仓列表")
+        return "close"
+
+    # 处理已有仓位
+    if my_pos:
+        closed = handle_position(batch, coin, my_pos, current_price, info)
+        return "close" if closed else "hold"
+
+    # 开仓逻辑
+    if coin not in coins_to_open:
+        return "flat"
+    if should_reopen_after_profit_close() and should_reopen_after_risk_close() and should_reopen_after_close_pause():
+        trend = ema.get_ema_trend(info, coin, "15m")
+        if trend:
+            if open_position(batch, metas, coin, current_price, trend):
+                return "open"
+        else:
+            print(f"⏸️  {coin} 趋势不明确，暂不开仓")
+    return "wait"
+
+
+def run_cycle(info, exchange, metas, my_address):
+    """执行一轮：拉取行情与仓位，逐币种风控/止盈止损/开仓，最后批量提交订单，返回提交结果"""
+    print(f"\n🕒 {time.strftime('%Y-%m-%d %H:%M:%S')} 获取行情...")
+    all_mids = info.all_mids()
+    snapshot = AccountSnapshot.fetch(info, my_address)
+    batch = OrderBatch(exchange)
+
+    # 选择本轮要开仓的币种
+    coins_to_open = select_coins()
+
+    try:
+        for coin in ALL_COINS:
+            # 单个币种出错（如K线请求失败）只跳过该币种，不影响其余币种和本轮已加入批次的订单
+            started = time.perf_counter()
+            try:
+                decision = handle_coin(batch, info, metas, snapshot, coins_to_open, coin, all_mids)
+            except transport.CircuitOpenError:
+                raise
+            except Exception as e:
+                print(f"⚠️ {coin} 处理出错，跳过该币种: {type(e).__name__}: {e}")
+                decision = "error"
+            log_pipeline.event("decision", coin=coin, decision=decision, ms=round((time.perf_counter() - started) * 1000, 3))
+    finally:
+        # 本轮所有平仓/开仓合并为批量订单一次提交；已入队平仓单的冷却和平仓后等待已经设置，出错时也要提交
+        results = batch.submit(all_mids) if len(batch) else []
+    return results
+
+
 def main_multi_coin():
-    global my_address, last_risk_close_time, last_profit_close_time
+    global my_address
+
+    parser = argparse.ArgumentParser(description="EMA顺势+反向平仓+止盈止损策略 V5")
+    parser.add_argument('--base-url', default=constants.MAINNET_API_URL, help='API 地址，可指向本地 mock_server.py 做压测')
+    parser.add_argument('--live', action='store_true', help='兼容 start.sh 的启动参数，V5 始终实盘运行')
+    parser.add_argument('--metrics-port', type=int, help='在该端口暴露 Prometheus 指标 (/metrics)')
+    parser.add_argument('--execution', choices=execution.EXECUTION_MODES, default='market', help='市价单的执行方式：market 为 1%% 滑点的 IOC，passive 为盘口挂单追价、超时后 IOC')
+    parser.add_argument('--state-file', default=STATE_PATH, help='运行状态持久化文件，传空字符串则不持久化')
+    parser.add_argument('--fresh', action='store_true', help='忽略已保存的运行状态，从头开始')
+    parser.add_argument('--events-file', default='follow_bot_v5.events.jsonl', help="结构化事件 (JSON lines: 轮次、决策、下单耗时) 文件，传空字符串则不写")
+    args = parser.parse_args()
+    heartbeat.setup()
+    log_pipeline.setup(args.events_file)
 
     # 初始化
-    my_address, info, exchange = example_utils.setup(base_url=constants.MAINNET_API_URL)
+    my_address, raw_info, exchange = example_utils.setup(base_url=args.base_url)
+    raw_info, exchange = metrics.setup(args.metrics_port, raw_info, exchange)
+    exchange = execution.setup(args.execution, raw_info, exchange, my_address)
+    cycle = metrics.CycleTimer("follow_bot_v5")
+    info = RestCallCounter(raw_info)
+    metas = meta_cache.get_meta_cache(raw_info)
+    ema.subscribe_candles(raw_info, ALL_COINS, "15m")
     print(f"--- EMA顺势+反向平仓+止盈止损策略 ---\n地址: {my_address}\n币种列表: {ALL_COINS}\n模式: {'全开' if OPEN_ALL_COINS else '随机开一个'}")
 
+    store = checkpoint.open_store(args.state_file, my_address, args.base_url)
+    if store:
+        if args.fresh:
+            store.clear()
+        saved = store.load()
+        if saved:
+            restore_state(saved)
+            print(f"💾 已恢复运行状态: 冷却 {list(cooldowns.snapshot())}, 币种状态 {len(coin_states)} 个, "
+                  f"当日币种 {daily_selected_coin}")
+
     try:
         while True:
-            print(f"\n🕒 {time.strftime('%Y-%m-%d %H:%M:%S')} 获取行情...")
-            all_mids = info.all_mids()
-
-            # 选择本轮要开仓的币种
-            coins_to_open = select_coins()
-
-            for coin in ALL_COINS:
-                current_price = float(all_mids.get(coin, 0))
-                if current_price == 0:
-                    print(f"❌ 获取价格失败: {coin}")
-                    continue
-
-                my_pos = get_position_info(info.user_state(my_address), coin)
-
-                # 如果该币种不在本轮开仓列表，且有仓位，先平仓
-                if coin not in coins_to_open and my_pos:
-                    print(f"⚠️  {coin} 不在本轮开仓列表，先平仓")
-                    exchange.market_close(coin)
-                    continue
-
-                # 处理已有仓位
-                if my_pos:
-                    handled = handle_position(exchange, coin, my_pos, current_price, info)
-                    if handled:
-                        continue
-
-               # 开仓逻辑
-                else:
-                  if coin in coins_to_open:
-                     if should_reopen_after_profit_close() and should_reopen_after_risk_close():
-                        trend = ema.get_ema_trend(info, coin)
-                        if trend:
-                            open_position(exchange, coin, current_price, trend)
-                        else:
-                            print(f"⏸️  {coin} 趋势不明确，暂不开仓")
-
-            time.sleep(BASE_SLEEP_SECONDS)
+            info.reset()
+            cycle.start()
+            # 单轮出错只跳过本轮，不退出进程（避免冷启动和重新解密私钥）；下一轮按最新仓位重新决策
+            try:
+                run_cycle(info, exchange, metas, my_address)
+            except transport.CircuitOpenError as e:
+                print(f"🔌 熔断中，跳过本轮: {e}")
+            except Exception as e:
+                print(f"⚠️ 本轮出错，跳过: {type(e).__name__}: {e}")
+            cycle.stop()
+            if store:
+                store.save(export_state())
+
+            print(f"📡 本轮 REST 调用: {info.calls} 次 {info.by_method}")
+            print(f"🚦 请求权重: {request_scheduler.get_scheduler().summary()}")
+            gaps = risk_check_gaps.summary()
+            if gaps:
+                print("⏱️ 风控检查间隔(最近/最坏): " + ", ".join(f"{c} {last:.0f}s/{worst:.0f}s" for c, (last, worst) in gaps.items()))
+            heartbeat.sleep(cooldowns.sleep_seconds(BASE_SLEEP_SECONDS))
 
     except KeyboardInterrupt:
         print("\n🛑 手动中断，安全退出")
@@ -388,10 +536,14 @@ def main_multi_coin():
         print(f"\n❌ 未知错误: {e}")
         traceback.print_exc()
     finally:
+        try:
+            if store:
+                store.save(export_state())
+                store.close()
+        finally:
+            execution.teardown(exchange, raw_info)
         print("程序已退出。")
 
 
-
 if __name__ == "__main__":
     main_multi_coin()
-
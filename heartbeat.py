@@ -0,0 +1,54 @@
+"""
+心跳：由 supervisor.py 启动时，通过管道向守护进程报告主循环仍在推进。
+
+每次心跳写入一行 "<秒数>"，表示下一次心跳最迟在这么多秒后到达（一轮循环的上限或本次等待的时长）；
+超过期限（加上守护进程的宽限时间）仍无心跳，守护进程判定进程卡死并重启。
+未由 supervisor.py 启动（没有 HEARTBEAT_FD 环境变量）时 beat() 什么也不做。
+
+setup() 把 SIGTERM 转成 KeyboardInterrupt，各脚本已有的 KeyboardInterrupt/finally 清理逻辑（保存状态、停止拆单等）在停止时照常执行。
+"""
+import os
+import signal
+import threading
+import time
+
+ENV_FD = "HEARTBEAT_FD"
+CYCLE_TIMEOUT = 120.0   # 一轮循环（行情、计算、下单）的最长耗时，超过视为卡死
+
+_fd = None
+_lock = threading.Lock()
+
+
+def setup():
+    """在脚本 main() 开头调用：打开心跳管道，并让 SIGTERM 触发 KeyboardInterrupt 以便优雅退出"""
+    global _fd
+    fd = os.environ.get(ENV_FD)
+    if fd and _fd is None:
+        _fd = int(fd)
+        os.set_blocking(_fd, False)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _on_sigterm)
+
+
+def _on_sigterm(signum, frame):
+    raise KeyboardInterrupt("SIGTERM")
+
+
+def beat(expect=CYCLE_TIMEOUT):
+    """报告存活，expect 为下一次心跳的最长间隔（秒）；管道写满或守护进程已退出时丢弃"""
+    global _fd
+    if _fd is None:
+        return
+    with _lock:
+        try:
+            os.write(_fd, f"{expect:.1f}\n".encode())
+        except BlockingIOError:
+            pass
+        except OSError:
+            _fd = None
+
+
+def sleep(seconds):
+    """在两轮循环之间等待，等待期间不判定为卡死"""
+    beat(seconds)
+    time.sleep(seconds)
@@ -0,0 +1,238 @@
+"""
+异步日志管道：把日志和 print 的写盘从交易主循环移到后台线程，磁盘卡顿不再推迟下单。
+
+- attach(logger, handlers)：logger 只挂一个 QueueHandler，原来的 FileHandler/StreamHandler 由 QueueListener 在后台线程中写出；
+- redirect_stdout()：sys.stdout 换成写队列的对象，print 只入队，后台线程合并后批量写出（stderr 保持同步，崩溃堆栈不会丢）；
+- event(kind, **fields)：结构化事件，按 JSON lines 写入单独的文件（按大小轮转），自动带上当前轮次编号 cycle；
+  CycleTimer 每轮写 "cycle"（耗时），OrderBatch 每次批量下单写 "order"（状态、请求耗时），follow_bot_v5 和 ds_copier_v2 每个币种写 "decision"；
+- 抽样：带 extra={"sample": key} 的重复消息（如 "in sync"）同一 key 每 SAMPLE_SECONDS 秒最多输出一条，并注明期间省略的条数。
+
+队列写满时丢弃新消息并计数（不阻塞主循环），下一次写出时注明丢弃条数。进程正常退出时 atexit 写完队列中剩余内容；
+被 SIGKILL 时队列中尚未写出的内容会丢失。
+"""
+import io
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+QUEUE_SIZE = 100000
+LOG_MAX_BYTES = 50 * 1024 * 1024   # 单个日志/事件文件的大小上限，超过后轮转
+LOG_BACKUPS = 5
+SAMPLE_SECONDS = 300.0             # 同一 key 的抽样消息最多每这么多秒输出一条
+FLUSH_SECONDS = 0.2                # 异步 stdout 的最长写出间隔
+
+events_logger = logging.getLogger("hl.events")
+events_logger.propagate = False
+events_logger.setLevel(logging.INFO)
+
+cycle_id = 0
+_listeners = []     # [(logger, QueueHandler, QueueListener)]
+_stream = None
+
+
+class DropCountingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃并计数，而不是阻塞调用方"""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SampleFilter(logging.Filter):
+    """带 sample 属性的记录按 key 限频，放行时在消息末尾注明期间省略的条数"""
+
+    def __init__(self, interval=SAMPLE_SECONDS, clock=time.monotonic):
+        super().__init__()
+        self.interval = interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.last = {}          # key -> (上次放行时间, 之后省略的条数)
+
+    def filter(self, record):
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        now = self.clock()
+        with self.lock:
+            last, suppressed = self.last.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self.last[key] = (last, suppressed + 1)
+                return False
+            self.last[key] = (now, 0)
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar message(s) suppressed)"
+            record.args = None
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """每条记录一行 JSON：时间、级别、消息和 extra={"event": {...}} 中的字段"""
+
+    def format(self, record):
+        data = {"ts": round(record.created, 3), "level": record.levelname}
+        data.update(getattr(record, "event", None) or {"msg": record.getMessage()})
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class AsyncStream(io.TextIOBase):
+    """代替 sys.stdout：write() 只入队，后台线程把积累的内容合并成一次写出"""
+
+    def __init__(self, target, maxsize=QUEUE_SIZE, flush_seconds=FLUSH_SECONDS):
+        self.target = target
+        self.queue = queue.Queue(maxsize)
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self.closed_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="log-stdout", daemon=True)
+        self.thread.start()
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return False
+
+    @property
+    def encoding(self):
+        return getattr(self.target, "encoding", "utf-8")
+
+    def fileno(self):
+        return self.target.fileno()
+
+    def write(self, s):
+        try:
+            self.queue.put_nowait(s)
+        except queue.Full:
+            self.dropped += 1
+        return len(s)
+
+    def flush(self):
+        # 不等待写盘；print(flush=True) 也不会阻塞主循环
+        pass
+
+    def _run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                if self.closed_event.is_set():
+                    return
+                continue
+            if first is None:
+                return
+            chunks = [first]
+            stop = False
+            while True:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                chunks.append(item)
+            if self.dropped:
+                chunks.append(f"[log_pipeline] dropped {self.dropped} write(s), queue full\n")
+                self.dropped = 0
+            try:
+                self.target.write("".join(chunks))
+                self.target.flush()
+            except Exception:
+                pass
+            if stop:
+                return
+
+    def close_and_drain(self, timeout=5.0):
+        """写完队列中的内容后停止后台线程"""
+        self.closed_event.set()
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
+
+
+def attach(logger, handlers, sample=True, filters=()):
+    """把 handlers 移到后台线程：logger 只保留一个 QueueHandler（可选抽样过滤），返回 QueueListener
+
+    filters 加在 QueueHandler 上，在调用方线程中执行，可以给记录补充线程/上下文相关的字段。
+    """
+    q = queue.Queue(QUEUE_SIZE)
+    queue_handler = DropCountingQueueHandler(q)
+    for log_filter in filters:
+        queue_handler.addFilter(log_filter)
+    if sample:
+        queue_handler.addFilter(SampleFilter())
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append((logger, queue_handler, listener))
+    return listener
+
+
+def rotating_file_handler(path, formatter=None):
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+    if formatter is not None:
+        handler.setFormatter(formatter)
+    return handler
+
+
+def redirect_stdout():
+    """sys.stdout 改为异步写出，返回 AsyncStream；重复调用时返回已有的实例"""
+    global _stream
+    if _stream is None:
+        _stream = AsyncStream(sys.stdout)
+        sys.stdout = _stream
+    return _stream
+
+
+def setup(events_file=None, async_stdout=True):
+    """脚本 main() 开头调用：stdout 异步写出，events_file 非空时启用结构化事件"""
+    if async_stdout:
+        redirect_stdout()
+    if events_file:
+        attach(events_logger, [rotating_file_handler(events_file, JsonLinesFormatter())], sample=False)
+
+
+def next_cycle():
+    """开始新的一轮，返回轮次编号；之后的事件都带上这个编号"""
+    global cycle_id
+    cycle_id += 1
+    return cycle_id
+
+
+def event(kind, **fields):
+    """写一条结构化事件；未启用事件文件时直接返回，几乎没有开销"""
+    if not events_logger.handlers:
+        return
+    fields = {"event": kind, "cycle": cycle_id, **fields}
+    events_logger.info(kind, extra={"event": fields})
+
+
+@atexit.register
+def shutdown():
+    """停止所有后台写线程，写完队列中剩余的内容，并从 logger 上摘下 QueueHandler"""
+    global _stream
+    while _listeners:
+        logger, queue_handler, listener = _listeners.pop()
+        logger.removeHandler(queue_handler)
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+    if _stream is not None:
+        sys.stdout = _stream.target
+        _stream.close_and_drain()
+        _stream = None
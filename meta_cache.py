@@ -0,0 +1,188 @@
+"""
+交易所元数据缓存：按币种名索引 szDecimals / maxLeverage / 资产编号。
+
+元数据（连同 spotMeta）持久化到本地文件，在 TTL 内重启时直接读取文件：example_utils.setup 把文件中的
+meta/spot_meta 传给 Info 和 Exchange 的构造函数，SDK 启动时不再请求元数据；
+后台线程按 TTL 定期刷新，新上线的币种或调整过的 szDecimals 会被自动拾取，并通过 set_perp_meta
+推送到 register_clients 登记的 SDK Info（包括 Exchange 内部的 Info），新币种随即可以下单。
+所有脚本通过 get_meta_cache(info) 共享同一个实例。
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlparse
+
+from hyperliquid.utils import constants
+
+CACHE_PATH = os.path.join(os.path.dirname(__file__), ".meta_cache.json")
+CACHE_TTL_SECONDS = 3600
+
+AssetMeta = namedtuple("AssetMeta", ["name", "sz_decimals", "max_leverage", "asset"])
+
+_clients = []   # 登记的 SDK Info，元数据刷新后同步其币种映射
+
+
+class MetaCache:
+    def __init__(self, info, path=CACHE_PATH, ttl=CACHE_TTL_SECONDS):
+        self.info = info
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.assets = {}
+        self.spot_meta = None
+        self.fetched_at = 0.0
+        self._refresh_thread = None
+        self._load_file()
+        if not self.is_fresh():
+            try:
+                self.refresh()
+            except Exception:
+                # 文件里还有旧数据时继续使用，由后台刷新补上
+                if not self.assets:
+                    raise
+                print(f"⚠️ 刷新元数据失败，暂用 {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.fetched_at))} 的缓存")
+
+    def is_fresh(self):
+        return bool(self.assets) and time.time() - self.fetched_at < self.ttl
+
+    def get(self, coin):
+        return self.assets.get(coin)
+
+    def __contains__(self, coin):
+        return coin in self.assets
+
+    def sz_decimals(self, coin, default=None):
+        asset = self.assets.get(coin)
+        return asset.sz_decimals if asset else default
+
+    def max_leverage(self, coin, default=None):
+        asset = self.assets.get(coin)
+        return asset.max_leverage if asset else default
+
+    def refresh(self):
+        """请求 info.meta()，原子地替换内存索引和本地文件，并把新元数据推送到登记的 SDK Info"""
+        meta = self.info.meta()
+        fetched_at = time.time()
+        assets = _index_universe(meta["universe"])
+        with self.lock:
+            self.assets = assets
+            self.fetched_at = fetched_at
+        for client in list(_clients):
+            # 只增补/覆盖映射：下架的币种保留旧条目，资产编号不会变
+            client.set_perp_meta(meta, 0)
+        if self.path:
+            _write_file(self.path, meta, self.spot_meta, fetched_at)
+        return assets
+
+    def start_background_refresh(self):
+        if self._refresh_thread is None:
+            self._refresh_thread = threading.Thread(target=self._refresh_loop, name="meta-refresh", daemon=True)
+            self._refresh_thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(max(self.ttl - (time.time() - self.fetched_at), 1))
+            try:
+                old = set(self.assets)
+                new = set(self.refresh())
+                if new - old:
+                    print(f"🆕 元数据刷新，新增币种: {sorted(new - old)}")
+            except Exception as e:
+                print(f"⚠️ 后台刷新元数据失败: {e}")
+                time.sleep(60)
+
+    def _load_file(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path) as f:
+                cached = json.load(f)
+            self.assets = _index_universe(cached["meta"]["universe"])
+            self.spot_meta = cached.get("spot_meta")
+            self.fetched_at = float(cached["fetched_at"])
+        except (OSError, ValueError, KeyError, TypeError):
+            self.assets = {}
+            self.spot_meta = None
+            self.fetched_at = 0.0
+
+
+def _read_file(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_file(path, meta, spot_meta, fetched_at):
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump({"fetched_at": fetched_at, "meta": meta, "spot_meta": spot_meta}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️ 写入元数据缓存失败: {e}")
+
+
+def load_client_meta(base_url, ttl=CACHE_TTL_SECONDS):
+    """返回缓存文件中 TTL 内的 (meta, spot_meta)，供 Info/Exchange 构造函数使用；文件缺失、过期或没有 spotMeta 时返回 (None, None)"""
+    cached = _read_file(cache_path_for(base_url))
+    try:
+        if time.time() - float(cached["fetched_at"]) < ttl and cached["meta"]["universe"] and cached.get("spot_meta"):
+            return cached["meta"], cached["spot_meta"]
+    except (KeyError, TypeError, ValueError):
+        pass
+    return None, None
+
+
+def save_client_meta(base_url, meta, spot_meta):
+    """启动时请求到的 meta/spot_meta 写入缓存文件，随后创建的 MetaCache 直接使用"""
+    _write_file(cache_path_for(base_url), meta, spot_meta, time.time())
+
+
+def register_clients(*infos):
+    """登记 SDK 的 Info 对象（不要传包装后的代理）：后台刷新后对其调用 set_perp_meta，新上线的币种可以下单"""
+    for info in infos:
+        if not any(info is client for client in _clients):
+            _clients.append(info)
+
+
+def _index_universe(universe):
+    # 永续合约的资产编号即其在 universe 中的下标
+    return {
+        item["name"]: AssetMeta(item["name"], item["szDecimals"], item.get("maxLeverage"), index)
+        for index, item in enumerate(universe)
+    }
+
+
+def cache_path_for(base_url):
+    """主网使用 CACHE_PATH，其他地址（测试网、本地 mock_server）各用一个文件，互不覆盖"""
+    if not base_url or base_url == constants.MAINNET_API_URL:
+        return CACHE_PATH
+    netloc = urlparse(base_url).netloc or base_url
+    safe = "".join(ch if ch.isalnum() else "_" for ch in netloc)
+    return os.path.join(os.path.dirname(__file__), f".meta_cache.{safe}.json")
+
+
+def floor_size(sz, sz_decimals):
+    """按 szDecimals 向下取整下单数量，避免超过预算或被交易所拒绝"""
+    factor = 10 ** sz_decimals
+    return math.floor(sz * factor + 1e-9) / factor
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_meta_cache(info, background_refresh=True):
+    """返回进程内共享的元数据缓存，首次调用时创建并启动后台刷新"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = MetaCache(info, path=cache_path_for(getattr(info, "base_url", None)))
+            if background_refresh:
+                _shared.start_background_refresh()
+    return _shared
@@ -0,0 +1,224 @@
+"""
+API 调用与循环耗时指标，以 Prometheus 文本格式在本地 HTTP 端口暴露。
+
+instrument(info, exchange) 返回包装后的对象：每个方法调用按 (对象, 方法) 记录延迟直方图、
+错误次数和请求权重；订单签名单独计时。observe_cycle() 记录各脚本每轮循环的总耗时。
+未启用时各脚本不包装 info/exchange，热路径上没有额外开销；启用后每次调用只多一次计时和加锁累加。
+
+用法: python follow_bot_v5.py --metrics-port 9101 ，然后 curl http://127.0.0.1:9101/metrics
+"""
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import heartbeat
+import log_pipeline
+from request_scheduler import LOCAL_METHODS, request_weight
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CYCLE_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}   # (kind, method) -> Histogram
+        self.errors = {}    # (kind, method, error) -> count
+        self.weight = {}    # (kind, method) -> total weight
+        self.cycles = {}    # bot -> Histogram
+
+    def observe_call(self, kind, method, seconds, weight, error=None):
+        key = (kind, method)
+        with self.lock:
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+            self.weight[key] = self.weight.get(key, 0) + weight
+            if error:
+                error_key = (kind, method, error)
+                self.errors[error_key] = self.errors.get(error_key, 0) + 1
+
+    def observe_cycle(self, bot, seconds):
+        with self.lock:
+            histogram = self.cycles.get(bot)
+            if histogram is None:
+                histogram = self.cycles[bot] = Histogram(CYCLE_BUCKETS)
+            histogram.observe(seconds)
+
+    def render(self):
+        """Prometheus 文本格式"""
+        lines = []
+        with self.lock:
+            lines += ["# HELP hl_api_latency_seconds Latency of Info/Exchange calls.", "# TYPE hl_api_latency_seconds histogram"]
+            for (kind, method), histogram in sorted(self.latency.items()):
+                lines += _render_histogram("hl_api_latency_seconds", f'kind="{kind}",method="{method}"', histogram)
+            lines += ["# HELP hl_api_errors_total Failed Info/Exchange calls.", "# TYPE hl_api_errors_total counter"]
+            for (kind, method, error), count in sorted(self.errors.items()):
+                lines.append(f'hl_api_errors_total{{kind="{kind}",method="{method}",error="{error}"}} {count}')
+            lines += ["# HELP hl_api_weight_total Rate limit weight consumed.", "# TYPE hl_api_weight_total counter"]
+            for (kind, method), weight in sorted(self.weight.items()):
+                lines.append(f'hl_api_weight_total{{kind="{kind}",method="{method}"}} {weight}')
+            lines += ["# HELP hl_cycle_duration_seconds Duration of one bot loop cycle.", "# TYPE hl_cycle_duration_seconds histogram"]
+            for bot, histogram in sorted(self.cycles.items()):
+                lines += _render_histogram("hl_cycle_duration_seconds", f'bot="{bot}"', histogram)
+        return "\n".join(lines) + "\n"
+
+
+def _render_histogram(name, labels, histogram):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.6f}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+registry = Registry()
+
+
+def _response_error(result):
+    """交易所返回 status=err 或订单状态中带 error 时视为失败"""
+    if not isinstance(result, dict):
+        return None
+    if result.get("status") == "err":
+        return "status_err"
+    data = result.get("response", {})
+    statuses = data.get("data", {}).get("statuses", []) if isinstance(data, dict) else []
+    if any(isinstance(status, dict) and "error" in status for status in statuses):
+        return "order_error"
+    return None
+
+
+class InstrumentedProxy:
+    """包装 Info 或 Exchange，记录每次调用的延迟、错误和权重；包装后的方法缓存在实例上"""
+
+    def __init__(self, target, kind, registry=registry):
+        self._target = target
+        self._kind = kind
+        self._registry = registry
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or name in LOCAL_METHODS:
+            return attr
+        kind, observe = self._kind, self._registry.observe_call
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                observe(kind, name, time.perf_counter() - started, request_weight(kind, name, args, None), type(e).__name__)
+                raise
+            observe(kind, name, time.perf_counter() - started, request_weight(kind, name, args, result),
+                    _response_error(result) if kind == "exchange" else None)
+            return result
+        # 之后的访问直接命中实例属性，不再经过 __getattr__
+        self.__dict__[name] = timed
+        return timed
+
+
+_signing_timed = False
+
+
+def time_signing(registry=registry):
+    """给 SDK 的 L1 动作签名计时，区分签名耗时与网络耗时"""
+    global _signing_timed
+    if _signing_timed:
+        return
+    import hyperliquid.exchange as hl_exchange
+    sign = hl_exchange.sign_l1_action
+
+    def timed_sign(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return sign(*args, **kwargs)
+        finally:
+            registry.observe_call("sign", "sign_l1_action", time.perf_counter() - started, 0)
+    hl_exchange.sign_l1_action = timed_sign
+    _signing_timed = True
+
+
+def instrument(info, exchange, registry=registry):
+    time_signing(registry)
+    return InstrumentedProxy(info, "info", registry), InstrumentedProxy(exchange, "exchange", registry)
+
+
+def observe_cycle(bot, seconds):
+    registry.observe_cycle(bot, seconds)
+    log_pipeline.event("cycle", bot=bot, ms=round(seconds * 1000, 3))
+
+
+class CycleTimer:
+    """记录一轮循环从 start() 到 stop()/sleep() 的耗时，不含循环末尾的等待；start() 和 sleep() 同时发出心跳，start() 开始新的事件轮次"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.started = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        heartbeat.beat()
+        log_pipeline.next_cycle()
+
+    def stop(self):
+        if self.started is not None:
+            observe_cycle(self.bot, time.perf_counter() - self.started)
+            self.started = None
+
+    def sleep(self, seconds):
+        self.stop()
+        heartbeat.sleep(seconds)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        data = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port, host="127.0.0.1", registry=registry):
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+def setup(port, info, exchange):
+    """port 为空时原样返回；否则启动指标端口并返回包装后的 info/exchange"""
+    if not port:
+        return info, exchange
+    start_server(port)
+    print(f"📈 指标端口: http://127.0.0.1:{port}/metrics")
+    return instrument(info, exchange)
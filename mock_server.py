@@ -0,0 +1,451 @@
+"""
+本地模拟 Hyperliquid API，用于压测和延迟测试，不连接主网。
+
+实现各脚本用到的 /info 查询（meta、spotMeta、allMids、clearinghouseState、spotClearinghouseState、
+candleSnapshot、l2Book、openOrders、userFills、orderStatus）和 /exchange 动作（order、cancel、modify、
+updateLeverage）。价格是按币种和时间确定的平滑曲线，K线与 allMids 一致；
+下单地址从签名中恢复，穿过盘口的订单按买一/卖一（中间价 ± HALF_SPREAD）立即成交，GTC/ALO 挂单在中间价穿过限价时按限价成交。
+未下过单、也没有查询过 spotClearinghouseState 的地址视为模拟的跟单目标，仓位每 --target-period 秒变化一次。
+
+可注入延迟、随机 5xx 错误、订单拒绝和限流 (429)。GET /stats 返回请求统计。
+
+用法:
+    python mock_server.py --port 8081 --coins 50 --latency-ms 50 --error-rate 0.01 --rate-limit 100
+    python ds_copier_v2.py --live --base-url http://127.0.0.1:8081
+"""
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from hyperliquid.utils.signing import recover_agent_or_user_from_l1_action
+
+from ema import INTERVAL_SECONDS
+
+BASE_COINS = ["BTC", "ETH", "SOL", "XRP", "DOGE", "BNB", "ZEC", "ASTER", "HYPE", "SUI", "AVAX", "LINK"]
+TAKER_FEE = 0.00045
+MAKER_FEE = 0.00015
+HALF_SPREAD = 0.0001        # 买一/卖一与中间价的相对距离，l2Book 每档再远一个 HALF_SPREAD
+MAX_ORDER_STATUS = 10000    # 已结束订单的状态最多保留这么多条
+MAX_CANDLES = 5000
+
+
+def _unit(*parts):
+    """由参数确定的 [0, 1) 伪随机数"""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+
+def _fmt(x):
+    return f"{x:.8g}"
+
+
+class Market:
+    """确定性的价格曲线：相同币种和时间总是得到相同价格"""
+
+    def __init__(self, coin_count, seed=0):
+        self.seed = seed
+        self.coins = [BASE_COINS[i] if i < len(BASE_COINS) else f"COIN{i}" for i in range(coin_count)]
+        self.universe = []
+        self.params = {}
+        for coin in self.coins:
+            base = 10 ** (_unit(seed, coin, "base") * 5 - 1)      # 0.1 ~ 10000
+            sz_decimals = max(0, min(5, int(4 - math.log10(base))))
+            self.universe.append({"name": coin, "szDecimals": sz_decimals, "maxLeverage": random.Random(coin).choice([10, 20, 25, 40])})
+            self.params[coin] = (base, _unit(seed, coin, "p1") * 2 * math.pi, _unit(seed, coin, "p2") * 2 * math.pi)
+        self.asset_by_index = {i: item["name"] for i, item in enumerate(self.universe)}
+
+    def price(self, coin, t):
+        base, phase1, phase2 = self.params[coin]
+        slow = 0.03 * math.sin(2 * math.pi * t / 21600 + phase1)
+        fast = 0.008 * math.sin(2 * math.pi * t / 2220 + phase2)
+        noise = (_unit(self.seed, coin, int(t)) - 0.5) * 0.0008
+        return base * math.exp(slow + fast + noise)
+
+    def mids(self, t):
+        return {coin: _fmt(self.price(coin, t)) for coin in self.coins}
+
+    def candles(self, coin, interval, start_ms, end_ms):
+        step = INTERVAL_SECONDS[interval]
+        first = start_ms // 1000 // step * step
+        last = min(end_ms // 1000, int(time.time()))
+        count = min(max((last - first) // step + 1, 0), MAX_CANDLES)
+        first = max(first, last // step * step - (count - 1) * step)
+        result = []
+        for i in range(count):
+            t = first + i * step
+            samples = [self.price(coin, min(t + step * k / 4, last)) for k in range(5)]
+            result.append({"t": t * 1000, "T": (t + step) * 1000 - 1, "s": coin, "i": interval,
+                           "o": _fmt(samples[0]), "c": _fmt(samples[-1]), "h": _fmt(max(samples)),
+                           "l": _fmt(min(samples)), "v": "1000", "n": 100})
+        return result
+
+
+class Account:
+    """一个可交易账户：现金、仓位、杠杆设置、挂单和成交记录"""
+
+    def __init__(self, cash):
+        self.cash = cash
+        self.positions = {}     # coin -> [szi, entry_px]
+        self.leverage = {}      # coin -> (value, is_cross)
+        self.open_orders = {}   # oid -> order
+        self.closed_orders = {} # oid -> (order, 状态)，用于 orderStatus 查询已成交/已撤销的订单
+        self.fills = []
+
+
+class MockExchange:
+    def __init__(self, market, equity=10000.0, target_period=300, order_reject_rate=0.0):
+        self.market = market
+        self.equity = equity
+        self.target_period = target_period
+        self.order_reject_rate = order_reject_rate
+        self.lock = threading.Lock()
+        self.accounts = {}
+        self.next_oid = 1
+        self.stats = defaultdict(int)
+
+    # --- 账户 ---
+    def account(self, address, create=False):
+        address = address.lower()
+        if create and address not in self.accounts:
+            self.accounts[address] = Account(self.equity)
+        return self.accounts.get(address)
+
+    def target_positions(self, address, now):
+        """模拟跟单目标的仓位，每个周期按地址和币种确定性地变化"""
+        epoch = int(now // self.target_period)
+        positions = {}
+        for coin in self.market.coins:
+            if _unit(address, coin, epoch, "open") < 0.4:
+                continue
+            price = self.market.price(coin, epoch * self.target_period)
+            notional = 1000 + _unit(address, coin, epoch, "size") * 49000
+            side = 1 if _unit(address, coin, epoch, "side") < 0.5 else -1
+            leverage = 3 + int(_unit(address, coin, "lev") * 18)
+            positions[coin] = (side * notional / price, price, leverage, False)
+        return positions
+
+    def clearinghouse_state(self, address, now):
+        account = self.account(address)
+        if account is None:
+            positions = self.target_positions(address.lower(), now)
+            cash = self.equity * 10
+        else:
+            self._match_resting(account, now)
+            positions = {coin: (szi, entry, *account.leverage.get(coin, (20, True)))
+                         for coin, (szi, entry) in account.positions.items() if szi}
+            cash = account.cash
+        asset_positions = []
+        total_upnl = total_margin = total_ntl = 0.0
+        for coin, (szi, entry, leverage, is_cross) in positions.items():
+            mid = self.market.price(coin, now)
+            value = abs(szi) * mid
+            upnl = szi * (mid - entry)
+            margin = value / leverage
+            liq = entry * (1 - 0.9 / leverage) if szi > 0 else entry * (1 + 0.9 / leverage)
+            total_upnl += upnl
+            total_margin += margin
+            total_ntl += value
+            asset_positions.append({"type": "oneWay", "position": {
+                "coin": coin, "szi": _fmt(szi), "entryPx": _fmt(entry), "positionValue": _fmt(value),
+                "unrealizedPnl": _fmt(upnl), "returnOnEquity": _fmt(upnl / (abs(szi) * entry / leverage)),
+                "liquidationPx": _fmt(liq), "marginUsed": _fmt(margin), "maxLeverage": 50,
+                "leverage": {"type": "cross" if is_cross else "isolated", "value": leverage},
+                "cumFunding": {"allTime": "0.0", "sinceOpen": "0.0", "sinceChange": "0.0"},
+            }})
+        account_value = cash + total_upnl
+        summary = {"accountValue": _fmt(account_value), "totalNtlPos": _fmt(total_ntl),
+                   "totalRawUsd": _fmt(cash), "totalMarginUsed": _fmt(total_margin)}
+        return {"assetPositions": asset_positions, "marginSummary": summary, "crossMarginSummary": summary,
+                "withdrawable": _fmt(max(account_value - total_margin, 0)), "time": int(now * 1000)}
+
+    # --- 下单 ---
+    def place(self, account, wire, now):
+        coin = self.market.asset_by_index.get(wire["a"])
+        if coin is None:
+            return {"error": f"Unknown asset {wire['a']}"}
+        if random.random() < self.order_reject_rate:
+            self.stats["orders_rejected"] += 1
+            return {"error": "Injected order rejection."}
+        is_buy, px, sz = wire["b"], float(wire["p"]), float(wire["s"])
+        if wire.get("r"):
+            szi = account.positions.get(coin, [0.0, 0.0])[0]
+            if szi == 0 or (szi > 0) == is_buy:
+                return {"error": "Reduce only order would increase position."}
+            sz = min(sz, abs(szi))
+        mid = self.market.price(coin, now)
+        touch = mid * (1 + HALF_SPREAD) if is_buy else mid * (1 - HALF_SPREAD)
+        crosses = px >= touch if is_buy else px <= touch
+        tif = wire["t"].get("limit", {}).get("tif", "Gtc")
+        oid = self.next_oid
+        self.next_oid += 1
+        self.stats["orders"] += 1
+        if crosses and tif == "Alo":
+            return {"error": "Post only order would have immediately matched, bbo was " + _fmt(touch)}
+        if crosses:
+            self._fill(account, coin, is_buy, sz, touch, oid, now, TAKER_FEE, wire.get("c"))
+            return {"filled": {"totalSz": _fmt(sz), "avgPx": _fmt(touch), "oid": oid}}
+        if tif == "Ioc":
+            return {"error": "Order could not immediately match against any resting orders. asset=" + str(wire["a"])}
+        account.open_orders[oid] = {"coin": coin, "side": "B" if is_buy else "A", "limitPx": _fmt(px), "sz": _fmt(sz),
+                                    "origSz": _fmt(sz), "oid": oid, "timestamp": int(now * 1000), "reduceOnly": bool(wire.get("r")),
+                                    "cloid": wire.get("c")}
+        return {"resting": {"oid": oid}}
+
+    def _fill(self, account, coin, is_buy, sz, px, oid, now, fee_rate, cloid=None):
+        szi, entry = account.positions.get(coin, [0.0, 0.0])
+        signed = sz if is_buy else -sz
+        new_szi = szi + signed
+        closed_pnl = 0.0
+        if szi == 0 or (szi > 0) == is_buy:
+            entry = (abs(szi) * entry + sz * px) / abs(new_szi)
+        else:
+            closed = min(sz, abs(szi))
+            closed_pnl = closed * (px - entry) * (1 if szi > 0 else -1)
+            if abs(new_szi) > 1e-12 and (new_szi > 0) != (szi > 0):
+                entry = px
+        fee = sz * px * fee_rate
+        account.cash += closed_pnl - fee
+        account.positions[coin] = [0.0 if abs(new_szi) < 1e-12 else new_szi, entry]
+        opening = szi == 0 or (szi > 0) == is_buy
+        direction = f"Open {'Long' if is_buy else 'Short'}" if opening else f"Close {'Long' if szi > 0 else 'Short'}"
+        fill = {"coin": coin, "px": _fmt(px), "sz": _fmt(sz), "side": "B" if is_buy else "A", "time": int(now * 1000),
+                "startPosition": _fmt(szi), "dir": direction,
+                "closedPnl": _fmt(closed_pnl), "hash": f"0x{oid:064x}", "oid": oid, "crossed": fee_rate == TAKER_FEE,
+                "fee": _fmt(fee), "tid": oid, "feeToken": "USDC"}
+        if cloid:
+            fill["cloid"] = cloid
+        account.fills.append(fill)
+        self.stats["fills"] += 1
+        return fill
+
+    def _match_resting(self, account, now):
+        """挂单在当前中间价穿过限价时按限价成交（maker）"""
+        for oid, order in list(account.open_orders.items()):
+            mid = self.market.price(order["coin"], now)
+            px = float(order["limitPx"])
+            is_buy = order["side"] == "B"
+            if (is_buy and mid <= px) or (not is_buy and mid >= px):
+                del account.open_orders[oid]
+                sz = float(order["sz"])
+                if order["reduceOnly"]:
+                    szi = account.positions.get(order["coin"], [0.0, 0.0])[0]
+                    if szi == 0 or (szi > 0) == is_buy:
+                        self._close_order(account, order, "reduceOnlyCanceled")
+                        continue
+                    sz = min(sz, abs(szi))
+                self._close_order(account, dict(order, sz=_fmt(float(order["sz"]) - sz)), "filled")
+                self._fill(account, order["coin"], is_buy, sz, px, oid, now, MAKER_FEE, order.get("cloid"))
+
+    def cancel(self, account, oid=None, cloid=None):
+        for key, order in list(account.open_orders.items()):
+            if key == oid or (cloid is not None and order.get("cloid") == cloid):
+                del account.open_orders[key]
+                self._close_order(account, order, "canceled")
+                return "success"
+        return {"error": "Order was never placed, already canceled, or filled."}
+
+    def _close_order(self, account, order, status):
+        account.closed_orders[order["oid"]] = (order, status)
+        if len(account.closed_orders) > MAX_ORDER_STATUS:
+            del account.closed_orders[next(iter(account.closed_orders))]
+
+    def exchange(self, payload, now):
+        action = payload["action"]
+        address = self._signer(payload)
+        account = self.account(address, create=True)
+        self._match_resting(account, now)
+        kind = action["type"]
+        self.stats[f"exchange:{kind}"] += 1
+        if kind == "order":
+            statuses = [self.place(account, wire, now) for wire in action["orders"]]
+            return {"status": "ok", "response": {"type": "order", "data": {"statuses": statuses}}}
+        if kind in ("cancel", "cancelByCloid"):
+            statuses = [self.cancel(account, oid=c.get("o"), cloid=c.get("cloid")) for c in action["cancels"]]
+            return {"status": "ok", "response": {"type": "cancel", "data": {"statuses": statuses}}}
+        if kind in ("modify", "batchModify"):
+            modifies = action["modifies"] if kind == "batchModify" else [action]
+            statuses = []
+            for modify in modifies:
+                result = self.cancel(account, oid=modify["oid"] if isinstance(modify["oid"], int) else None,
+                                     cloid=modify["oid"] if isinstance(modify["oid"], str) else None)
+                statuses.append(result if isinstance(result, dict) else self.place(account, modify["order"], now))
+            return {"status": "ok", "response": {"type": "batchModify" if kind == "batchModify" else "default", "data": {"statuses": statuses}}}
+        if kind == "updateLeverage":
+            coin = self.market.asset_by_index.get(action["asset"])
+            if coin is None:
+                return {"status": "err", "response": f"Unknown asset {action['asset']}"}
+            account.leverage[coin] = (int(action["leverage"]), bool(action["isCross"]))
+            return {"status": "ok", "response": {"type": "default"}}
+        return {"status": "ok", "response": {"type": "default"}}
+
+    def _signer(self, payload):
+        if payload.get("vaultAddress"):
+            return payload["vaultAddress"]
+        try:
+            return recover_agent_or_user_from_l1_action(payload["action"], payload["signature"], None,
+                                                        payload["nonce"], payload.get("expiresAfter"), False)
+        except Exception:
+            return "0x0000000000000000000000000000000000000000"
+
+    # --- 查询 ---
+    def info(self, body, now):
+        kind = body.get("type")
+        self.stats[f"info:{kind}"] += 1
+        if kind == "meta":
+            return {"universe": self.market.universe}
+        if kind == "spotMeta":
+            return {"universe": [], "tokens": []}
+        if kind == "allMids":
+            return self.market.mids(now)
+        if kind == "clearinghouseState":
+            return self.clearinghouse_state(body["user"], now)
+        if kind == "spotClearinghouseState":
+            # example_utils.setup() 会查询自己的现货余额，借此把该地址登记为可交易账户
+            self.account(body["user"], create=True)
+            return {"balances": [{"coin": "USDC", "token": 0, "total": _fmt(self.equity), "hold": "0.0", "entryNtl": "0.0"}]}
+        if kind == "candleSnapshot":
+            req = body["req"]
+            return self.market.candles(req["coin"], req["interval"], req["startTime"], req["endTime"])
+        if kind == "l2Book":
+            mid = self.market.price(body["coin"], now)
+            levels = [[{"px": _fmt(mid * (1 - side * HALF_SPREAD * (i + 1))), "sz": "10", "n": 1} for i in range(10)] for side in (1, -1)]
+            return {"coin": body["coin"], "time": int(now * 1000), "levels": levels}
+        account = self.account(body.get("user", ""))
+        if account is not None:
+            self._match_resting(account, now)
+        if kind in ("openOrders", "frontendOpenOrders"):
+            return list(account.open_orders.values()) if account else []
+        if kind in ("userFills", "userFillsByTime"):
+            return list(reversed(account.fills[-2000:])) if account else []
+        if kind == "orderStatus":
+            if account and body["oid"] in account.open_orders:
+                return {"status": "order", "order": {"order": account.open_orders[body["oid"]], "status": "open"}}
+            if account and body["oid"] in account.closed_orders:
+                order, status = account.closed_orders[body["oid"]]
+                return {"status": "order", "order": {"order": order, "status": status}}
+            return {"status": "unknownOid"}
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True   # 头和正文分两次写出，避免 Nagle + 延迟 ACK 带来的约 40ms 额外延迟
+
+    def do_GET(self):
+        if self.path == "/stats":
+            state = self.server.state
+            self._reply(200, dict(sorted(state.stats.items())))
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server.state.stats["requests"] += 1
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.random() * server.jitter)
+        if server.bucket and not server.bucket.take():
+            server.state.stats["rate_limited"] += 1
+            return self._reply(429, None)
+        if random.random() < server.error_rate:
+            server.state.stats["errors_injected"] += 1
+            return self._reply(500, {"error": "injected server error"})
+        now = time.time()
+        try:
+            with server.state.lock:
+                if self.path == "/info":
+                    result = server.state.info(body, now)
+                elif self.path == "/exchange":
+                    result = server.state.exchange(body, now)
+                else:
+                    return self._reply(404, {"error": "not found"})
+        except (KeyError, TypeError, ValueError) as e:
+            return self._reply(422, {"error": f"Failed to deserialize the JSON body: {e}"})
+        self._reply(200, result)
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, coins=12, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_limit=0.0,
+                 order_reject_rate=0.0, equity=10000.0, target_period=300, seed=0):
+        super().__init__(address, MockHandler)
+        self.state = MockExchange(Market(coins, seed), equity, target_period, order_reject_rate)
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.bucket = TokenBucket(rate_limit) if rate_limit else None
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="mock-server", daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the Hyperliquid /info and /exchange API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--coins", type=int, default=len(BASE_COINS), help="Number of perp assets in the universe.")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a 500 response per request.")
+    parser.add_argument("--order-reject-rate", type=float, default=0.0, help="Probability of rejecting each order.")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Requests per second before 429, 0 = unlimited.")
+    parser.add_argument("--equity", type=float, default=10000.0)
+    parser.add_argument("--target-period", type=float, default=300, help="Seconds between simulated target position changes.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockServer((args.host, args.port), args.coins, args.latency_ms, args.jitter_ms, args.error_rate,
+                        args.rate_limit, args.order_reject_rate, args.equity, args.target_period, args.seed)
+    print(f"🧪 Mock Hyperliquid API: {server.base_url}  币种 {args.coins}  延迟 {args.latency_ms}ms  错误率 {args.error_rate}  限流 {args.rate_limit or '无'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
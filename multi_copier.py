@@ -0,0 +1,234 @@
+# --- ⚠️ RISK WARNING ---
+# 本脚本在一个进程内同时跟随多个目标地址，所有目标的仓位按各自比例缩放后 **合并** 到您的同一个账户里。
+# 多个目标在同一币种上方向相反时会相互抵消，您的风险取决于所有目标的净敞口。
+# 与 ds_copier_v2.py 相同，默认以模拟模式 (Dry Run) 运行，实盘需显式添加 --live。
+
+import json
+import time
+import asyncio
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import example_utils
+import ds_copier_v2
+import execution
+import heartbeat
+import log_pipeline
+import meta_cache
+import metrics
+import request_scheduler
+import transport
+import twap
+from account_state import AccountSnapshot
+from hyperliquid.utils import constants
+
+# --- 核心配置参数 ---
+
+# 跟随的目标列表，ratio 为该目标仓位复制到我方账户的名义价值比例
+TARGETS = [
+    {"address": "0xc20ac4dc4188660cbf555448af52694ca62b0734", "ratio": 0.0018},
+]
+
+# 跟单的币种列表
+TARGET_COINS = ds_copier_v2.TARGET_COINS
+
+LOOP_SLEEP_SECONDS = 30
+
+# HTTP 连接池大小与并发请求上限，目标数量不超过该值时单轮耗时基本不随目标数增长
+HTTP_POOL_SIZE = 64
+
+# 某个目标拉取失败时，沿用其上一次成功状态的最长时间，超过后本轮不做同步
+TARGET_STATE_MAX_AGE_SECONDS = 120
+
+
+class AsyncInfoClient:
+    """在线程池中并发调用 info 的查询，供 asyncio 使用
+
+    info 为 example_utils.setup() 返回的对象，请求与其他脚本一样经过 transport 的重试和熔断、HL_RECORD 录制、
+    权重调度和指标统计，这里只负责并发；info 的连接池需不小于 pool_size（见 main()）。
+    """
+
+    def __init__(self, info, pool_size=HTTP_POOL_SIZE):
+        self.info = info
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="info")
+        self.semaphore = asyncio.Semaphore(pool_size)
+
+    async def call(self, method, *args):
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, getattr(self.info, method), *args)
+
+    async def all_mids(self):
+        return await self.call("all_mids")
+
+    async def user_state(self, address):
+        return await self.call("user_state", address)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class TargetBook:
+    """保存每个目标最近一次成功拉取的状态，单个目标失败时不影响其他目标"""
+
+    def __init__(self, targets):
+        self.targets = targets
+        self.states = {}
+
+    def update(self, address, account):
+        self.states[address] = (time.time(), account)
+
+    def fresh_states(self):
+        """返回 [(target, AccountSnapshot)]，任一目标状态缺失或过期时返回None"""
+        now = time.time()
+        result = []
+        for target in self.targets:
+            entry = self.states.get(target["address"])
+            if entry is None or now - entry[0] > TARGET_STATE_MAX_AGE_SECONDS:
+                logging.warning(f"No fresh state for target {target['address']}, skipping sync this cycle.")
+                return None
+            result.append((target, entry[1]))
+        return result
+
+
+async def fetch_cycle(client, targets, my_address):
+    """并发拉取行情、我方状态和所有目标的 clearinghouseState"""
+    tasks = [client.all_mids(), client.user_state(my_address)]
+    tasks += [client.user_state(target["address"]) for target in targets]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for result in results[:2]:
+        if isinstance(result, Exception):
+            raise result
+    return results[0], results[1], results[2:]
+
+
+def aggregate_targets(target_accounts, coins):
+    """把所有目标按各自比例缩放后合并成一个虚拟的目标账户（已是我方应持有的 szi）
+
+    同一币种的杠杆取缩放后名义贡献最大的那个目标的杠杆。
+    """
+    net_szi = {}
+    leverage = {}
+    for target, account in target_accounts:
+        for coin in coins:
+            position = account.get(coin)
+            if not position:
+                continue
+            scaled_szi = position.szi * target["ratio"]
+            net_szi[coin] = net_szi.get(coin, 0.0) + scaled_szi
+            if coin not in leverage or abs(scaled_szi) > leverage[coin][0]:
+                leverage[coin] = (abs(scaled_szi), position.leverage)
+
+    asset_positions = []
+    for coin, szi in net_szi.items():
+        if szi == 0:
+            continue
+        asset_positions.append({"position": {"coin": coin, "szi": str(szi), "leverage": {"type": "isolated", "value": leverage[coin][1]}}})
+    return AccountSnapshot({"assetPositions": asset_positions})
+
+
+def sync_positions(exchange, info, all_mids, my_address, aggregated_account, my_account, metas):
+    """在工作线程中执行 ds_copier_v2 的同步逻辑，本轮订单合并为批量请求提交"""
+    ds_copier_v2.sync_coins(exchange, info, all_mids, my_address, aggregated_account, my_account, TARGET_COINS, metas, copy_ratio=1.0)
+
+
+async def run(my_address, info, exchange, metas, targets, once=False):
+    client = AsyncInfoClient(info)
+    book = TargetBook(targets)
+    try:
+        while True:
+            cycle_start = time.perf_counter()
+            heartbeat.beat()
+            log_pipeline.next_cycle()
+            logging.info(f"----- {time.strftime('%Y-%m-%d %H:%M:%S')} - Starting multi-target cycle ({len(targets)} targets) -----")
+            try:
+                all_mids, my_user_state, target_results = await fetch_cycle(client, targets, my_address)
+                my_account = AccountSnapshot(my_user_state)
+                for target, result in zip(targets, target_results):
+                    if isinstance(result, Exception):
+                        logging.warning(f"Failed to fetch target {target['address']}: {result}")
+                    else:
+                        book.update(target["address"], AccountSnapshot(result))
+                fetch_seconds = time.perf_counter() - cycle_start
+
+                target_accounts = book.fresh_states()
+                if target_accounts is not None:
+                    aggregated_account = aggregate_targets(target_accounts, TARGET_COINS)
+                    await asyncio.to_thread(sync_positions, exchange, info, all_mids, my_address, aggregated_account, my_account, metas)
+                cycle_seconds = time.perf_counter() - cycle_start
+                metrics.observe_cycle("multi_copier", cycle_seconds)
+                logging.info(f"Cycle finished: fetch {fetch_seconds * 1000:.0f} ms, total {cycle_seconds * 1000:.0f} ms.")
+                logging.info(f"Request budget: {request_scheduler.get_scheduler().summary()}")
+            except Exception as e:
+                logging.error(f"An error occurred during the multi-target cycle: {e}", exc_info=True)
+
+            if once:
+                break
+            heartbeat.beat(LOOP_SLEEP_SECONDS)
+            await asyncio.sleep(LOOP_SLEEP_SECONDS)
+    finally:
+        client.close()
+
+
+def load_targets(path):
+    with open(path) as f:
+        targets = json.load(f)
+    for target in targets:
+        if "address" not in target or "ratio" not in target:
+            raise ValueError(f"Each target needs 'address' and 'ratio': {target}")
+    return targets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Follow many Hyperliquid addresses from one process.")
+    parser.add_argument('--live', action='store_true', help='Run in live trading mode. Default is a single dry run cycle.')
+    parser.add_argument('--base-url', default=constants.MAINNET_API_URL, help='API URL, e.g. a local mock_server.py for load testing.')
+    parser.add_argument('--metrics-port', type=int, help='Expose Prometheus metrics (/metrics) on this port.')
+    parser.add_argument('--execution', choices=execution.EXECUTION_MODES, default='market', help='How market orders are executed: market = IOC with 1%% slippage, passive = post-only at top of book with chase and IOC fallback.')
+    parser.add_argument('--twap', choices=twap.MODES, default='off', help='Slice orders that are large relative to top-of-book depth into child orders paced by time or by visible volume.')
+    parser.add_argument('--targets', help='JSON file with a list of {"address": ..., "ratio": ...}. Defaults to TARGETS.')
+    parser.add_argument('--events-file', default='multi_copier.events.jsonl', help="Structured JSON-lines events (cycle, decision, order latencies); '' disables.")
+    args = parser.parse_args()
+    heartbeat.setup()
+
+    ds_copier_v2.DRY_RUN = not args.live
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+    ch = logging.StreamHandler()
+    ch.setLevel(logging.INFO)
+    ch.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+    # 与 ds_copier_v2 相同：写出交给后台线程，sync_coins/process_coin 中重复的 "in sync" 等消息按账户和币种抽样
+    log_pipeline.attach(logger, [ch])
+    log_pipeline.setup(args.events_file)
+
+    targets = load_targets(args.targets) if args.targets else TARGETS
+    logging.info(f"--- Multi-target copier: {len(targets)} targets, coins {TARGET_COINS} ---")
+    if ds_copier_v2.DRY_RUN:
+        logging.warning("--- [DRY RUN] mode: running one cycle, no real trades. Use --live to trade. ---")
+
+    try:
+        my_address, info, exchange = example_utils.setup(base_url=args.base_url, skip_ws=True)
+        # 所有目标的并发查询共用 info 的连接，连接池大小与并发数一致
+        transport.tune_session(info.session, HTTP_POOL_SIZE)
+        info, exchange = metrics.setup(args.metrics_port, info, exchange)
+        exchange = execution.setup(args.execution, info, exchange, my_address, log=logging.info)
+        metas = meta_cache.get_meta_cache(info)
+    except Exception as e:
+        logging.error(f"Failed to setup connection: {e}", exc_info=True)
+        return
+    if args.twap != "off":
+        ds_copier_v2.slicers[my_address] = twap.SliceScheduler(exchange, info, metas, args.twap, dry_run=ds_copier_v2.DRY_RUN, log=logging.info)
+
+    try:
+        asyncio.run(run(my_address, info, exchange, metas, targets, once=ds_copier_v2.DRY_RUN))
+    except KeyboardInterrupt:
+        logging.info("KeyboardInterrupt detected. Shutting down.")
+    finally:
+        ds_copier_v2.shutdown_slicers()
+        execution.shutdown(exchange)
+        logging.info("--- Multi-target copier terminated. ---")
+
+
+if __name__ == "__main__":
+    main()
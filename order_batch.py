@@ -0,0 +1,183 @@
+"""
+按轮批量下单：一轮同步中先收集所有下单意图，最后一次性提交。
+
+提交顺序：
+1. 所有只减仓订单合并为一个 bulk_orders 动作（先释放保证金）；
+2. 依次执行杠杆调整（交易所没有批量调整杠杆的接口）；
+3. 所有开仓/加仓订单合并为一个 bulk_orders 动作。
+每个订单的返回状态按顺序映射回对应的币种。减仓未完全成交（报错或 IOC 部分成交）或杠杆调整失败的币种，本批次不再开仓。
+
+紧急平仓（如临近清算的风控平仓、止损）用 close_now() 立即单独提交，不等本轮其余币种处理完，
+并绕过 --execution passive 的挂单追价，始终以 IOC 成交。
+
+传入 slicer（twap.SliceScheduler）时，数量相对盘口过大的币种，其全部订单和杠杆调整整体交给 slicer 在后台拆单执行，
+返回状态为 {"sliced": {"job": 任务编号}}。
+"""
+import json
+import time
+
+import log_pipeline
+
+# 市价单的最大滑点，与各脚本中 market_open(..., 0.01) 保持一致
+DEFAULT_SLIPPAGE = 0.01
+
+QUEUED_RESULT = {"status": "ok", "response": {"type": "queued"}}
+
+
+def slippage_price(exchange, coin, is_buy, slippage=DEFAULT_SLIPPAGE, px=None):
+    """市价单的限价：px（为空时取 allMids 中间价）按滑点偏移，并按交易所的价格精度取整。
+
+    SDK 只把这一逻辑作为私有方法 Exchange._slippage_price 提供，各模块统一经由这里调用。
+    """
+    return exchange._slippage_price(coin, is_buy, slippage, px)
+
+
+def is_complete(order, status):
+    """订单是否已全部执行：报错、挂单未成交或 IOC 部分成交都不算；模拟和拆单交接视为完成"""
+    if "filled" in status:
+        return float(status["filled"]["totalSz"]) >= order["sz"] * (1 - 1e-9)
+    return "error" not in status and "resting" not in status
+
+
+class OrderBatch:
+    """收集一轮内的订单与杠杆调整，在 submit() 时统一提交"""
+
+    def __init__(self, exchange, dry_run=False, log=print, slippage=DEFAULT_SLIPPAGE, slicer=None):
+        self.exchange = exchange
+        self.dry_run = dry_run
+        self.log = log
+        self.slippage = slippage
+        self.slicer = slicer
+        self.reduce_orders = []
+        self.leverage_updates = []
+        self.open_orders = []
+
+    def __len__(self):
+        return len(self.reduce_orders) + len(self.leverage_updates) + len(self.open_orders)
+
+    def market_open(self, coin, is_buy, sz, label=""):
+        self.open_orders.append({"coin": coin, "is_buy": is_buy, "sz": sz, "reduce_only": False, "label": label})
+        return QUEUED_RESULT
+
+    def market_close(self, coin, position_szi, sz=None, label=""):
+        """只减仓平仓，position_szi 为当前持仓的带符号数量，sz 为空时全部平掉"""
+        sz = abs(position_szi) if not sz else sz
+        self.reduce_orders.append({"coin": coin, "is_buy": position_szi < 0, "sz": sz, "reduce_only": True, "label": label})
+        return QUEUED_RESULT
+
+    def update_leverage(self, leverage, coin, is_cross=True, label=""):
+        self.leverage_updates.append({"coin": coin, "leverage": leverage, "is_cross": is_cross, "label": label})
+        return QUEUED_RESULT
+
+    def close_now(self, coin, position_szi, sz=None, label="", mid=None):
+        """立即以 IOC 提交一笔只减仓平仓（不进入批次、不拆单、不走被动执行），返回该订单的状态；mid 为空时按 allMids 计算限价"""
+        import execution   # execution 依赖本模块，在此处导入避免循环导入
+        sz = abs(position_szi) if not sz else sz
+        order = {"coin": coin, "is_buy": position_szi < 0, "sz": sz, "reduce_only": True, "label": label}
+        all_mids = {coin: mid} if mid else None
+        [(_, status)] = self._submit_orders([order], all_mids, execution.direct(self.exchange))
+        return status
+
+    def submit(self, all_mids=None):
+        """提交并清空本批次，返回 [(订单或杠杆调整, 结果)]"""
+        results = self._hand_off_sliced(all_mids) if self.slicer else []
+        # 减仓未完全成交或杠杆调整失败的币种，本批次不再开仓：
+        # 翻转时剩余的旧仓位会与反向开仓单相互抵消，在错误的仓位/杠杆上加仓
+        failed_coins = set()
+        for order, status in self._submit_orders(self.reduce_orders, all_mids):
+            if not is_complete(order, status):
+                failed_coins.add(order["coin"])
+            results.append((order, status))
+        for update in self.leverage_updates:
+            result = self._update_leverage(update)
+            if result.get("status") != "ok":
+                failed_coins.add(update["coin"])
+            results.append((update, result))
+        open_orders = []
+        for order in self.open_orders:
+            if order["coin"] in failed_coins:
+                self.log(f"Skipping {order['coin']} open order because its reduce or leverage step did not complete.")
+                results.append((order, {"error": "skipped after incomplete reduce/leverage step"}))
+            else:
+                open_orders.append(order)
+        results += self._submit_orders(open_orders, all_mids)
+        self.reduce_orders, self.leverage_updates, self.open_orders = [], [], []
+        return results
+
+    def _hand_off_sliced(self, all_mids):
+        """把需要拆单的币种从本批次中取出，按 减仓 -> 杠杆 -> 开仓 的顺序整体交给 slicer"""
+        results = []
+        for coin in dict.fromkeys(order["coin"] for order in self.reduce_orders + self.open_orders):
+            mid = float(all_mids[coin]) if all_mids and coin in all_mids else None
+            orders = [order for order in self.reduce_orders + self.open_orders if order["coin"] == coin]
+            if not any(self.slicer.should_slice(order, mid) for order in orders):
+                continue
+            updates = [update for update in self.leverage_updates if update["coin"] == coin]
+            legs = [order for order in self.reduce_orders if order["coin"] == coin] + updates + \
+                   [order for order in self.open_orders if order["coin"] == coin]
+            self.reduce_orders = [order for order in self.reduce_orders if order["coin"] != coin]
+            self.leverage_updates = [update for update in self.leverage_updates if update["coin"] != coin]
+            self.open_orders = [order for order in self.open_orders if order["coin"] != coin]
+            job = self.slicer.submit(coin, legs, mid)
+            results += [(leg, {"sliced": {"job": job.id}}) for leg in legs]
+        return results
+
+    def _update_leverage(self, update):
+        msg = f"Update {update['coin']} leverage to {update['leverage']}x ({'Cross' if update['is_cross'] else 'Isolated'})"
+        if self.dry_run:
+            self.log(f"[DRY RUN] {msg}")
+            return {"status": "ok", "response": {"type": "dry_run"}}
+        self.log(f"[LIVE] {msg}")
+        try:
+            return self.exchange.update_leverage(update["leverage"], update["coin"], update["is_cross"])
+        except Exception as e:
+            return {"status": "err", "response": str(e)}
+
+    def _submit_orders(self, orders, all_mids, exchange=None):
+        exchange = exchange or self.exchange
+        if not orders:
+            return []
+        for order in orders:
+            side = "Buy" if order["is_buy"] else "Sell"
+            self.log(f"{'[DRY RUN]' if self.dry_run else '[LIVE]'} queued {'reduce-only ' if order['reduce_only'] else ''}{side} {order['sz']} {order['coin']} {order['label']}")
+        if self.dry_run:
+            self.log(f"[DRY RUN] bulk order with {len(orders)} order(s) in 1 request")
+            return self._record([(order, {"simulated": True}) for order in orders], 0.0)
+
+        started = time.perf_counter()
+        try:
+            order_requests = [self._order_request(order, all_mids) for order in orders]
+            response = exchange.bulk_orders(order_requests)
+        except Exception as e:
+            return self._record(self._map_error(orders, str(e)), time.perf_counter() - started)
+        if response.get("status") != "ok":
+            return self._record(self._map_error(orders, json.dumps(response)), time.perf_counter() - started)
+
+        statuses = response["response"]["data"]["statuses"]
+        results = list(zip(orders, statuses))
+        for order, status in results:
+            self.log(f"  {order['coin']}: {json.dumps(status)}")
+        return self._record(results, time.perf_counter() - started)
+
+    def _record(self, results, seconds):
+        """每个订单写一条结构化事件：方向、数量、标签、结果和本次批量请求的耗时"""
+        for order, status in results:
+            log_pipeline.event("order", coin=order["coin"], is_buy=order["is_buy"], sz=order["sz"], reduce_only=order["reduce_only"],
+                               label=order["label"], status=next(iter(status), None), detail=status, ms=round(seconds * 1000, 3))
+        return results
+
+    def _order_request(self, order, all_mids):
+        mid = float(all_mids[order["coin"]]) if all_mids and order["coin"] in all_mids else None
+        limit_px = slippage_price(self.exchange, order["coin"], order["is_buy"], self.slippage, mid)
+        return {
+            "coin": order["coin"],
+            "is_buy": order["is_buy"],
+            "sz": order["sz"],
+            "limit_px": limit_px,
+            "order_type": {"limit": {"tif": "Ioc"}},
+            "reduce_only": order["reduce_only"],
+        }
+
+    def _map_error(self, orders, error):
+        self.log(f"Bulk order with {len(orders)} order(s) failed: {error}")
+        return [(order, {"error": error}) for order in orders]
@@ -0,0 +1,378 @@
+"""
+录制 / 回放 Info 与 Exchange 调用。
+
+录制：设置环境变量 HL_RECORD=<文件> 后照常运行任意脚本，example_utils.setup() 返回的 info/exchange
+会被包装，每次调用的方法名、参数和返回值（或异常）以及 websocket 推送按顺序写入 msgpack 日志。
+
+回放：设置 HL_REPLAY=<文件> 后 setup() 不再读取私钥或联网，直接返回 ReplayInfo / ReplayExchange：
+每个方法按录制顺序依次返回录制的结果，websocket 推送在其录制位置之前的调用返回前送达回调。
+数据耗尽时抛出 ReplayExhausted（KeyboardInterrupt 子类），脚本主循环按手动中断正常退出。
+
+用法:
+    HL_RECORD=session.msgpack python follow_bot_v5.py
+    python replay.py run session.msgpack follow_bot_v5.py       # 全速回放并统计每轮 CPU 时间
+    python replay.py show session.msgpack                       # 查看日志内容统计
+"""
+import os
+import sys
+import time
+import random
+import runpy
+import argparse
+import threading
+from collections import defaultdict, deque
+
+import msgpack
+import requests
+
+RECORD_ENV = "HL_RECORD"
+REPLAY_ENV = "HL_REPLAY"
+
+# 这些调用只涉及本地状态或回调注册，录制时直接透传
+PASSTHROUGH_METHODS = {"unsubscribe", "disconnect_websocket"}
+# 回放时这些方法的数据耗尽后重复返回最后一次结果（元数据在一次会话内基本不变）
+STATIC_METHODS = {"meta", "spot_meta", "meta_and_asset_ctxs", "name_to_asset", "_slippage_price"}
+
+
+class ReplayExhausted(KeyboardInterrupt):
+    """回放日志中没有更多对应的记录"""
+
+
+class ReplayedError(Exception):
+    """录制时该调用抛出了异常，回放时按原消息重新抛出"""
+
+
+def _default(obj):
+    # Cloid 等 SDK 对象按字符串保存
+    to_raw = getattr(obj, "to_raw", None)
+    return to_raw() if callable(to_raw) else str(obj)
+
+
+class Recorder:
+    """把调用记录追加写入 msgpack 日志，多线程共享一个实例"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "ab")
+        self.packer = msgpack.Packer(default=_default, use_bin_type=True)
+        self.seq = 0
+
+    def write(self, record):
+        with self.lock:
+            record["n"] = self.seq
+            self.seq += 1
+            self.file.write(self.packer.pack(record))
+            self.file.flush()
+
+    def header(self, address, base_url, seed):
+        self.write({"k": "header", "address": address, "base_url": base_url, "seed": seed, "ts": time.time()})
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class RecordingProxy:
+    """包装 Info 或 Exchange，记录每个方法调用的参数与结果"""
+
+    def __init__(self, target, recorder, kind):
+        self._target = target
+        self._recorder = recorder
+        self._kind = kind
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or name in PASSTHROUGH_METHODS:
+            return attr
+        if name == "subscribe":
+            return self._subscribe
+
+        def recorded(*args, **kwargs):
+            record = {"k": self._kind, "m": name, "a": list(args), "kw": kwargs, "ts": time.time()}
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                record["e"] = f"{type(e).__name__}: {e}"
+                self._recorder.write(record)
+                raise
+            record["r"] = result
+            self._recorder.write(record)
+            return result
+        return recorded
+
+    def _subscribe(self, subscription, callback):
+        def recorded_callback(msg):
+            self._recorder.write({"k": "ws", "s": subscription, "d": msg, "ts": time.time()})
+            callback(msg)
+        return self._target.subscribe(subscription, recorded_callback)
+
+
+def load_records(path):
+    with open(path, "rb") as f:
+        return list(msgpack.Unpacker(f, raw=False, strict_map_key=False))
+
+
+class ReplaySession:
+    """按 (对象, 方法) 分队列保存调用记录，按全局序号投递 websocket 推送"""
+
+    def __init__(self, path):
+        records = load_records(path)
+        self.lock = threading.RLock()
+        self.header = next((r for r in records if r["k"] == "header"), {})
+        self.calls = defaultdict(deque)
+        self.last = {}
+        self.ws = deque(r for r in records if r["k"] == "ws")
+        self.callbacks = []
+        self.mismatches = []
+        self.consumed = 0
+        self.exhausted = None
+        self.now = None   # 最近一条已回放记录的录制时间，回放时作为 time.time()
+        for record in records:
+            if record["k"] in ("info", "exchange"):
+                self.calls[(record["k"], record["m"])].append(record)
+
+    def subscribe(self, subscription, callback):
+        with self.lock:
+            self.callbacks.append((subscription, callback))
+            return len(self.callbacks)
+
+    def _deliver_ws(self, until_seq):
+        while self.ws and self.ws[0]["n"] < until_seq:
+            event = self.ws.popleft()
+            self.now = event["ts"]
+            for subscription, callback in list(self.callbacks):
+                if subscription == event["s"]:
+                    callback(event["d"])
+
+    def call(self, kind, name, args, kwargs):
+        with self.lock:
+            queue = self.calls.get((kind, name))
+            if queue:
+                record = queue.popleft()
+                self.last[(kind, name)] = record
+            elif name in STATIC_METHODS and (kind, name) in self.last:
+                record = self.last[(kind, name)]
+            else:
+                self.exhausted = f"{kind}.{name}"
+                raise ReplayExhausted(f"回放数据已用完: {self.exhausted}")
+            self._deliver_ws(record["n"])
+            self.now = record["ts"]
+            self.consumed += 1
+            # 下单类请求与录制时不一致时记录下来，便于回归比对
+            if kind == "exchange" and (record["a"], record["kw"]) != _normalize(args, kwargs):
+                self.mismatches.append({"m": name, "recorded": record["a"], "replayed": list(args)})
+        if "e" in record:
+            raise ReplayedError(record["e"])
+        return record["r"]
+
+    def remaining(self):
+        return sum(len(queue) for queue in self.calls.values())
+
+
+def _normalize(args, kwargs):
+    """与写入日志后再读出的形式保持一致（元组变列表等）"""
+    packed = msgpack.packb({"a": list(args), "kw": kwargs}, default=_default, use_bin_type=True)
+    data = msgpack.unpackb(packed, raw=False, strict_map_key=False)
+    return data["a"], data["kw"]
+
+
+class ReplayProxy:
+    """回放替身：任意方法调用都从会话中取出下一条对应记录"""
+
+    def __init__(self, session, kind, attrs=None):
+        self._session = session
+        self._kind = kind
+        for key, value in (attrs or {}).items():
+            setattr(self, key, value)
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        def replayed(*args, **kwargs):
+            return self._session.call(self._kind, name, args, kwargs)
+        return replayed
+
+
+class ReplayInfo(ReplayProxy):
+    def __init__(self, session):
+        # session 只是占位：回放不联网，transport.tune_session() 等调整连接池的调用照常执行但不产生请求
+        super().__init__(session, "info", {"base_url": session.header.get("base_url"), "session": requests.Session()})
+
+    def subscribe(self, subscription, callback):
+        return self._session.subscribe(subscription, callback)
+
+    def unsubscribe(self, subscription, subscription_id):
+        return True
+
+    def disconnect_websocket(self):
+        pass
+
+
+class ReplayExchange(ReplayProxy):
+    def __init__(self, session, info):
+        super().__init__(session, "exchange", {"info": info, "base_url": session.header.get("base_url")})
+
+
+_recorder = None
+_sessions = {}
+
+
+def _seed_random(seed):
+    random.seed(seed)
+    try:
+        import numpy as np
+        np.random.seed(seed)
+    except ImportError:
+        pass
+
+
+def get_recorder():
+    """HL_RECORD 设置时返回进程内共享的 Recorder，否则返回None"""
+    global _recorder
+    path = os.environ.get(RECORD_ENV)
+    if path and _recorder is None:
+        _recorder = Recorder(path)
+    return _recorder
+
+
+def wrap_for_recording(address, base_url, info, exchange):
+    recorder = get_recorder()
+    if recorder is None:
+        return info, exchange
+    seed = random.randrange(2 ** 32)
+    recorder.header(address, base_url, seed)
+    _seed_random(seed)
+    info = RecordingProxy(info, recorder, "info")
+    # 保证日志中总有一份元数据，回放时元数据缓存过期也能取到
+    info.meta()
+    return info, RecordingProxy(exchange, recorder, "exchange")
+
+
+def replay_setup():
+    """HL_REPLAY 设置时返回 (address, ReplayInfo, ReplayExchange)，否则返回None"""
+    path = os.environ.get(REPLAY_ENV)
+    if not path:
+        return None
+    session = _sessions.get(path)
+    if session is None:
+        session = _sessions[path] = ReplaySession(path)
+        # 与录制时使用相同的随机种子，策略中的随机选择才能与录制一致
+        if session.header.get("seed") is not None:
+            _seed_random(session.header["seed"])
+    info = ReplayInfo(session)
+    return session.header.get("address"), info, ReplayExchange(session, info)
+
+
+# =========================
+# === 回放运行与计时 ===
+# =========================
+class VirtualClock:
+    """替换 time.sleep / time.time
+
+    time.time() 返回最近一条已回放记录的录制时间，冷却、K线过期等判断与录制时一致；
+    主线程的睡眠立即返回并视为一轮循环的结束，后台线程的睡眠照常进行。
+    """
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+        self.offset = 0.0
+        self.real_time = time.time
+        self.real_sleep = time.sleep
+        self.cycle_cpu = []
+        self.cycle_start = time.process_time()
+
+    def time(self):
+        session = _sessions.get(self.log_path)
+        if session is not None and session.now is not None:
+            return session.now
+        return self.real_time() + self.offset
+
+    def sleep(self, seconds):
+        if threading.current_thread() is not threading.main_thread():
+            return self.real_sleep(seconds)
+        now = time.process_time()
+        self.cycle_cpu.append(now - self.cycle_start)
+        self.offset += max(seconds, 0)
+        self.cycle_start = time.process_time()
+
+    def install(self):
+        time.time = self.time
+        time.sleep = self.sleep
+
+    def uninstall(self):
+        time.time = self.real_time
+        time.sleep = self.real_sleep
+
+
+def run_replay(log_path, script, script_args=(), seed=0):
+    """在回放会话上运行脚本主循环，返回每轮 CPU 时间列表（秒）和会话"""
+    os.environ[REPLAY_ENV] = log_path
+    os.environ.pop(RECORD_ENV, None)
+    _seed_random(seed)
+    clock = VirtualClock(log_path)
+    clock.install()
+    argv = sys.argv
+    sys.argv = [script, *script_args]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except (ReplayExhausted, SystemExit):
+        pass
+    finally:
+        sys.argv = argv
+        clock.uninstall()
+    return clock.cycle_cpu, _sessions.get(log_path)
+
+
+def show(path):
+    counts = defaultdict(int)
+    records = load_records(path)
+    for record in records:
+        counts[(record["k"], record.get("m") or record.get("s", {}).get("type"))] += 1
+    header = next((r for r in records if r["k"] == "header"), {})
+    print(f"address: {header.get('address')}  base_url: {header.get('base_url')}  records: {len(records)}")
+    for (kind, name), count in sorted(counts.items(), key=lambda item: str(item[0])):
+        print(f"  {kind:<9} {str(name):<24} {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Info/Exchange sessions.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="Run a script against a recorded session at full speed.")
+    run.add_argument("log")
+    run.add_argument("script")
+    run.add_argument("script_args", nargs=argparse.REMAINDER)
+    run.add_argument("--seed", type=int, default=0)
+    show_parser = sub.add_parser("show", help="Summarize a recorded session.")
+    show_parser.add_argument("log")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        show(args.log)
+        return
+
+    started = time.perf_counter()
+    cycle_cpu, session = run_replay(args.log, args.script, args.script_args, seed=args.seed)
+    wall = time.perf_counter() - started
+    print(f"\n=== 回放统计: {args.script} ===")
+    print(f"轮数: {len(cycle_cpu)}  总耗时: {wall:.3f}s")
+    if cycle_cpu:
+        # 首轮包含导入与初始化，单独列出
+        print(f"首轮 CPU: {cycle_cpu[0] * 1000:.2f} ms")
+        cpu_ms = sorted(c * 1000 for c in cycle_cpu[1:] or cycle_cpu)
+        print(f"每轮 CPU: 平均 {sum(cpu_ms) / len(cpu_ms):.2f} ms  p50 {cpu_ms[len(cpu_ms) // 2]:.2f} ms  "
+              f"p95 {cpu_ms[int(len(cpu_ms) * 0.95)]:.2f} ms  最大 {cpu_ms[-1]:.2f} ms")
+    if session:
+        print(f"已回放调用: {session.consumed}  未使用记录: {session.remaining()}  下单参数不一致: {len(session.mismatches)}")
+        if session.exhausted:
+            print(f"回放在 {session.exhausted} 处结束")
+        for mismatch in session.mismatches[:5]:
+            print(f"  {mismatch['m']}: 录制 {mismatch['recorded']} / 回放 {mismatch['replayed']}")
+
+
+if __name__ == "__main__":
+    # 以模块 replay 运行，使 example_utils 导入的是同一个模块（共享回放会话）
+    import replay
+    replay.main()
@@ -0,0 +1,287 @@
+"""
+按交易所权重限流的请求调度。
+
+Hyperliquid 按 IP 对 REST 请求计权重（每分钟 1200）：/info 按请求类型计 2/20/60，K线每返回 60 根额外加 1；
+/exchange 动作计 1 + 订单数 // 40。所有 info/exchange 调用先从同一个令牌桶中扣除权重，额度不足时等待，
+而不是等服务端返回 429 后让整轮循环失败。
+
+- 优先级：信息查询始终给下单动作留出 ORDER_RESERVE 的权重，且有下单在等待时信息查询让路；
+- 合并：参数完全相同、仍在进行中的信息查询只发出一次，其他调用方等待并共享同一结果；
+- 统计：report() 给出最近一分钟已用权重、剩余额度、等待次数/时长、合并次数和各方法权重。
+
+所有脚本通过 example_utils.setup() 共享同一个调度器（同一 IP 共用一份额度）。Exchange 内部还有一个 Info
+（market_open / market_close 用它查询 user_state、all_mids），setup() 用 wrap_inner_info() 让它同样经由调度器。
+"""
+import threading
+import time
+from collections import deque
+
+WEIGHT_LIMIT_PER_MINUTE = 1200
+ORDER_RESERVE = 100          # 信息查询不可使用的最后这部分权重，留给下单
+DEFAULT_INFO_WEIGHT = 20
+
+# /info 请求类型的权重，未列出的为 DEFAULT_INFO_WEIGHT
+INFO_TYPE_WEIGHTS = {
+    "allMids": 2, "clearinghouseState": 2, "spotClearinghouseState": 2, "l2Book": 2,
+    "orderStatus": 2, "exchangeStatus": 2, "userRole": 60,
+}
+# SDK 方法名 -> /info 请求类型
+INFO_METHOD_TYPES = {
+    "all_mids": "allMids", "user_state": "clearinghouseState", "spot_user_state": "spotClearinghouseState",
+    "l2_snapshot": "l2Book", "query_order_by_oid": "orderStatus", "query_order_by_cloid": "orderStatus",
+    "user_role": "userRole",
+}
+CANDLES_PER_EXTRA_WEIGHT = 60
+ORDERS_PER_EXTRA_WEIGHT = 40
+
+# 只读本地数据、走 websocket 或只修改本地设置，不发 REST 请求
+LOCAL_METHODS = {
+    "subscribe", "unsubscribe", "disconnect_websocket", "name_to_asset", "set_perp_meta",
+    "_slippage_price", "set_expires_after",
+}
+
+ORDER = 0
+INFO = 1
+
+
+def info_type_weight(request_type):
+    return INFO_TYPE_WEIGHTS.get(request_type, DEFAULT_INFO_WEIGHT)
+
+
+def request_weight(kind, method, args, result=None):
+    """kind 为 "info" 或 "exchange"；K线的额外权重取决于返回的根数，result 为空时只计基础权重"""
+    if kind == "exchange":
+        if method == "bulk_orders" and args:
+            return 1 + len(args[0]) // ORDERS_PER_EXTRA_WEIGHT
+        return 1
+    if method == "candles_snapshot":
+        return DEFAULT_INFO_WEIGHT + (len(result) if isinstance(result, list) else 0) // CANDLES_PER_EXTRA_WEIGHT
+    return info_type_weight(INFO_METHOD_TYPES.get(method))
+
+
+class WeightBudget:
+    """按权重计的令牌桶，容量与每分钟额度相同，按秒匀速恢复"""
+
+    def __init__(self, limit=WEIGHT_LIMIT_PER_MINUTE, reserve=ORDER_RESERVE, clock=time.monotonic):
+        self.limit = limit
+        self.reserve = reserve
+        self.rate = limit / 60.0
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.tokens = float(limit)
+        self.updated = clock()
+        self.orders_waiting = 0
+        self.history = deque()      # (时间, 权重)，用于统计最近一分钟的用量
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, weight, priority=INFO):
+        """扣除权重，额度不足时阻塞等待；返回等待秒数"""
+        floor = 0 if priority == ORDER else self.reserve
+        weight = min(weight, self.limit - floor)
+        started = None
+        with self.cond:
+            if priority == ORDER:
+                self.orders_waiting += 1
+            try:
+                while True:
+                    now = self.clock()
+                    self._refill(now)
+                    blocked_by_orders = priority != ORDER and self.orders_waiting
+                    if not blocked_by_orders and self.tokens - weight >= floor:
+                        break
+                    if started is None:
+                        started = now
+                    timeout = 0.05 if blocked_by_orders else (weight + floor - self.tokens) / self.rate
+                    self.cond.wait(timeout)
+                self.tokens -= weight
+                self._record(now, weight)
+                waited = now - started if started is not None else 0.0
+                if waited:
+                    self.waits += 1
+                    self.wait_seconds += waited
+                return waited
+            finally:
+                if priority == ORDER:
+                    self.orders_waiting -= 1
+                    self.cond.notify_all()
+
+    def charge(self, weight):
+        """事后补扣（如K线按返回根数追加的权重），允许额度暂时为负"""
+        if weight <= 0:
+            return
+        with self.cond:
+            now = self.clock()
+            self._refill(now)
+            self.tokens -= weight
+            self._record(now, weight)
+
+    def drain(self):
+        """服务端已返回 429 时清空额度，让后续请求等待恢复"""
+        with self.cond:
+            self._refill(self.clock())
+            self.tokens = min(self.tokens, 0.0)
+
+    def _record(self, now, weight):
+        self.history.append((now, weight))
+        while self.history and now - self.history[0][0] > 60:
+            self.history.popleft()
+
+    def used_last_minute(self):
+        with self.cond:
+            now = self.clock()
+            return sum(weight for t, weight in self.history if now - t <= 60)
+
+    def available(self):
+        with self.cond:
+            self._refill(self.clock())
+            return self.tokens
+
+
+class RequestScheduler:
+    """所有 info/exchange 调用的统一入口：扣权重、合并进行中的相同查询、统计用量"""
+
+    def __init__(self, budget=None):
+        self.budget = budget or WeightBudget()
+        self.lock = threading.Lock()
+        self.in_flight = {}         # 查询键 -> _Flight
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.by_method = {}         # 方法 -> 累计权重
+
+    def wrap(self, info, exchange):
+        return self.wrap_info(info), self.wrap_exchange(exchange)
+
+    def wrap_info(self, info):
+        return ScheduledProxy(info, "info", self)
+
+    def wrap_exchange(self, exchange):
+        return ScheduledProxy(exchange, "exchange", self)
+
+    def wrap_inner_info(self, exchange):
+        """把 SDK Exchange 内部的 Info 换成经由调度器的代理；需传入未包装的 Exchange，返回原对象"""
+        if not isinstance(exchange.info, ScheduledProxy):
+            exchange.info = ScheduledProxy(exchange.info, "info", self)
+        return exchange
+
+    def call(self, kind, method, func, args, kwargs):
+        if kind == "exchange":
+            return self._execute(kind, method, func, args, kwargs, ORDER)
+        try:
+            key = (method, args, tuple(sorted(kwargs.items())))
+            hash(key)
+        except TypeError:
+            return self._execute(kind, method, func, args, kwargs, INFO)
+
+        with self.lock:
+            flight = self.in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.in_flight[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return flight.wait()
+        try:
+            flight.result = self._execute(kind, method, func, args, kwargs, INFO)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            flight.done.set()
+
+    def _execute(self, kind, method, func, args, kwargs, priority):
+        weight = request_weight(kind, method, args)
+        self.budget.acquire(weight, priority)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if getattr(e, "status_code", None) == 429:
+                self.rate_limited += 1
+                self.budget.drain()
+            self._count(method, weight)
+            raise
+        extra = request_weight(kind, method, args, result) - weight
+        self.budget.charge(extra)
+        self._count(method, weight + max(extra, 0))
+        return result
+
+    def _count(self, method, weight):
+        with self.lock:
+            self.by_method[method] = self.by_method.get(method, 0) + weight
+
+    def report(self):
+        budget = self.budget
+        with self.lock:
+            by_method = dict(self.by_method)
+            coalesced, rate_limited = self.coalesced, self.rate_limited
+        return {
+            "used_last_minute": budget.used_last_minute(),
+            "limit_per_minute": budget.limit,
+            "available": round(budget.available(), 1),
+            "waits": budget.waits,
+            "wait_seconds": round(budget.wait_seconds, 3),
+            "coalesced": coalesced,
+            "rate_limited": rate_limited,
+            "weight_by_method": by_method,
+        }
+
+    def summary(self):
+        r = self.report()
+        return (f"weight {r['used_last_minute']}/{r['limit_per_minute']} in last 60s, available {r['available']:.0f}, "
+                f"waits {r['waits']} ({r['wait_seconds']:.1f}s), coalesced {r['coalesced']}, 429s {r['rate_limited']}")
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class ScheduledProxy:
+    """包装 Info 或 Exchange，方法调用经由调度器；包装后的方法缓存在实例上"""
+
+    def __init__(self, target, kind, scheduler):
+        self._target = target
+        self._kind = kind
+        self._scheduler = scheduler
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or name in LOCAL_METHODS:
+            return attr
+        kind, call = self._kind, self._scheduler.call
+
+        def scheduled(*args, **kwargs):
+            return call(kind, name, attr, args, kwargs)
+        self.__dict__[name] = scheduled
+        return scheduled
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_scheduler():
+    """进程内共享的调度器（交易所按 IP 限流，同一进程内的所有账户共用一份额度）"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = RequestScheduler()
+    return _shared
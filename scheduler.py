@@ -0,0 +1,100 @@
+"""
+冷却调度：用最小堆记录各个冷却/延迟开仓的到期时间，代替在主循环里直接 time.sleep()。
+
+平仓后的等待只推迟对应动作（重新开仓等），主循环照常按节拍检查所有币种的风控；
+CheckGapMonitor 记录每个币种相邻两次风控检查的间隔，用于观察最坏情况。
+"""
+import heapq
+import time
+
+
+class CooldownScheduler:
+    """按 key 管理冷却，defer() 设置到期时间，ready() 判断是否已到期"""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.due = {}
+        self.heap = []
+
+    def defer(self, key, seconds):
+        """把 key 的冷却延长到 now + seconds（已有更晚的到期时间时保持不变），返回到期时间"""
+        due_at = max(self.due.get(key, 0.0), self.clock() + seconds)
+        self.due[key] = due_at
+        heapq.heappush(self.heap, (due_at, key))
+        return due_at
+
+    def remaining(self, key):
+        due_at = self.due.get(key)
+        if due_at is None:
+            return 0.0
+        remain = due_at - self.clock()
+        if remain <= 0:
+            del self.due[key]
+            return 0.0
+        return remain
+
+    def ready(self, key):
+        return self.remaining(key) == 0.0
+
+    def active(self, key):
+        return not self.ready(key)
+
+    def clear(self, key):
+        self.due.pop(key, None)
+
+    def snapshot(self):
+        """返回未到期的 {key: 到期时间}，用于持久化（clock 为 time.time 时重启后仍然有效）"""
+        now = self.clock()
+        return {key: due_at for key, due_at in self.due.items() if due_at > now}
+
+    def restore(self, due):
+        """恢复 snapshot() 的结果，已过期的条目忽略"""
+        now = self.clock()
+        for key, due_at in due.items():
+            if due_at > now and due_at > self.due.get(key, 0.0):
+                self.due[key] = due_at
+                heapq.heappush(self.heap, (due_at, key))
+
+    def next_due(self):
+        """返回最早的未到期时间，没有冷却时返回None；堆中过期或被覆盖的条目在这里惰性丢弃"""
+        now = self.clock()
+        while self.heap:
+            due_at, key = self.heap[0]
+            if self.due.get(key) == due_at and due_at > now:
+                return due_at
+            heapq.heappop(self.heap)
+            if self.due.get(key) == due_at:
+                del self.due[key]
+        return None
+
+    def sleep_seconds(self, interval):
+        """主循环的等待时长：不超过 interval，有冷却更早到期时提前醒来"""
+        next_due = self.next_due()
+        if next_due is None:
+            return interval
+        return max(0.0, min(interval, next_due - self.clock()))
+
+
+class CheckGapMonitor:
+    """记录每个 key 相邻两次检查的间隔，保留最近一次和最坏一次"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.last_check = {}
+        self.last_gap = {}
+        self.max_gap = {}
+
+    def mark(self, key):
+        now = self.clock()
+        previous = self.last_check.get(key)
+        self.last_check[key] = now
+        if previous is None:
+            return None
+        gap = now - previous
+        self.last_gap[key] = gap
+        if gap > self.max_gap.get(key, 0.0):
+            self.max_gap[key] = gap
+        return gap
+
+    def summary(self):
+        return {key: (self.last_gap[key], self.max_gap[key]) for key in sorted(self.last_gap)}
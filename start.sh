@@ -42,6 +42,16 @@ start_scripts() {
 }
 
 stop_scripts() {
+    # 先停守护进程（它会向各脚本发送 SIGTERM 并等待退出），避免脚本被再次拉起
+    if [ -f "$pid_dir/supervisor.pid" ]; then
+        sup_pid=$(cat "$pid_dir/supervisor.pid")
+        if ps -p "$sup_pid" > /dev/null 2>&1; then
+            echo "🛑 停止守护进程 (PID: $sup_pid)..."
+            kill "$sup_pid" 2>/dev/null
+            while ps -p "$sup_pid" > /dev/null 2>&1; do sleep 1; done
+        fi
+        rm -f "$pid_dir/supervisor.pid"
+    fi
     for script in "${scripts[@]}"; do
         pid_file="$pid_dir/${script}.pid"
         if [ -f "$pid_file" ]; then
@@ -81,6 +91,16 @@ status_scripts() {
     done
 }
 
+supervise_scripts() {
+    # 由 supervisor.py 以子进程方式启动并看护：退出立即感知、心跳超时判定卡死、指数退避重启
+    commands=()
+    for script in "${scripts[@]}"; do
+        commands+=("$script --live")
+    done
+    echo "🛡️ 启动 Python 守护进程 supervisor.py ..."
+    exec python -u supervisor.py --log-dir "$log_dir" --pid-file "$pid_dir/supervisor.pid" "${commands[@]}"
+}
+
 monitor_scripts() {
     echo "🔍 启动自动监控守护进程，每 ${monitor_interval}s 检测一次..."
     while true; do
@@ -127,8 +147,11 @@ case "$1" in
     monitor)
         monitor_scripts
         ;;
+    supervise)
+        supervise_scripts
+        ;;
     *)
-        echo "用法: $0 {start|stop|restart|status|monitor}"
+        echo "用法: $0 {start|stop|restart|status|monitor|supervise}"
         ;;
 esac
 
@@ -0,0 +1,233 @@
+"""
+守护进程：代替 start.sh monitor 的 60 秒 ps 轮询，以子进程方式启动各脚本并持续看护。
+
+- 退出检测：每个子进程持有一条心跳管道的写端，子进程退出时管道立即 EOF，守护进程随即 wait() 取得退出码并安排重启，
+  不必等下一次轮询；
+- 卡死检测：脚本通过 heartbeat.py 在每轮开始和每次等待前写入“下一次心跳的最长间隔”，超过期限加 HEARTBEAT_GRACE 秒仍无心跳即视为卡死，
+  先 SIGTERM、STOP_TIMEOUT 秒后仍未退出再 SIGKILL，然后重启；
+- 重启退避：首次重启间隔 INITIAL_BACKOFF 秒，连续快速崩溃时翻倍直至 MAX_BACKOFF；持续运行 STABLE_SECONDS 秒后退避清零；
+- 停止：收到 SIGTERM/SIGINT 时向所有子进程发送 SIGTERM（脚本将其作为 KeyboardInterrupt 处理，保存状态后退出），超时后 SIGKILL。
+
+子进程的 stdout/stderr 追加写入 <log_dir>/<脚本名>.log，与 start.sh 相同。
+
+用法: python supervisor.py "follow_bot_v5.py --live" "ds_copier_v2.py --live --stream" --log-dir /var/log
+"""
+import os
+import sys
+import time
+import shlex
+import signal
+import argparse
+import selectors
+import subprocess
+
+import heartbeat
+
+INITIAL_BACKOFF = 0.5     # 首次重启前的等待（秒）
+MAX_BACKOFF = 60.0
+STABLE_SECONDS = 60.0     # 运行超过这么久再退出，视为偶发故障，退避从头开始
+STARTUP_TIMEOUT = 300.0   # 启动后等待第一次心跳的期限（包括解密私钥、加载元数据）
+HEARTBEAT_GRACE = 30.0    # 心跳期限之外的宽限时间
+STOP_TIMEOUT = 15.0       # SIGTERM 后等待退出的时间，超时 SIGKILL
+
+
+def log(msg):
+    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {msg}", flush=True)
+
+
+class Child:
+    """一个受看护的脚本：命令行、当前进程、心跳管道和重启退避状态"""
+
+    def __init__(self, command, log_dir):
+        self.argv = shlex.split(command)
+        self.name = os.path.splitext(os.path.basename(self.argv[0]))[0]
+        self.log_path = os.path.join(log_dir, f"{self.name}.log")
+        self.proc = None
+        self.pipe = None          # 心跳管道读端
+        self.buffer = b""
+        self.started = 0.0
+        self.deadline = 0.0       # 最迟应收到下一次心跳的时间
+        self.kill_at = None       # 已发送 SIGTERM 时，改用 SIGKILL 的时间
+        self.backoff = INITIAL_BACKOFF
+        self.restart_at = 0.0     # 未运行时的下一次启动时间
+        self.restarts = 0
+
+    def start(self):
+        read_fd, write_fd = os.pipe()
+        env = dict(os.environ, PYTHONUNBUFFERED="1", **{heartbeat.ENV_FD: str(write_fd)})
+        with open(self.log_path, "ab") as out:
+            try:
+                # 新会话：终端的 Ctrl-C 只发给守护进程，由守护进程按顺序停止子进程
+                self.proc = subprocess.Popen([sys.executable, "-u"] + self.argv, stdout=out, stderr=subprocess.STDOUT,
+                                             env=env, pass_fds=(write_fd,), start_new_session=True)
+            finally:
+                os.close(write_fd)
+        self.pipe = read_fd
+        self.buffer = b""
+        self.started = time.monotonic()
+        self.deadline = self.started + STARTUP_TIMEOUT
+        self.kill_at = None
+        return self.proc.pid
+
+    def read(self):
+        """读取心跳，返回 False 表示管道已 EOF（子进程已退出）"""
+        data = os.read(self.pipe, 4096)
+        if not data:
+            return False
+        lines = (self.buffer + data).split(b"\n")
+        self.buffer = lines.pop()
+        if lines:
+            try:
+                expect = float(lines[-1])
+            except ValueError:
+                expect = heartbeat.CYCLE_TIMEOUT
+            self.deadline = time.monotonic() + expect + HEARTBEAT_GRACE
+        return True
+
+    def reap(self):
+        """子进程已退出：回收并按运行时长计算下一次启动的时间，返回 (退出码, 运行秒数)"""
+        code = self.proc.wait()
+        os.close(self.pipe)
+        self.proc = self.pipe = None
+        now = time.monotonic()
+        uptime = now - self.started
+        if uptime >= STABLE_SECONDS:
+            self.backoff = INITIAL_BACKOFF
+        self.restart_at = now + self.backoff
+        self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+        return code, uptime
+
+    def terminate(self, timeout=STOP_TIMEOUT):
+        if self.proc is not None and self.kill_at is None:
+            self.proc.send_signal(signal.SIGTERM)
+            self.kill_at = time.monotonic() + timeout
+
+
+class Supervisor:
+    def __init__(self, commands, log_dir, log=log):
+        self.children = [Child(command, log_dir) for command in commands]
+        self.log = log
+        self.selector = selectors.DefaultSelector()
+        self.stopping = False
+
+    def run(self):
+        # 信号处理函数只置位；唤醒管道让 select 立即返回
+        wakeup_r, wakeup_w = os.pipe()
+        os.set_blocking(wakeup_w, False)
+        signal.set_wakeup_fd(wakeup_w)
+        self.selector.register(wakeup_r, selectors.EVENT_READ, None)
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._on_signal)
+        self.log(f"🛡️ 守护进程启动 (PID: {os.getpid()})，看护 {len(self.children)} 个脚本")
+        try:
+            while not self.stopping:
+                now = time.monotonic()
+                for child in self.children:
+                    if child.proc is None and now >= child.restart_at:
+                        self._start(child)
+                    elif child.proc is not None:
+                        self._check(child, now)
+                self._poll(self._timeout())
+        finally:
+            self.stop()
+            signal.set_wakeup_fd(-1)
+            self.selector.unregister(wakeup_r)
+            os.close(wakeup_r)
+            os.close(wakeup_w)
+
+    def _on_signal(self, signum, frame):
+        self.stopping = True
+
+    def _start(self, child):
+        try:
+            pid = child.start()
+        except OSError as e:
+            child.restart_at = time.monotonic() + child.backoff
+            child.backoff = min(child.backoff * 2, MAX_BACKOFF)
+            self.log(f"❌ {child.name} 启动失败: {e}，{child.restart_at - time.monotonic():.1f}s 后重试")
+            return
+        self.selector.register(child.pipe, selectors.EVENT_READ, child)
+        self.log(f"🚀 {child.name} 已启动 (PID: {pid}){f'，第 {child.restarts} 次重启' if child.restarts else ''}")
+
+    def _check(self, child, now):
+        if child.kill_at is not None:
+            if now >= child.kill_at:
+                self.log(f"⚠️ {child.name} (PID: {child.proc.pid}) 未在 {STOP_TIMEOUT:.0f}s 内退出，强制 kill -9")
+                child.proc.kill()
+                child.kill_at = float("inf")
+        elif now >= child.deadline:
+            self.log(f"🥶 {child.name} (PID: {child.proc.pid}) 心跳超期 {now - child.deadline + HEARTBEAT_GRACE:.0f}s，判定卡死，发送 SIGTERM")
+            child.terminate()
+
+    def _timeout(self):
+        now = time.monotonic()
+        due = []
+        for child in self.children:
+            if child.proc is None:
+                due.append(child.restart_at)
+            else:
+                due.append(child.kill_at if child.kill_at is not None else child.deadline)
+        # 兜底每秒醒一次，已发送 SIGKILL 的子进程等待 EOF 期间没有期限
+        return min(max(0.0, min(due) - now), 1.0) if due else 1.0
+
+    def _poll(self, timeout):
+        for key, _ in self.selector.select(timeout):
+            child = key.data
+            if child is None:
+                os.read(key.fd, 512)
+                continue
+            if not child.read():
+                self.selector.unregister(child.pipe)
+                pid = child.proc.pid
+                code, uptime = child.reap()
+                child.restarts += 1
+                if not self.stopping:
+                    self.log(f"⚠️ {child.name} (PID: {pid}) 已退出，退出码 {code}，运行 {uptime:.0f}s，"
+                             f"{child.restart_at - time.monotonic():.1f}s 后重启")
+
+    def stop(self):
+        """向所有子进程发送 SIGTERM 并等待退出，超时 SIGKILL"""
+        running = [child for child in self.children if child.proc is not None]
+        if not running:
+            return
+        self.log(f"🛑 正在停止 {', '.join(child.name for child in running)} ...")
+        for child in running:
+            child.kill_at = None
+            child.terminate()
+        for child in running:
+            try:
+                code = child.proc.wait(timeout=max(child.kill_at - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                self.log(f"⚠️ {child.name} (PID: {child.proc.pid}) 未在 {STOP_TIMEOUT:.0f}s 内退出，强制 kill -9")
+                child.proc.kill()
+                code = child.proc.wait()
+            self.log(f"✅ {child.name} 已停止，退出码 {code}")
+            self.selector.unregister(child.pipe)
+            os.close(child.pipe)
+            child.proc = child.pipe = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动并看护跟单脚本：崩溃立即重启（指数退避），心跳超时判定卡死后重启")
+    parser.add_argument('commands', nargs='+', help='要看护的脚本及参数，每个用引号括起，如 "follow_bot_v5.py --live"')
+    parser.add_argument('--log-dir', default='/var/log', help='子进程日志目录，每个脚本写入 <脚本名>.log')
+    parser.add_argument('--pid-file', help='写入守护进程 PID 的文件，退出时删除')
+    args = parser.parse_args()
+
+    os.makedirs(args.log_dir, exist_ok=True)
+    if args.pid_file:
+        with open(args.pid_file, "w") as f:
+            f.write(str(os.getpid()))
+    try:
+        Supervisor(args.commands, args.log_dir).run()
+    finally:
+        if args.pid_file:
+            try:
+                os.remove(args.pid_file)
+            except FileNotFoundError:
+                pass
+        log("✅ 守护进程已退出")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Info/Exchange 之下的 HTTP 传输层：连接池、幂等查询重试和熔断。
+
+install(api) 替换 SDK 对象上的 post()（Info 与 Exchange 都经由 self.post 发请求）：
+- 连接池：调大 requests 连接池并保持长连接，未设置超时时使用 REQUEST_TIMEOUT，避免请求无限挂起；
+- 重试：/info 查询是幂等的，遇到连接错误、超时、5xx 或 429 时按带抖动的指数退避重试；
+  /exchange 动作带签名和 nonce，不在这里重试，由调用方在下一轮根据最新仓位决定；
+- 熔断：同一 API 地址连续失败 FAILURE_THRESHOLD 次后打开熔断，RESET_SECONDS 内的请求直接抛出
+  CircuitOpenError 而不发请求；之后放行一个试探请求，成功即恢复。进程不退出，主循环跳过本轮即可。
+"""
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from hyperliquid.utils.error import ClientError, ServerError
+
+POOL_SIZE = 20
+REQUEST_TIMEOUT = 10          # 秒
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.25           # 秒，第 n 次重试最多等待 BACKOFF_BASE * 2**n
+BACKOFF_MAX = 4.0
+FAILURE_THRESHOLD = 5
+RESET_SECONDS = 30
+
+# 退避抖动使用独立的随机数生成器，不影响策略（及录制回放）使用的全局随机序列
+_jitter = random.Random()
+
+
+class CircuitOpenError(Exception):
+    """熔断打开期间的请求不会发出，直接抛出该异常"""
+
+
+def is_transient(error):
+    """连接错误、超时、5xx 和 429 视为暂时性故障：可重试，并计入熔断"""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, ServerError)):
+        return True
+    return isinstance(error, ClientError) and error.status_code == 429
+
+
+def backoff_seconds(attempt):
+    """full jitter：在 [0, min(上限, 基数 * 2^attempt)] 内均匀取值，避免多个进程同时重试"""
+    return _jitter.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_seconds=RESET_SECONDS, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.probing = False
+
+    def before_call(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.reset_seconds - self.clock()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+            # 半开状态只放行一个试探请求
+            if self.state == self.HALF_OPEN and not self.probing:
+                self.probing = True
+                return
+            raise CircuitOpenError(f"circuit open after {self.failures} consecutive failures, retry in {max(remaining, 0):.0f}s")
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+    def status(self):
+        with self.lock:
+            return {"state": self.state, "failures": self.failures, "trips": self.trips}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(base_url):
+    """同一 API 地址的 Info 与所有 Exchange 共用一个熔断器"""
+    with _breakers_lock:
+        breaker = _breakers.get(base_url)
+        if breaker is None:
+            breaker = _breakers[base_url] = CircuitBreaker()
+    return breaker
+
+
+def tune_session(session, pool_size=POOL_SIZE):
+    # max_retries=0：重试由 install() 统一处理，避免 urllib3 与这里重复重试
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0, pool_block=False)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def install(api, pool_size=POOL_SIZE, breaker=None):
+    """给 Info 或 Exchange 装上连接池、重试与熔断，返回原对象；Exchange 内部的 Info 一并处理"""
+    if getattr(api, "_transport_installed", False):
+        return api
+    breaker = breaker or get_breaker(api.base_url)
+    tune_session(api.session, pool_size)
+    if api.timeout is None:
+        api.timeout = REQUEST_TIMEOUT
+    raw_post = api.post
+
+    def post(url_path, payload=None):
+        retries = MAX_RETRIES if url_path == "/info" else 0
+        attempt = 0
+        while True:
+            breaker.before_call()
+            try:
+                result = raw_post(url_path, payload)
+            except Exception as e:
+                if not is_transient(e):
+                    # 服务端正常给出了 4xx 等响应，说明连接是通的
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                if attempt >= retries:
+                    raise
+                time.sleep(backoff_seconds(attempt))
+                attempt += 1
+                continue
+            breaker.record_success()
+            return result
+
+    api.post = post
+    api._transport_installed = True
+    inner_info = getattr(api, "info", None)
+    if inner_info is not None and inner_info is not api:
+        install(inner_info, pool_size, breaker)
+    return api
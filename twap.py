@@ -0,0 +1,206 @@
+"""
+大单拆分：跟单数量相对盘口深度过大时，把一笔市价单拆成多笔子单分批成交，在后台线程中执行，不阻塞同步循环。
+
+- 触发：名义价值不低于 MIN_PARENT_NOTIONAL，且数量超过对手方最优档数量的 DEPTH_FRACTION 倍；
+- time 模式：按盘口深度算出子单数（最多 MAX_CHILDREN），等分后每 CHILD_INTERVAL 秒下一笔；
+- volume 模式：每次按当时对手方最优档数量的 DEPTH_FRACTION 倍下单，直到完成（最多 MAX_CHILDREN 笔，最后一笔补足）；
+- 子单数量按 szDecimals 取整，每笔不低于交易所最小下单金额，不足的尾数并入最后一笔；
+- 同一币种的减仓、杠杆调整和开仓（如反向开仓）作为一个任务按顺序执行；任务进行中的币种由调用方跳过同步。
+
+子单以 IOC 限价单经 exchange.bulk_orders 发出（--execution passive 时同样改走被动执行）。
+每个任务结束时记录成交均价相对下单时中间价的偏差（bps）。
+"""
+import itertools
+import math
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import meta_cache
+import order_batch
+
+MODES = ("off", "time", "volume")
+MIN_PARENT_NOTIONAL = 1000.0   # 低于该名义价值 (USD) 的订单不拆分
+DEPTH_FRACTION = 0.5           # 单笔子单最多吃掉对手方最优档数量的这个比例
+CHILD_INTERVAL = 5.0           # 子单间隔（秒）
+MAX_CHILDREN = 20
+MIN_NOTIONAL = 10.0            # 交易所最小下单金额 (USD)
+SLIPPAGE = 0.01                # 子单 IOC 的最大滑点
+MAX_PARALLEL = 8               # 同时执行的任务数（不同币种并发）
+
+SliceReport = namedtuple("SliceReport", [
+    "job", "coin", "is_buy", "sz", "filled", "avg_px", "arrival_mid", "slippage_bps", "children", "seconds", "error",
+])
+
+
+def split_sizes(sz, children, sz_decimals, px, min_notional=MIN_NOTIONAL):
+    """把 sz 拆成至多 children 笔，每笔按 szDecimals 向下取整且不低于 min_notional，尾数并入最后一笔"""
+    if px > 0:
+        children = min(children, int(sz * px // min_notional))
+    children = max(children, 1)
+    child = meta_cache.floor_size(sz / children, sz_decimals)
+    if child <= 0:
+        return [round(sz, sz_decimals)]
+    sizes = [child] * (children - 1)
+    sizes.append(round(sz - child * (children - 1), sz_decimals))
+    return sizes
+
+
+class SliceJob:
+    """一个币种的拆单任务：legs 为按顺序执行的订单或杠杆调整"""
+
+    def __init__(self, job_id, coin, legs, arrival_mid, started):
+        self.id = job_id
+        self.coin = coin
+        self.legs = legs
+        self.arrival_mid = arrival_mid
+        self.started = started
+        self.reports = []
+
+
+class SliceScheduler:
+    def __init__(self, exchange, info, metas, mode="time", dry_run=False, log=print, interval=CHILD_INTERVAL,
+                 depth_fraction=DEPTH_FRACTION, min_parent_notional=MIN_PARENT_NOTIONAL, max_parallel=MAX_PARALLEL):
+        self.exchange = exchange
+        self.info = info
+        self.metas = metas
+        self.mode = mode
+        self.dry_run = dry_run
+        self.log = log
+        self.interval = interval
+        self.depth_fraction = depth_fraction
+        self.min_parent_notional = min_parent_notional
+        self.stopped = threading.Event()
+        self.pool = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="twap")
+        self.lock = threading.Lock()
+        self.jobs = {}          # coin -> 进行中的 SliceJob
+        self.reports = []
+        self.ids = itertools.count(1)
+
+    # --- 盘口 ---
+    def top_of_book(self, coin):
+        """返回 (买一价, 买一量, 卖一价, 卖一量)"""
+        bids, asks = self.info.l2_snapshot(coin)["levels"][:2]
+        return float(bids[0]["px"]), float(bids[0]["sz"]), float(asks[0]["px"]), float(asks[0]["sz"])
+
+    def depth_limit(self, coin, is_buy):
+        """单笔子单的数量上限和当前中间价"""
+        bid, bid_sz, ask, ask_sz = self.top_of_book(coin)
+        return self.depth_fraction * (ask_sz if is_buy else bid_sz), (bid + ask) / 2
+
+    # --- 提交 ---
+    def active(self, coin):
+        with self.lock:
+            return coin in self.jobs
+
+    def should_slice(self, order, mid):
+        if self.mode == "off" or not mid or order["sz"] * mid < self.min_parent_notional:
+            return False
+        limit, _ = self.depth_limit(order["coin"], order["is_buy"])
+        return order["sz"] > limit
+
+    def submit(self, coin, legs, mid):
+        """legs 为 OrderBatch 中该币种的订单/杠杆调整（按提交顺序），在后台按顺序执行，返回任务"""
+        job = SliceJob(next(self.ids), coin, legs, mid, time.monotonic())
+        orders = [leg for leg in legs if "sz" in leg]
+        self.log(f"TWAP job {job.id} {coin} ({self.mode}): " + ", ".join(
+            f"{'reduce-only ' if o['reduce_only'] else ''}{'Buy' if o['is_buy'] else 'Sell'} {o['sz']}" for o in orders)
+            + f" around mid {mid}")
+        if self.dry_run:
+            for order in orders:
+                limit, _ = self.depth_limit(coin, order["is_buy"])
+                sizes = split_sizes(order["sz"], min(math.ceil(order["sz"] / limit) if limit else 1, MAX_CHILDREN),
+                                    self.metas.sz_decimals(coin, 2), mid)
+                self.log(f"[DRY RUN] TWAP job {job.id} {coin}: {len(sizes)} child order(s) of {sizes[0]} every {self.interval:.0f}s")
+            return job
+        with self.lock:
+            self.jobs[coin] = job
+        self.pool.submit(self._run, job)
+        return job
+
+    def shutdown(self):
+        """停止后续子单（已发出的不撤），等待任务线程退出"""
+        self.stopped.set()
+        self.pool.shutdown(wait=True)
+
+    # --- 执行 ---
+    def _run(self, job):
+        try:
+            for leg in job.legs:
+                if self.stopped.is_set():
+                    break
+                if "leverage" in leg:
+                    result = self.exchange.update_leverage(leg["leverage"], job.coin, leg["is_cross"])
+                    if result.get("status") != "ok":
+                        self.log(f"TWAP job {job.id} {job.coin}: leverage update failed, stopping: {result}")
+                        break
+                    continue
+                report = self._slice(job, leg)
+                job.reports.append(report)
+                self.reports.append(report)
+                self.log(f"TWAP job {job.id} {job.coin}: {'Buy' if report.is_buy else 'Sell'} {report.filled}/{report.sz} "
+                         f"in {report.children} child order(s) over {report.seconds:.0f}s, avg px {report.avg_px} vs arrival mid "
+                         f"{report.arrival_mid} ({report.slippage_bps:+.2f} bps)" + (f", stopped: {report.error}" if report.error else ""))
+                if report.error and leg["reduce_only"]:
+                    # 减仓未完成时不继续开仓（反向开仓需要先平掉原仓位）
+                    break
+        except Exception as e:
+            self.log(f"TWAP job {job.id} {job.coin} failed: {e}")
+        finally:
+            with self.lock:
+                self.jobs.pop(job.coin, None)
+
+    def _slice(self, job, order):
+        coin, is_buy, sz_decimals = job.coin, order["is_buy"], self.metas.sz_decimals(job.coin, 2)
+        remaining = order["sz"]
+        filled = notional = 0.0
+        children = 0
+        error = None
+        started = time.monotonic()
+        planned = None
+        while remaining > 0 and not self.stopped.is_set():
+            limit, mid = self.depth_limit(coin, is_buy)
+            if self.mode == "time":
+                if planned is None:
+                    planned = split_sizes(remaining, min(math.ceil(remaining / limit) if limit else 1, MAX_CHILDREN), sz_decimals, mid)
+                child = planned.pop(0) if planned else remaining
+            else:
+                child = meta_cache.floor_size(min(remaining, limit), sz_decimals)
+                # 尾数不足最小金额、或已到子单上限时，本笔补足剩余数量
+                if (remaining - child) * mid < MIN_NOTIONAL or children + 1 >= MAX_CHILDREN:
+                    child = remaining
+                child = max(child, min(remaining, math.ceil(MIN_NOTIONAL / mid * 10 ** sz_decimals) / 10 ** sz_decimals))
+            child = round(child, sz_decimals)
+            sz, px, error = self._child(coin, is_buy, child, order["reduce_only"], mid)
+            children += 1
+            if error:
+                break
+            filled += sz
+            notional += sz * px
+            remaining = round(remaining - sz, sz_decimals)
+            if remaining > 0:
+                self.stopped.wait(self.interval)
+        avg_px = notional / filled if filled else None
+        slippage_bps = (avg_px - job.arrival_mid) / job.arrival_mid * 1e4 * (1 if is_buy else -1) if avg_px and job.arrival_mid else 0.0
+        return SliceReport(job.id, coin, is_buy, order["sz"], round(filled, sz_decimals), avg_px, job.arrival_mid, slippage_bps,
+                           children, time.monotonic() - started, error)
+
+    def _child(self, coin, is_buy, sz, reduce_only, mid):
+        """发出一笔 IOC 子单，返回 (成交数量, 均价, 错误)"""
+        limit_px = order_batch.slippage_price(self.exchange, coin, is_buy, SLIPPAGE, mid)
+        response = self.exchange.bulk_orders([{"coin": coin, "is_buy": is_buy, "sz": sz, "limit_px": limit_px,
+                                               "order_type": {"limit": {"tif": "Ioc"}}, "reduce_only": reduce_only}])
+        if not isinstance(response, dict) or response.get("status") != "ok":
+            return 0.0, 0.0, str(response)
+        status = response["response"]["data"]["statuses"][0]
+        if "filled" not in status:
+            return 0.0, 0.0, status.get("error", str(status))
+        return float(status["filled"]["totalSz"]), float(status["filled"]["avgPx"]), None
+
+    def summary(self):
+        reports = [r for r in self.reports if r.filled]
+        if not reports:
+            return "no TWAP jobs"
+        avg = sum(r.slippage_bps for r in reports) / len(reports)
+        return f"{len(reports)} TWAP order(s), {sum(r.children for r in reports)} child order(s), avg {avg:+.2f} bps vs arrival mid"